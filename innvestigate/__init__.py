@@ -1,9 +1,11 @@
 
 from . import analyzer
 from .analyzer import create_analyzer
+from .analyzer import create_analyzers
 from .analyzer import NotAnalyzeableModelException
 
 # Disable pyflaks warnings:
 assert analyzer
 assert create_analyzer
+assert create_analyzers
 assert NotAnalyzeableModelException
@@ -46,6 +46,10 @@ from .wrapper import WrapperBase
 from .wrapper import AugmentReduceBase
 from .wrapper import GaussianSmoother
 from .wrapper import PathIntegrator
+from .ensemble import AnalyzerEnsemble
+from .pool import AnalyzerPool
+from .instrumentation import ReverseHooks
+from .instrumentation import ReverseProfiler
 
 
 # Disable pyflaks warnings:
@@ -56,6 +60,10 @@ assert WrapperBase
 assert AugmentReduceBase
 assert GaussianSmoother
 assert PathIntegrator
+assert AnalyzerEnsemble
+assert AnalyzerPool
+assert ReverseHooks
+assert ReverseProfiler
 
 
 ###############################################################################
@@ -138,3 +146,27 @@ def create_analyzer(name, model, **kwargs):
             "No analyzer with the name '%s' could be found."
             " All possible names are: %s" % (name, list(analyzers.keys())))
     return analyzer_class(model, **kwargs)
+
+
+def create_analyzers(names, model, **kwargs):
+    """Instantiates the analyzers with the names 'names' as one ensemble
+
+    This convenience function creates the respective analyzers
+    and combines them in an :class:`AnalyzerEnsemble`, i.e.,
+    all analyses are computed with one forward pass.
+
+    :param names: List of analyzer names. An entry can also be a tuple
+      (name, kwargs) with additional parameters for this analyzer.
+    :param model: The model to analyze, passed to the analyzers' __init__.
+    :param kwargs: Additional parameters for all analyzers.
+    :return: An instance of :class:`AnalyzerEnsemble`.
+    :raise KeyError: If there is no analyzer with a passed name.
+    """
+    subanalyzers = []
+    for name in names:
+        analyzer_kwargs = dict(kwargs)
+        if isinstance(name, tuple):
+            name, tmp = name
+            analyzer_kwargs.update(tmp)
+        subanalyzers.append(create_analyzer(name, model, **analyzer_kwargs))
+    return AnalyzerEnsemble(subanalyzers)
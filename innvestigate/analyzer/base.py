@@ -1,7 +1,7 @@
 # Get Python six functionality:
 from __future__ import\
     absolute_import, print_function, division, unicode_literals
-from builtins import zip
+from builtins import range, zip
 import six
 
 ###############################################################################
@@ -12,12 +12,17 @@ import six
 import keras.backend as K
 import keras.layers
 import keras.models
+import keras.utils
+from keras.utils.data_utils import OrderedEnqueuer, GeneratorEnqueuer
 import numpy as np
 import warnings
 
 
+from . import cache
+from . import executor
 from .. import layers as ilayers
 from .. import utils as iutils
+from ..utils.keras import backend as iK
 from ..utils.keras import checks as kchecks
 from ..utils.keras import graph as kgraph
 
@@ -153,6 +158,126 @@ class AnalyzerBase(object):
         """
         raise NotImplementedError()
 
+    def analyze_async(self, X, **kwargs):
+        """
+        Same interface as :func:`analyze`, but the analysis is
+        run in a dedicated thread.
+
+        Requests that are queued within a short time window are
+        analyzed together in one batch. Use
+        :func:`start_analyze_executor` to configure the window.
+
+        :return: A :class:`concurrent.futures.Future` for the analysis,
+          can be awaited with :func:`asyncio.wrap_future`.
+        """
+        if getattr(self, "_analyze_executor", None) is None:
+            self.start_analyze_executor()
+        return self._analyze_executor.submit(X, **kwargs)
+
+    def start_analyze_executor(self, batch_window=0.005, max_batch_size=None):
+        """
+        Starts the thread that serves :func:`analyze_async`.
+        It uses the current graph and session.
+
+        :param batch_window: Seconds to wait for further requests
+          before a batch is analyzed.
+        :param max_batch_size: The maximal number of samples to
+          analyze in one batch.
+        """
+        self.stop_analyze_executor()
+        self._analyze_executor = executor.AnalyzeExecutor(
+            self, batch_window=batch_window, max_batch_size=max_batch_size)
+
+    def stop_analyze_executor(self, wait=True):
+        """
+        Stops the thread that serves :func:`analyze_async`
+        after all submitted requests are done.
+
+        :param wait: Wait until the thread stopped.
+        """
+        if getattr(self, "_analyze_executor", None) is not None:
+            self._analyze_executor.shutdown(wait=wait)
+            self._analyze_executor = None
+
+    def analyze_generator(self,
+                          generator,
+                          steps=None,
+                          max_queue_size=10,
+                          workers=1,
+                          use_multiprocessing=False,
+                          **kwargs):
+        """
+        Analyze the behavior of model on the batches of a generator.
+
+        The batches are prefetched by worker threads or processes
+        while the analysis runs, the analyses are yielded in order.
+
+        :param generator: A :class:`keras.utils.Sequence` or a generator
+          that returns the input as expected by :func:`analyze`.
+        :param steps: Number of batches to analyze. Only optional if
+          the generator is a :class:`keras.utils.Sequence`.
+        :param max_queue_size: Maximum number of prefetched batches.
+        :param workers: Number of workers. If 0 the batches are
+          fetched in the main thread.
+        :param use_multiprocessing: Use processes instead of threads.
+        :param kwargs: Passed to :func:`analyze`.
+        :return: A generator yielding the analysis for each batch.
+        """
+        is_sequence = isinstance(generator, keras.utils.Sequence)
+        if not is_sequence and use_multiprocessing and workers > 1:
+            warnings.warn(
+                UserWarning("Using a generator with `use_multiprocessing=True`"
+                            " and multiple workers may duplicate your data."
+                            " Please consider using the`keras.utils.Sequence"
+                            " class."))
+        if steps is None:
+            if is_sequence:
+                steps = len(generator)
+            else:
+                raise ValueError("`steps=None` is only valid for a generator"
+                                 " based on the `keras.utils.Sequence` class."
+                                 " Please specify `steps` or use the"
+                                 " `keras.utils.Sequence` class.")
+        # Arguments are checked above on call, not on the first batch.
+        return self._analyze_generator(generator, steps, max_queue_size,
+                                       workers, use_multiprocessing,
+                                       **kwargs)
+
+    def _analyze_generator(self, generator, steps, max_queue_size,
+                           workers, use_multiprocessing, **kwargs):
+        wait_time = 0.01
+        is_sequence = isinstance(generator, keras.utils.Sequence)
+        enqueuer = None
+
+        try:
+            if workers > 0:
+                if is_sequence:
+                    enqueuer = OrderedEnqueuer(
+                        generator,
+                        use_multiprocessing=use_multiprocessing)
+                else:
+                    enqueuer = GeneratorEnqueuer(
+                        generator,
+                        use_multiprocessing=use_multiprocessing,
+                        wait_time=wait_time)
+                enqueuer.start(workers=workers, max_queue_size=max_queue_size)
+                output_generator = enqueuer.get()
+            else:
+                if is_sequence:
+                    output_generator = iter(generator)
+                else:
+                    output_generator = generator
+
+            for _ in range(steps):
+                X = next(output_generator)
+                if isinstance(X, tuple):
+                    # Sequences return several input tensors as tuple.
+                    X = list(X)
+                yield self.analyze(X, **kwargs)
+        finally:
+            if enqueuer is not None:
+                enqueuer.stop()
+
     def _get_state(self):
         state = {
             "model_json": self._model.to_json(),
@@ -172,14 +297,15 @@ class AnalyzerBase(object):
         class_name = self.__class__.__name__
         return class_name, state
 
-    def save_npz(self, fname):
+    def save_npz(self, fname, **kwargs):
         """
         Save state of analyzer, can be passed to :func:`Analyzer.load_npz`
         to resemble the analyzer.
 
         :param fname: The file's name.
+        :param kwargs: Passed to :func:`save`.
         """
-        class_name, state = self.save()
+        class_name, state = self.save(**kwargs)
         np.savez(fname, **{"class_name": class_name,
                            "state": state})
 
@@ -208,8 +334,13 @@ class AnalyzerBase(object):
         import innvestigate.analyzer
         clazz = getattr(innvestigate.analyzer, class_name)
 
+        analyzer_model_state = state.pop("analyzer_model", None)
         kwargs = clazz._state_to_kwargs(state)
-        return clazz(**kwargs)
+        ret = clazz(**kwargs)
+        if analyzer_model_state is not None:
+            # Skip building the analyzer model.
+            ret._set_analyzer_model_state(analyzer_model_state)
+        return ret
 
     @staticmethod
     def load_npz(fname):
@@ -317,15 +448,38 @@ class AnalyzerNetworkBase(AnalyzerBase):
       Possible values are 'max_activation', 'index' for the neuron
       (expects indices at :func:`analyze` calls), 'all' take all neurons.
     :param allow_lambda_layers: Allow the model to contain lambda layers.
+    :param precision: If 'float16' or 'bfloat16', the model and the
+      analysis are computed in this precision, see
+      :func:`innvestigate.utils.keras.graph.cast_model`.
+      Divisions and running means still use float32.
+      The analysis is returned as K.floatx().
     """
 
+    # The attributes set by create_analyzer_model that are needed
+    # to analyze. They are shared via the build cache, see
+    # innvestigate.analyzer.cache. Extend it in subclasses.
+    _build_attributes = (
+        "_analysis_inputs",
+        "_prepared_model",
+        "_special_helper_layers",
+        "_n_data_input",
+        "_n_constant_input",
+        "_n_data_output",
+        "_n_debug_output",
+        "_analyzer_model",
+    )
+
     def __init__(self, model,
                  neuron_selection_mode="max_activation",
                  allow_lambda_layers=False,
+                 precision=None,
                  **kwargs):
         if neuron_selection_mode not in ["max_activation", "index", "all"]:
             raise ValueError("neuron_selection parameter is not valid.")
         self._neuron_selection_mode = neuron_selection_mode
+        if precision not in [None, "float16", "bfloat16"]:
+            raise ValueError("precision parameter is not valid.")
+        self._precision = precision
 
         self._allow_lambda_layers = allow_lambda_layers
         self._add_model_check(
@@ -337,6 +491,8 @@ class AnalyzerNetworkBase(AnalyzerBase):
         )
 
         self._special_helper_layers = []
+        # Set by wrappers, see :func:`_prepare_model`.
+        self._max_activation_group_size = None
 
         super(AnalyzerNetworkBase, self).__init__(model, **kwargs)
 
@@ -356,6 +512,10 @@ class AnalyzerNetworkBase(AnalyzerBase):
         Prepares the model to analyze before it gets actually analyzed.
 
         This class adds the code to select a specific output neuron.
+        If the attribute _max_activation_group_size is set to n,
+        the 'max_activation' mode selects for each group of n
+        consecutive samples the neuron with the max activation for the
+        group's first sample, e.g., for samples augmented by a wrapper.
         """
         neuron_selection_mode = self._neuron_selection_mode
         model_inputs = model.inputs
@@ -370,11 +530,26 @@ class AnalyzerNetworkBase(AnalyzerBase):
         if K.ndim(model_output[0]) > 2:
             model_output = keras.layers.Flatten()(model_output)
 
-        if neuron_selection_mode == "max_activation":
+        if(neuron_selection_mode == "max_activation" and
+           self._max_activation_group_size is None):
             l = ilayers.Max(name="iNNvestigate_max")
             model_output = l(model_output)
             self._special_helper_layers.append(l)
+        elif neuron_selection_mode == "max_activation":
+            n = self._max_activation_group_size
+            neuron_indexing = ilayers.ArgMax(axis=-1, keepdims=True)(
+                ilayers.Subsample(n)(model_output[0]))
+            neuron_indexing = ilayers.Repeat(n, axis=0)(neuron_indexing)
+            # The indexing tensor should not be analyzed.
+            stop_analysis_at_tensors.append(neuron_indexing)
+
+            l = ilayers.BatchGather(name="iNNvestigate_batch_gather")
+            model_output = l(model_output+[neuron_indexing])
+            self._special_helper_layers.append(l)
         elif neuron_selection_mode == "index":
+            # Expects one neuron index per sample, i.e., shape (n, 1).
+            # The sample index is added inside the graph, such that
+            # the selection can be split along the batch axis.
             neuron_indexing = keras.layers.Input(
                 batch_shape=[None, None], dtype=np.int32,
                 name='iNNvestigate_neuron_indexing')
@@ -384,7 +559,7 @@ class AnalyzerNetworkBase(AnalyzerBase):
             # The indexing tensor should not be analyzed.
             stop_analysis_at_tensors.append(neuron_indexing)
 
-            l = ilayers.GatherND(name="iNNvestigate_gather_nd")
+            l = ilayers.BatchGather(name="iNNvestigate_batch_gather")
             model_output = l(model_output+[neuron_indexing])
             self._special_helper_layers.append(l)
         elif neuron_selection_mode == "all":
@@ -400,15 +575,73 @@ class AnalyzerNetworkBase(AnalyzerBase):
         """
         Creates the analyze functionality. If not called beforehand
         it will be called by :func:`analyze`.
+
+        If the :data:`innvestigate.analyzer.cache.build_cache` is enabled
+        and contains an analyzer model for the same model and
+        configuration, it is reused instead.
         """
+        build_cache = cache.build_cache
+        if build_cache.maxsize > 0:
+            key = build_cache.get_key(self)
+            attributes = build_cache.get(key)
+            if attributes is not None:
+                self.__dict__.update(attributes)
+                return
+
+            self._create_analyzer_model()
+            attributes = {k: getattr(self, k) for k in self._build_attributes
+                          if hasattr(self, k)}
+            build_cache.put(key, self, attributes)
+        else:
+            self._create_analyzer_model()
+
+    def _get_prepared_model(self):
+        """
+        Returns the result of :func:`_prepare_model` for the model.
+
+        Analyzers of the same model with the same neuron selection mode
+        share the prepared model, if they do not change how it is prepared.
+        Thus its execution trace is only computed once,
+        see :func:`innvestigate.utils.keras.graph.get_model_cache`.
+        """
+        prepare_model = six.get_unbound_function(
+            AnalyzerNetworkBase._prepare_model)
+        if six.get_unbound_function(
+                self.__class__._prepare_model) is not prepare_model:
+            return self._prepare_model(self._model)
+
+        cache = kgraph.get_model_cache(self._model)
+        key = ("prepared_model", self._neuron_selection_mode,
+               self._max_activation_group_size)
+        if key not in cache:
+            n_helper_layers = len(self._special_helper_layers)
+            cache[key] = (self._prepare_model(self._model),
+                          self._special_helper_layers[n_helper_layers:])
+        else:
+            self._special_helper_layers = (self._special_helper_layers +
+                                           cache[key][1])
+        model, analysis_inputs, stop_analysis_at_tensors = cache[key][0]
+        return model, list(analysis_inputs), list(stop_analysis_at_tensors)
+
+    def _create_analyzer_model(self):
         model_inputs = self._model.inputs
-        tmp = self._prepare_model(self._model)
+        tmp = self._get_prepared_model()
         model, analysis_inputs, stop_analysis_at_tensors = tmp
         self._analysis_inputs = analysis_inputs
+
+        if self._precision is not None:
+            model = kgraph.cast_model(model, self._precision)
+        # Needs to be set before the analysis is created,
+        # e.g., AnalyzerEnsemble shares it with the subanalyzers.
         self._prepared_model = model
 
-        tmp = self._create_analysis(
-            model, stop_analysis_at_tensors=stop_analysis_at_tensors)
+        if self._precision is not None:
+            with iK.floatx_scope(self._precision):
+                tmp = self._create_analysis(
+                    model, stop_analysis_at_tensors=stop_analysis_at_tensors)
+        else:
+            tmp = self._create_analysis(
+                model, stop_analysis_at_tensors=stop_analysis_at_tensors)
         if isinstance(tmp, tuple):
             if len(tmp) == 3:
                 analysis_outputs, debug_outputs, constant_inputs = tmp
@@ -428,6 +661,11 @@ class AnalyzerNetworkBase(AnalyzerBase):
         debug_outputs = iutils.to_list(debug_outputs)
         constant_inputs = iutils.to_list(constant_inputs)
 
+        if self._precision is not None:
+            cast = ilayers.Cast(K.floatx())
+            analysis_outputs = [iutils.to_list(cast(x))[0]
+                                for x in analysis_outputs]
+
         self._n_data_input = len(model_inputs)
         self._n_constant_input = len(constant_inputs)
         self._n_data_output = len(analysis_outputs)
@@ -435,6 +673,7 @@ class AnalyzerNetworkBase(AnalyzerBase):
         self._analyzer_model = keras.models.Model(
             inputs=model_inputs+analysis_inputs+constant_inputs,
             outputs=analysis_outputs+debug_outputs)
+        self._get_analyzer_function(self._analyzer_model)
 
     def _create_analysis(self, model, stop_analysis_at_tensors=[]):
         """
@@ -462,17 +701,254 @@ class AnalyzerNetworkBase(AnalyzerBase):
     def _handle_debug_output(self, debug_values):
         raise NotImplementedError()
 
-    def analyze(self, X, neuron_selection=None):
+    def _create_multi_target_analyzer_model(self, model, return_layers=()):
+        """
+        Wraps the analyzer model such that it expects k neuron indices
+        per sample, i.e., shape (n, k), and returns analyses of shape
+        (n, k, ...).
+
+        Each sample is repeated k times inside the graph and the
+        analyses for all targets are computed in one session run.
+        This saves the k separate calls and the repetition of the
+        input on the host, but the whole analysis including the
+        forward pass is computed for the n*k samples.
+
+        :param return_layers: See :func:`_create_layer_analysis_model`.
+        """
+        if len(return_layers) > 0:
+            model = self._get_derived_analyzer_model(
+                model, ("return_layers", return_layers),
+                lambda m: self._create_layer_analysis_model(
+                    m, return_layers))
+
+        n_data_input = self._n_data_input
+        inputs = model.inputs[:n_data_input]
+        constant_inputs = model.inputs[n_data_input+1:]
+        neuron_indexing = keras.layers.Input(
+            batch_shape=[None, None], dtype=np.int32,
+            name='iNNvestigate_multi_target_neuron_indexing')
+
+        repeat = ilayers.BatchRepeat()
+        repeated_inputs = [repeat([x, neuron_indexing]) for x in inputs]
+        flat_indexing = ilayers.Reshape((-1, 1))(neuron_indexing)
+
+        outputs = iutils.to_list(model(repeated_inputs +
+                                       [flat_indexing] +
+                                       constant_inputs))
+        n_data_output = len(outputs)-self._n_debug_output
+        reshape = ilayers.BatchReshape()
+        analysis_outputs = [reshape([x, neuron_indexing])
+                            for x in outputs[:n_data_output]]
+        debug_outputs = outputs[n_data_output:]
+
+        return keras.models.Model(
+            inputs=inputs+[neuron_indexing]+constant_inputs,
+            outputs=analysis_outputs+debug_outputs)
+
+    def _get_analyzer_function(self, model):
+        """
+        Returns a backend function that computes the outputs of model.
+
+        The function is compiled once per model and avoids the
+        input standardization and checks of :func:`predict_on_batch`.
+        """
+        if not hasattr(self, "_analyzer_functions"):
+            self._analyzer_functions = {}
+
+        # Compile lazily, wrappers might replace the analyzer model.
+        cached = self._analyzer_functions.get(id(model), None)
+        if cached is None or cached[0] is not model:
+            # Constant inputs are not fed.
+            inputs = list(model._feed_inputs)
+            use_learning_phase = (model.uses_learning_phase and
+                                  not isinstance(K.learning_phase(), int))
+            if use_learning_phase:
+                inputs.append(K.learning_phase())
+            function = K.function(inputs, model.outputs,
+                                  updates=model.state_updates)
+            cached = (model, function, use_learning_phase)
+            self._analyzer_functions[id(model)] = cached
+        return cached[1:]
+
+    def _create_layer_analysis_model(self, model, layer_names):
+        """
+        Replaces the analysis outputs of the analyzer model by the
+        tensors of the analysis at the given layers. They are
+        postprocessed and cast like the analysis at the inputs.
+        """
+        n_data_output = len(model.outputs)-self._n_debug_output
+        outputs = self._select_layer_tensors(
+            getattr(self, "_analysis_layer_tensors", None), layer_names)
+        if self._precision is not None:
+            with iK.floatx_scope(self._precision):
+                outputs = iutils.to_list(self._postprocess_analysis(outputs))
+            cast = ilayers.Cast(K.floatx())
+            outputs = [iutils.to_list(cast(x))[0] for x in outputs]
+        else:
+            outputs = iutils.to_list(self._postprocess_analysis(outputs))
+        return keras.models.Model(
+            inputs=model.inputs,
+            outputs=outputs+model.outputs[n_data_output:])
+
+    def _select_layer_tensors(self, layer_tensors, layer_names):
+        if layer_tensors is None:
+            raise ValueError("This analyzer does not support "
+                             "the return_layers parameter.")
+        unknown = [x for x in layer_names if x not in layer_tensors]
+        if len(unknown) > 0:
+            raise ValueError("No analysis for the layers: %s" % unknown)
+        return [x for name in layer_names for x in layer_tensors[name]]
+
+    def _create_postprocessed_analyzer_model(self, model, postprocessing):
+        """
+        Appends the postprocessing steps to the analysis outputs
+        of the analyzer model.
+
+        :param postprocessing: A tuple of steps, each a tuple of
+          the step's name and its parameters.
+        """
+        n_data_output = len(model.outputs)-self._n_debug_output
+        outputs = model.outputs[:n_data_output]
+        for step in postprocessing:
+            outputs = self._apply_postprocessing_step(step, outputs)
+
+        return keras.models.Model(
+            inputs=model.inputs,
+            outputs=outputs+model.outputs[n_data_output:])
+
+    def _apply_postprocessing_step(self, step, X):
+        name, args = step[0], step[1:]
+        if name == "reduce":
+            axis, reduce_op = args
+            if reduce_op == "sum":
+                reduce_layer = ilayers.Sum(axis=axis)
+            elif reduce_op == "absmax":
+                reduce_layer = ilayers.AbsMax(axis=axis)
+            else:
+                raise NotImplementedError()
+            return [reduce_layer(x) for x in X]
+        elif name == "heatmap":
+            # Avoid importing matplotlib if not needed.
+            from ..utils import visualizations as ivis
+
+            project = ilayers.Project(output_range=(0, 255))
+            lookup = ilayers.ColormapLookup(ivis.get_cmap_lut(args[0]))
+            return [lookup(project(x)) for x in X]
+        elif name == "cast":
+            cast = ilayers.Cast(args[0])
+            return [cast(x) for x in X]
+        elif name == "top_k":
+            top_k = ilayers.TopK(*args)
+            return [y for x in X for y in iutils.to_list(top_k(x))]
+        else:
+            raise NotImplementedError()
+
+    def _get_derived_analyzer_model(self, model, key, create):
+        """
+        Returns create(model). The derived model is built lazily and
+        once per model and key, as wrappers might replace the
+        analyzer model.
+        """
+        if not hasattr(self, "_derived_analyzer_models"):
+            self._derived_analyzer_models = {}
+
+        cached = self._derived_analyzer_models.get((id(model), key), None)
+        if cached is None or cached[0] is not model:
+            cached = (model, create(model))
+            self._derived_analyzer_models[(id(model), key)] = cached
+        return cached[1]
+
+    def _analyze_on_batch(self, X, neuron_selection=None,
+                          multi_target=False, postprocessing=(),
+                          return_layers=()):
+        """
+        Runs the analyzer model on one batch and
+        returns the list of analysis outputs.
+        """
+        model = self._analyzer_model
+        if multi_target:
+            model = self._get_derived_analyzer_model(
+                model, ("multi_target", return_layers),
+                lambda m: self._create_multi_target_analyzer_model(
+                    m, return_layers))
+        elif len(return_layers) > 0:
+            model = self._get_derived_analyzer_model(
+                model, ("return_layers", return_layers),
+                lambda m: self._create_layer_analysis_model(
+                    m, return_layers))
+        if neuron_selection is not None:
+            X = X+[neuron_selection]
+        if len(postprocessing) > 0:
+            model = self._get_derived_analyzer_model(
+                model, postprocessing,
+                lambda m: self._create_postprocessed_analyzer_model(
+                    m, postprocessing))
+
+        function, use_learning_phase = self._get_analyzer_function(model)
+        if use_learning_phase:
+            # Test phase.
+            X = X+[0]
+        ret = iutils.to_list(function(X))
+
+        if self._n_debug_output > 0:
+            self._handle_debug_output(ret[-self._n_debug_output:])
+            ret = ret[:-self._n_debug_output]
+        return ret
+
+    def analyze(self, X, neuron_selection=None, batch_size=None,
+                reduce_axis=None, reduce_op="sum", output_dtype=None,
+                heatmap=None, top_k=None, return_sparse=False,
+                return_layers=None):
         """
         Same interface as :class:`Analyzer` besides
 
         :param neuron_selection: If neuron_selection_mode is 'index' this
-          should be an integer with the index for the chosen neuron.
+          should be an integer with the index for the chosen neuron
+          or an array with one index per sample. An array of shape
+          (n_samples, k) selects k neurons per sample, the analysis
+          has then the shape (n_samples, k, ...). The k analyses are
+          computed in one batched run. Analyzers that revert the model
+          compute the forward pass once per sample and repeat its
+          activations for the reverse pass, others repeat each sample
+          k times.
+        :param batch_size: If given, the input is analyzed in chunks of
+          this size and the results are written into one preallocated
+          array. This bounds the peak memory independent of the input
+          size. Debug outputs are handled for each chunk.
+        :param reduce_axis: If given, the analysis is reduced along
+          this axis (or axes) inside the analyzer graph,
+          e.g., -1 for the color channels.
+        :param reduce_op: Operation to reduce the axis.
+          Either 'sum' or 'absmax'.
+        :param output_dtype: If given, the analysis is cast
+          to this dtype inside the analyzer graph, e.g., np.float16.
+        :param heatmap: If given, the name of a matplotlib color map.
+          The analysis is then reduced (by default along the last axis),
+          projected and mapped on the color map inside the analyzer
+          graph like :func:`innvestigate.utils.visualizations.heatmap`
+          does. The result is an uint8 RGB image with the colors
+          as last axis.
+        :param top_k: If given, only the top_k entries with the highest
+          magnitude are kept for each sample, the others are set to zero.
+          The selection is done inside the analyzer graph.
+        :param return_sparse: Together with top_k, return a tuple
+          (indices, values) for each analysis instead of a dense array.
+          Both have the shape (n_samples, top_k), the indices refer
+          to the flattened sample and are ordered by decreasing
+          magnitude of the values.
+        :param return_layers: A list of layer names. If given, a dict
+          with the analysis at the output of each of these layers is
+          returned instead of the analysis at the input. Only the
+          requested tensors are computed and fetched. If a layer is
+          applied several times, a list with one analysis per
+          application is returned.
+          Only supported by analyzers that revert the model.
         """
         if not hasattr(self, "_analyzer_model"):
             self.create_analyzer_model()
 
         X = iutils.to_list(X)
+        n_samples = len(X[0])
 
         if(neuron_selection is not None and
            self._neuron_selection_mode != "index"):
@@ -482,43 +958,159 @@ class AnalyzerNetworkBase(AnalyzerBase):
            self._neuron_selection_mode == "index"):
             raise ValueError("neuron_selection_mode 'index' expects "
                              "the neuron_selection parameter.")
-
-        if self._neuron_selection_mode == "index":
-            neuron_selection = np.asarray(neuron_selection).flatten()
-            if neuron_selection.size == 1:
-                neuron_selection = np.repeat(neuron_selection, len(X[0]))
-
-            # Add first axis indices for gather_nd
-            neuron_selection = np.hstack(
-                (np.arange(len(neuron_selection)).reshape((-1, 1)),
-                 neuron_selection.reshape((-1, 1)))
-            )
-            ret = self._analyzer_model.predict_on_batch(X+[neuron_selection])
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size needs to be a positive integer.")
+        if reduce_op not in ["sum", "absmax"]:
+            raise ValueError("reduce_op should be either 'sum' or 'absmax'.")
+        if top_k is not None and heatmap is not None:
+            raise ValueError("top_k cannot be combined with heatmap.")
+        if return_sparse and top_k is None:
+            raise ValueError("return_sparse requires top_k.")
+
+        postprocessing = []
+        if heatmap is not None and reduce_axis is None:
+            reduce_axis = -1
+        if reduce_axis is not None:
+            if isinstance(reduce_axis, list):
+                reduce_axis = tuple(reduce_axis)
+            postprocessing.append(("reduce", reduce_axis, reduce_op))
+        if heatmap is not None:
+            postprocessing.append(("heatmap", heatmap))
+        if output_dtype is not None:
+            postprocessing.append(("cast", np.dtype(output_dtype).name))
+        if top_k is not None:
+            postprocessing.append(("top_k", int(top_k), bool(return_sparse)))
+        postprocessing = tuple(postprocessing)
+        if return_layers is not None:
+            return_layers = tuple(iutils.to_list(return_layers))
         else:
-            ret = self._analyzer_model.predict_on_batch(X)
+            return_layers = ()
 
-        if self._n_debug_output > 0:
-            self._handle_debug_output(ret[-self._n_debug_output:])
-            ret = ret[:-self._n_debug_output]
+        multi_target = False
+        if self._neuron_selection_mode == "index":
+            neuron_selection = np.asarray(neuron_selection)
+            if neuron_selection.ndim == 2:
+                multi_target = True
+                if neuron_selection.shape[0] == 1:
+                    neuron_selection = np.repeat(neuron_selection,
+                                                 n_samples, axis=0)
+            elif neuron_selection.ndim < 2:
+                neuron_selection = neuron_selection.flatten()
+                if neuron_selection.size == 1:
+                    neuron_selection = np.repeat(neuron_selection, n_samples)
+                neuron_selection = neuron_selection.reshape((-1, 1))
+            else:
+                raise ValueError("neuron_selection should be an integer,"
+                                 " or an array of shape (n_samples,)"
+                                 " or (n_samples, k).")
 
+        if batch_size is None or batch_size >= n_samples:
+            ret = self._analyze_on_batch(X, neuron_selection, multi_target,
+                                         postprocessing, return_layers)
+        else:
+            ret = None
+            for start in range(0, n_samples, batch_size):
+                end = min(start+batch_size, n_samples)
+                X_batch = [x[start:end] for x in X]
+                if neuron_selection is not None:
+                    batch_ret = self._analyze_on_batch(
+                        X_batch, neuron_selection[start:end], multi_target,
+                        postprocessing, return_layers)
+                else:
+                    batch_ret = self._analyze_on_batch(
+                        X_batch, postprocessing=postprocessing,
+                        return_layers=return_layers)
+
+                if ret is None:
+                    ret = [np.empty((n_samples,)+x.shape[1:], dtype=x.dtype)
+                           for x in batch_ret]
+                for r, x in zip(ret, batch_ret):
+                    r[start:end] = x
+
+        if return_sparse:
+            ret = [(ret[i], ret[i+1]) for i in range(0, len(ret), 2)]
+        if len(return_layers) > 0:
+            tmp, ret, start = ret, {}, 0
+            for name in return_layers:
+                n = len(self._analysis_layer_tensors[name])
+                ret[name] = tmp[start] if n == 1 else tmp[start:start+n]
+                start += n
+            return ret
         if isinstance(ret, list) and len(ret) == 1:
             ret = ret[0]
         return ret
 
+    def save(self, include_analyzer_model=False):
+        """
+        Same interface as :class:`AnalyzerBase` besides
+
+        :param include_analyzer_model: Also store the built analyzer model
+          as frozen graph. The loaded analyzer then does not
+          need to create the analysis again.
+        """
+        class_name, state = super(AnalyzerNetworkBase, self).save()
+        if include_analyzer_model:
+            if not hasattr(self, "_analyzer_model"):
+                self.create_analyzer_model()
+            state["analyzer_model"] = self._get_analyzer_model_state()
+        return class_name, state
+
+    def _get_analyzer_model_state(self):
+        if self._n_debug_output > 0:
+            raise Exception("Analyzer models with debug output "
+                            "cannot be saved.")
+
+        model = self._analyzer_model
+        # Constant inputs get frozen into the graph.
+        inputs = model.inputs[:self._n_data_input+len(self._analysis_inputs)]
+        state = {
+            "graph_def": iK.freeze_graph(model.outputs),
+            "input_names": [x.name for x in inputs],
+            "input_shapes": [K.int_shape(x) for x in inputs],
+            "input_dtypes": [K.dtype(x) for x in inputs],
+            "output_names": [x.name for x in model.outputs],
+            "output_shapes": [K.int_shape(x) for x in model.outputs],
+            "n_data_input": self._n_data_input,
+        }
+        return state
+
+    def _set_analyzer_model_state(self, state):
+        n_data_input = state["n_data_input"]
+        inputs = [keras.layers.Input(batch_shape=shape, dtype=dtype)
+                  for shape, dtype in zip(state["input_shapes"],
+                                          state["input_dtypes"])]
+        import_graph = ilayers.ImportGraph(state["graph_def"],
+                                           state["input_names"],
+                                           state["output_names"],
+                                           state["output_shapes"],
+                                           name="iNNvestigate_import_graph")
+        outputs = iutils.to_list(import_graph(inputs))
+
+        self._analysis_inputs = inputs[n_data_input:]
+        self._n_data_input = n_data_input
+        self._n_constant_input = 0
+        self._n_data_output = len(outputs)
+        self._n_debug_output = 0
+        self._analyzer_model = keras.models.Model(inputs=inputs,
+                                                  outputs=outputs)
+
     def _get_state(self):
         state = super(AnalyzerNetworkBase, self)._get_state()
         state.update({"neuron_selection_mode": self._neuron_selection_mode})
         state.update({"allow_lambda_layers": self._allow_lambda_layers})
+        state.update({"precision": self._precision})
         return state
 
     @classmethod
     def _state_to_kwargs(clazz, state):
         neuron_selection_mode = state.pop("neuron_selection_mode")
         allow_lambda_layers = state.pop("allow_lambda_layers")
+        precision = state.pop("precision")
         kwargs = super(AnalyzerNetworkBase, clazz)._state_to_kwargs(state)
         kwargs.update({
             "neuron_selection_mode": neuron_selection_mode,
-            "allow_lambda_layers": allow_lambda_layers
+            "allow_lambda_layers": allow_lambda_layers,
+            "precision": precision,
         })
         return kwargs
 
@@ -565,11 +1157,42 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
       reverse network are finite.
     :param reverse_keep_tensors: Keeps the tensors created in the
       backward pass and stores them in the attribute
-      :attr:`_reversed_tensors`.
+      :attr:`_reversed_tensors`. To get the analysis only at
+      some layers use the parameter return_layers of :func:`analyze`.
     :param reverse_reapply_on_copied_layers: See
       :func:`innvestigate.utils.keras.graph.reverse_model`.
+    :param reverse_stop_at_layers: A list of layer names. If given,
+      the model is only reverted down to the outputs of these layers
+      and the analysis at the layers' outputs is returned instead of
+      the analysis at the model inputs. The layers below are not
+      part of the analyzer graph.
+    :param reverse_hooks: An instance of
+      :class:`innvestigate.analyzer.instrumentation.ReverseHooks`.
+      It receives per layer timings while the model is reverted
+      and per tensor statistics whenever :func:`analyze` is called.
+      The hooks are not part of the analyzer's saved state.
+    :param reverse_fold_batch_normalization: Fold batch normalization
+      layers into the preceding Dense or convolutional layers before the
+      model is reverted, see
+      :func:`innvestigate.utils.keras.graph.fold_batch_normalization`.
+      Folded batch normalization layers are not reverted separately.
+      Their names can still be used for the parameters
+      reverse_stop_at_layers and return_layers and refer to the outputs
+      of the layers they were merged into.
     """
 
+    _build_attributes = AnalyzerNetworkBase._build_attributes + (
+        "_analysis_layer_tensors",
+        "_debug_tensors_indices",
+        "_reverse_tensors_mapping",
+        "_reverse_tensors_layer_names",
+    )
+
+    # Subclasses that use the forward tensors outside of the reverse
+    # mappings, e.g., to multiply the analysis with the input, need to
+    # set this to False, see :func:`_create_multi_target_analyzer_model`.
+    _multi_target_shares_forward_pass = True
+
     def __init__(self,
                  model,
                  reverse_verbose=False,
@@ -579,6 +1202,9 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
                  reverse_check_finite=False,
                  reverse_keep_tensors=False,
                  reverse_reapply_on_copied_layers=False,
+                 reverse_stop_at_layers=None,
+                 reverse_hooks=None,
+                 reverse_fold_batch_normalization=False,
                  **kwargs):
         self._reverse_verbose = reverse_verbose
         self._reverse_clip_values = reverse_clip_values
@@ -589,11 +1215,51 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
         self._reverse_keep_tensors = reverse_keep_tensors
         self._reverse_reapply_on_copied_layers = (
             reverse_reapply_on_copied_layers)
+        if reverse_stop_at_layers is not None:
+            reverse_stop_at_layers = iutils.to_list(reverse_stop_at_layers)
+        self._reverse_stop_at_layers = reverse_stop_at_layers
+        self._reverse_hooks = reverse_hooks
+        self._reverse_fold_batch_normalization = (
+            reverse_fold_batch_normalization)
+        self._folded_layer_names = {}
         super(ReverseAnalyzerBase, self).__init__(model, **kwargs)
 
+    def _get_prepared_model(self):
+        tmp = super(ReverseAnalyzerBase, self)._get_prepared_model()
+        model, analysis_inputs, stop_analysis_at_tensors = tmp
+        self._folded_layer_names = {}
+        if self._reverse_fold_batch_normalization:
+            model, self._folded_layer_names = kgraph.fold_batch_normalization(
+                model, return_layer_names=True)
+        return model, analysis_inputs, stop_analysis_at_tensors
+
     def _gradient_reverse_mapping(self, Xs, Ys, reversed_Ys, reverse_state):
         mask = [x not in reverse_state["stop_mapping_at_tensors"] for x in Xs]
-        return ilayers.GradientWRT(len(Xs), mask=mask)(Xs+Ys+reversed_Ys)
+        layer = reverse_state["layer"]
+        if all(mask):
+            grad = kgraph.get_gradient_wrt_layer(layer, len(Xs))
+        else:
+            grad = ilayers.GradientWRT(len(Xs), mask=mask)
+
+        if(all(mask) and len(Xs) == 1 and
+           hasattr(Ys[0], "_iNNvestigate_repeated") and
+           ilayers.ExplicitGradientWRT.is_supported(layer,
+                                                    ignore_activation=True)):
+            # The model is reverted on repeated tensors, see
+            # kgraph.reverse_model. Reuse the forward pass instead of
+            # computing the layer again, only an activation is
+            # differentiated on the repeated tensors.
+            Zs = kgraph.get_pre_activation_tensors(layer, Ys)
+            if Zs is not None:
+                linear_activations = [None, keras.activations.get("linear")]
+                activation = getattr(layer, "activation", None)
+                if activation not in linear_activations:
+                    tmp = keras.layers.Activation(activation)(Zs[0])
+                    reversed_Ys = iutils.to_list(ilayers.GradientWRT(1)(
+                        Zs+[tmp]+reversed_Ys))
+                grad = ilayers.ExplicitGradientWRT(layer)
+                Ys = Zs
+        return grad(Xs+Ys+reversed_Ys)
 
     def _reverse_mapping(self, layer):
         """
@@ -682,12 +1348,43 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
         return X
 
     def _postprocess_analysis(self, X):
+        """
+        Maps the reverted tensors of the model inputs on the analysis.
+        It is also applied to the analysis at the layers
+        requested with the parameter return_layers of :func:`analyze`.
+        """
         return X
 
+    def _get_reverse_target_tensors(self, model):
+        """
+        Returns the output tensors of the layers at which
+        the reversal should stop or None.
+        """
+        if self._reverse_stop_at_layers is None:
+            return None
+
+        # Only consider the nodes that are part of the model's execution,
+        # a layer might be applied outside the model as well.
+        _, execution_list, _ = kgraph.trace_model_execution(model)
+        ret = []
+        for name in self._reverse_stop_at_layers:
+            # Folded layers are computed by other layers.
+            layers = [model.get_layer(x)
+                      for x in self._folded_layer_names.get(name, [name])]
+            tmp = [y for l, _, Ys in execution_list if l in layers
+                   for y in iutils.to_list(Ys)]
+            if len(tmp) == 0:
+                raise ValueError("The layer %s is not executed by the "
+                                 "analyzed model." % name)
+            ret += tmp
+        return ret
+
     def _reverse_model(self,
                        model,
                        stop_analysis_at_tensors=[],
-                       return_all_reversed_tensors=False):
+                       return_all_reversed_tensors=False,
+                       repeat_reference=None,
+                       repeat_substitutes=None):
         return kgraph.reverse_model(
             model,
             reverse_mappings=self._reverse_mapping,
@@ -697,32 +1394,51 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
             verbose=self._reverse_verbose,
             clip_all_reversed_tensors=self._reverse_clip_values,
             project_bottleneck_tensors=self._reverse_project_bottleneck_layers,
-            return_all_reversed_tensors=return_all_reversed_tensors)
+            return_all_reversed_tensors=return_all_reversed_tensors,
+            target_tensors=self._get_reverse_target_tensors(model),
+            hooks=self._reverse_hooks,
+            repeat_reference=repeat_reference,
+            repeat_substitutes=repeat_substitutes)
+
+    def create_analyzer_model(self):
+        if self._reverse_hooks is not None:
+            # Do not use the build cache, the hooks should
+            # observe the reversal.
+            self._create_analyzer_model()
+        else:
+            super(ReverseAnalyzerBase, self).create_analyzer_model()
 
     def _create_analysis(self, model, stop_analysis_at_tensors=[]):
         return_all_reversed_tensors = (
             self._reverse_check_min_max_values or
             self._reverse_check_finite or
-            self._reverse_keep_tensors
+            self._reverse_keep_tensors or
+            self._reverse_hooks is not None
         )
         ret = self._reverse_model(
             model,
             stop_analysis_at_tensors=stop_analysis_at_tensors,
-            return_all_reversed_tensors=return_all_reversed_tensors)
+            return_all_reversed_tensors=True)
+        # Allows to select the analysis at single layers
+        # without adding all reversed tensors as outputs.
+        self._analysis_layer_tensors = self._get_analysis_layer_tensors(
+            ret[1])
 
         if return_all_reversed_tensors:
             ret = (self._postprocess_analysis(ret[0]), ret[1])
         else:
-            ret = self._postprocess_analysis(ret)
+            ret = self._postprocess_analysis(ret[0])
 
         if return_all_reversed_tensors:
             debug_tensors = []
             self._debug_tensors_indices = {}
 
-            values = list(six.itervalues(ret[1]))
-            mapping = {i: v["id"] for i, v in enumerate(values)}
-            tensors = [v["final_tensor"] for v in values]
+            items = list(six.iteritems(ret[1]))
+            mapping = {i: v["id"] for i, (_, v) in enumerate(items)}
+            tensors = [v["final_tensor"] for _, v in items]
             self._reverse_tensors_mapping = mapping
+            self._reverse_tensors_layer_names = [
+                k._keras_history[0].name for k, _ in items]
 
             if self._reverse_check_min_max_values:
                 tmp = [ilayers.Min(None)(x) for x in tensors]
@@ -750,9 +1466,101 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
                     len(debug_tensors)+len(tensors))
                 debug_tensors += tensors
 
+            if self._reverse_hooks is not None:
+                tmp = ([ilayers.Min(None)(x) for x in tensors] +
+                       [ilayers.Max(None)(x) for x in tensors] +
+                       [ilayers.Mean(None)(ilayers.Abs()(x))
+                        for x in tensors] +
+                       iutils.to_list(ilayers.FiniteCheck()(tensors)))
+                self._debug_tensors_indices["hooks"] = (
+                    len(debug_tensors),
+                    len(debug_tensors)+len(tmp))
+                debug_tensors += tmp
+
             ret = (ret[0], debug_tensors)
         return ret
 
+    def _get_analysis_layer_tensors(self, reversed_tensors):
+        """
+        Maps the layer names on the reversed tensors of the layers'
+        outputs, ordered by the node id. The names of folded layers
+        are mapped on the tensors of the layers they were merged into.
+        """
+        ret = {}
+        for tensor, v in sorted(six.iteritems(reversed_tensors),
+                                key=lambda x: x[1]["id"]):
+            if "final_tensor" not in v:
+                continue
+            layer = tensor._keras_history[0]
+            ret.setdefault(layer.name, []).append(v["final_tensor"])
+        for name, layer_names in six.iteritems(self._folded_layer_names):
+            tmp = [x for k in layer_names for x in ret.get(k, [])]
+            if len(tmp) > 0:
+                ret[name] = tmp
+        return ret
+
+    def _create_multi_target_analyzer_model(self, model, return_layers=()):
+        """
+        Reverts the prepared model on its forward tensors repeated
+        for the k targets, see parameter repeat_reference of
+        :func:`innvestigate.utils.keras.graph.reverse_model`.
+        I.e., the forward pass is computed once for the n samples and
+        only the reverse pass for the n*k analyses. Layers are only
+        computed again on the repeated tensors if their reverse mappings
+        differentiate them and cannot reuse the forward pass.
+
+        Falls back to repeating the samples, see
+        :func:`AnalyzerNetworkBase._create_multi_target_analyzer_model`,
+        if the analyzer overrides :func:`_reverse_model`, has constant
+        inputs or debug outputs, was restored without the prepared
+        model, or sets :attr:`_multi_target_shares_forward_pass`
+        to False.
+        """
+        reverse_model = six.get_unbound_function(
+            ReverseAnalyzerBase._reverse_model)
+        if(not self._multi_target_shares_forward_pass or
+           self._n_constant_input > 0 or
+           self._n_debug_output > 0 or
+           getattr(self, "_prepared_model", None) is None or
+           six.get_unbound_function(
+               self.__class__._reverse_model) is not reverse_model):
+            return super(ReverseAnalyzerBase,
+                         self)._create_multi_target_analyzer_model(
+                             model, return_layers)
+
+        neuron_indexing = keras.layers.Input(
+            batch_shape=[None, None], dtype=np.int32,
+            name='iNNvestigate_multi_target_neuron_indexing')
+        flat_indexing = ilayers.Reshape((-1, 1))(neuron_indexing)
+
+        def create_analysis():
+            tmp = self._reverse_model(
+                self._prepared_model,
+                stop_analysis_at_tensors=list(self._analysis_inputs),
+                return_all_reversed_tensors=True,
+                repeat_reference=neuron_indexing,
+                # Each repetition selects its own neuron.
+                repeat_substitutes={self._analysis_inputs[0]: flat_indexing})
+            if len(return_layers) > 0:
+                outputs = self._select_layer_tensors(
+                    self._get_analysis_layer_tensors(tmp[1]), return_layers)
+            else:
+                outputs = tmp[0]
+            return iutils.to_list(self._postprocess_analysis(outputs))
+
+        if self._precision is not None:
+            with iK.floatx_scope(self._precision):
+                outputs = create_analysis()
+            cast = ilayers.Cast(K.floatx())
+            outputs = [iutils.to_list(cast(x))[0] for x in outputs]
+        else:
+            outputs = create_analysis()
+
+        reshape = ilayers.BatchReshape()
+        return keras.models.Model(
+            inputs=self._model.inputs+[neuron_indexing],
+            outputs=[reshape([x, neuron_indexing]) for x in outputs])
+
     def _handle_debug_output(self, debug_values):
 
         if self._reverse_check_min_max_values:
@@ -788,6 +1596,20 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
                           for i, v in enumerate(tmp)])
             self._reversed_tensors = tmp
 
+        if self._reverse_hooks is not None:
+            indices = self._debug_tensors_indices["hooks"]
+            tmp = np.asarray(debug_values[indices[0]:indices[1]])
+            tmp = tmp.reshape((4, -1))
+            self._reverse_hooks.on_analyze({
+                "ids": [self._reverse_tensors_mapping[i]
+                        for i in range(tmp.shape[1])],
+                "layers": self._reverse_tensors_layer_names,
+                "min": tmp[0],
+                "max": tmp[1],
+                "abs_mean": tmp[2],
+                "not_finite": tmp[3],
+            })
+
     def _get_state(self):
         state = super(ReverseAnalyzerBase, self)._get_state()
         state.update({"reverse_verbose": self._reverse_verbose})
@@ -800,6 +1622,10 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
         state.update({"reverse_keep_tensors": self._reverse_keep_tensors})
         state.update({"reverse_reapply_on_copied_layers":
                       self._reverse_reapply_on_copied_layers})
+        state.update({"reverse_stop_at_layers":
+                      self._reverse_stop_at_layers})
+        state.update({"reverse_fold_batch_normalization":
+                      self._reverse_fold_batch_normalization})
         return state
 
     @classmethod
@@ -814,6 +1640,9 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
         reverse_keep_tensors = state.pop("reverse_keep_tensors")
         reverse_reapply_on_copied_layers = (
             state.pop("reverse_reapply_on_copied_layers"))
+        reverse_stop_at_layers = state.pop("reverse_stop_at_layers")
+        reverse_fold_batch_normalization = (
+            state.pop("reverse_fold_batch_normalization"))
         kwargs = super(ReverseAnalyzerBase, clazz)._state_to_kwargs(state)
         kwargs.update({"reverse_verbose": reverse_verbose,
                        "reverse_clip_values": reverse_clip_values,
@@ -824,5 +1653,8 @@ class ReverseAnalyzerBase(AnalyzerNetworkBase):
                        "reverse_check_finite": reverse_check_finite,
                        "reverse_keep_tensors": reverse_keep_tensors,
                        "reverse_reapply_on_copied_layers":
-                       reverse_reapply_on_copied_layers})
+                       reverse_reapply_on_copied_layers,
+                       "reverse_stop_at_layers": reverse_stop_at_layers,
+                       "reverse_fold_batch_normalization":
+                       reverse_fold_batch_normalization})
         return kwargs
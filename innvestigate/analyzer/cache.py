@@ -0,0 +1,185 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+import six
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import collections
+import hashlib
+import numpy as np
+
+
+from ..utils.keras import backend as iK
+
+
+__all__ = [
+    "get_model_fingerprint",
+    "AnalyzerModelCache",
+    "build_cache",
+]
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+def _update_hash(hasher, obj):
+    """Feeds a (nested) state object into hasher."""
+    if isinstance(obj, np.ndarray):
+        hasher.update(str((obj.shape, obj.dtype.str)).encode("utf-8"))
+        hasher.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        hasher.update(b"dict")
+        for k in sorted(obj.keys(), key=repr):
+            _update_hash(hasher, k)
+            _update_hash(hasher, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(("%s%i" % (type(obj).__name__, len(obj)))
+                      .encode("utf-8"))
+        for x in obj:
+            _update_hash(hasher, x)
+    elif isinstance(obj, six.text_type):
+        hasher.update(obj.encode("utf-8"))
+    elif isinstance(obj, six.binary_type):
+        hasher.update(obj)
+    else:
+        # Callables are identified by their address,
+        # i.e., equal functions/lambdas might not give a cache hit.
+        hasher.update(repr(obj).encode("utf-8"))
+
+
+def _fingerprint(obj):
+    hasher = hashlib.sha1()
+    _update_hash(hasher, obj)
+    return hasher.hexdigest()
+
+
+def get_model_fingerprint(model, model_json=None, model_weights=None):
+    """Fingerprint of a model's architecture and weights.
+
+    :param model: A Keras model.
+    :param model_json: The model's JSON, if already at hand.
+    :param model_weights: The model's weights, if already at hand.
+    """
+    if model_json is None:
+        model_json = model.to_json()
+    if model_weights is None:
+        model_weights = model.get_weights()
+    return _fingerprint([model_json, model_weights])
+
+
+def _copy_containers(obj):
+    """Copies (nested) lists and dicts, but not the objects they contain."""
+    if isinstance(obj, dict):
+        return {k: _copy_containers(v) for k, v in six.iteritems(obj)}
+    elif isinstance(obj, list):
+        return [_copy_containers(x) for x in obj]
+    else:
+        return obj
+
+
+class AnalyzerModelCache(object):
+    """Process-wide cache for built analyzer models.
+
+    Building the analyzer model, i.e., tracing and reverting the model,
+    can take long for large networks. This cache stores the attributes
+    created by :func:`AnalyzerNetworkBase.create_analyzer_model`, i.e.,
+    the ones listed in the analyzer's :attr:`_build_attributes`, and
+    hands them to new analyzers with the same model and configuration.
+    Each analyzer gets its own copy of the lists and dicts among them,
+    the objects they contain, e.g., the analyzer model, are shared.
+
+    The key is the fingerprint of the model's JSON and weights,
+    the analyzer class and the analyzer's state without the weights.
+    The least recently used entry is evicted first.
+
+    .. note:: The cached analyzer model reads the weights of the model
+      it was built on. If these weights get changed in-place, invalidate
+      the cache with :func:`invalidate`.
+
+    :param maxsize: Maximum number of cached analyzer models.
+      If 0 the cache is disabled.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_key(self, analyzer):
+        """
+        Returns the cache key for an analyzer.
+
+        :param analyzer: An analyzer derived from :class:`AnalyzerNetworkBase`.
+        """
+        state = analyzer._get_state()
+        # Reuse the weights fetched for the state.
+        fingerprint = get_model_fingerprint(
+            analyzer._model,
+            model_json=state.pop("model_json", None),
+            model_weights=state.pop("model_weights", None))
+        return (fingerprint,
+                analyzer.__class__.__name__,
+                _fingerprint(state))
+
+    def get(self, key):
+        """
+        Returns the cached attributes for key or None.
+
+        Entries that were created in another graph,
+        e.g., before the Keras session was cleared, are dropped.
+        """
+        if key not in self._entries:
+            return None
+
+        entry = self._entries.pop(key)
+        if entry["graph"] is not iK.get_graph():
+            return None
+        # Mark as most recently used.
+        self._entries[key] = entry
+        return _copy_containers(entry["attributes"])
+
+    def put(self, key, analyzer, attributes):
+        """
+        Stores the attributes of analyzer for key and evicts the least
+        recently used entries if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+
+        self._entries.pop(key, None)
+        self._entries[key] = {
+            "graph": iK.get_graph(),
+            "model": analyzer._model,
+            "attributes": _copy_containers(attributes),
+        }
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, model=None):
+        """
+        Removes cache entries.
+
+        :param model: If given only the entries built on this model
+          or a model with the same architecture and weights are removed,
+          otherwise all entries.
+        """
+        if model is None:
+            self._entries.clear()
+        else:
+            fingerprint = get_model_fingerprint(model)
+            for key, entry in list(self._entries.items()):
+                if key[0] == fingerprint or entry["model"] is model:
+                    del self._entries[key]
+
+
+# Disabled by default, e.g., set build_cache.maxsize = 16 to enable it.
+build_cache = AnalyzerModelCache(maxsize=0)
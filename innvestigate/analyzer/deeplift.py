@@ -131,12 +131,6 @@ class DeepLIFT(base.ReverseAnalyzerBase):
         self._add_model_softmax_check()
         super(DeepLIFT, self).__init__(model, *args, **kwargs)
 
-    def _prepare_model(self, model):
-        ret = super(DeepLIFT, self)._prepare_model(model)
-        # Store analysis input to create reference inputs.
-        self._analysis_inputs = ret[1]
-        return ret
-
     def _create_reference_activations(self, model):
         self._model_execution_trace = kgraph.trace_model_execution(model)
         layers, execution_list, outputs = self._model_execution_trace
@@ -236,7 +230,9 @@ class DeepLIFT(base.ReverseAnalyzerBase):
             clip_all_reversed_tensors=self._reverse_clip_values,
             project_bottleneck_tensors=self._reverse_project_bottleneck_layers,
             return_all_reversed_tensors=return_all_reversed_tensors,
-            execution_trace=self._model_execution_trace)
+            execution_trace=self._model_execution_trace,
+            target_tensors=self._get_reverse_target_tensors(model),
+            hooks=self._reverse_hooks)
 
     def _get_state(self):
         state = super(DeepLIFT, self)._get_state()
@@ -329,7 +325,7 @@ class DeepLIFTWrapper(base.AnalyzerNetworkBase):
                           input_references_list=self._references,
                           progress_update=1000000)
 
-    def analyze(self, X, neuron_selection=None):
+    def analyze(self, X, neuron_selection=None, batch_size=None):
         if not hasattr(self, "_deep_lift_func"):
             self._create_deep_lift_func()
 
@@ -351,7 +347,9 @@ class DeepLIFTWrapper(base.AnalyzerNetworkBase):
                 raise ValueError("One neuron can be selected with DeepLIFT.")
 
             neuron_idx = neuron_selection[0]
-            analysis = self._analyze_with_deeplift(X, neuron_idx, len(X[0]))
+            if batch_size is None:
+                batch_size = len(X[0])
+            analysis = self._analyze_with_deeplift(X, neuron_idx, batch_size)
 
             # Parse the output.
             ret = []
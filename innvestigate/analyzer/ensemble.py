@@ -0,0 +1,167 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+import six
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+from . import base
+from .. import utils as iutils
+
+
+__all__ = ["AnalyzerEnsemble"]
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+class AnalyzerEnsemble(base.AnalyzerNetworkBase):
+    """Computes the analyses of several analyzers in one pass.
+
+    The analysis graphs of all subanalyzers are created on the same
+    prepared model and combined into one Keras model. Thus the forward
+    pass is shared and computed only once per :func:`analyze` call.
+
+    >>> ensemble = AnalyzerEnsemble([Gradient(model), LRPZ(model)])
+    >>> gradient_analysis, lrp_analysis = ensemble.analyze(X)
+
+    :param subanalyzers: A list of analyzers derived from
+      :class:`AnalyzerNetworkBase`. All need to analyze the same model
+      with the same neuron selection mode and precision.
+    """
+
+    _build_attributes = base.AnalyzerNetworkBase._build_attributes + (
+        "_n_subanalyzer_outputs",
+    )
+
+    def __init__(self, subanalyzers, **kwargs):
+        subanalyzers = list(subanalyzers)
+        if len(subanalyzers) == 0:
+            raise ValueError("At least one subanalyzer is required.")
+
+        prepare_model = six.get_unbound_function(
+            base.AnalyzerNetworkBase._prepare_model)
+        for subanalyzer in subanalyzers:
+            if not isinstance(subanalyzer, base.AnalyzerNetworkBase):
+                raise ValueError("Keras-based subanalyzers are required.")
+            if subanalyzer._model is not subanalyzers[0]._model:
+                raise ValueError("All subanalyzers need to analyze "
+                                 "the same model.")
+            if (subanalyzer._neuron_selection_mode !=
+                    subanalyzers[0]._neuron_selection_mode):
+                raise ValueError("All subanalyzers need to use "
+                                 "the same neuron selection mode.")
+            if subanalyzer._precision != subanalyzers[0]._precision:
+                raise ValueError("All subanalyzers need to use "
+                                 "the same precision.")
+            # The subanalyzers share one prepared model.
+            if six.get_unbound_function(
+                    subanalyzer.__class__._prepare_model) is not prepare_model:
+                raise ValueError("Subanalyzers that prepare the model on "
+                                 "their own are not supported: %s" %
+                                 subanalyzer.__class__.__name__)
+        self._subanalyzers = subanalyzers
+
+        # The subanalyzers already checked the model.
+        kwargs.setdefault("allow_lambda_layers", any(
+            x._allow_lambda_layers for x in subanalyzers))
+        kwargs.setdefault("precision", subanalyzers[0]._precision)
+        super(AnalyzerEnsemble, self).__init__(
+            subanalyzers[0]._model,
+            neuron_selection_mode=subanalyzers[0]._neuron_selection_mode,
+            **kwargs)
+
+    def _create_analysis(self, model, stop_analysis_at_tensors=[]):
+        analysis_outputs, constant_inputs = [], []
+        self._n_subanalyzer_outputs = []
+
+        for subanalyzer in self._subanalyzers:
+            # Reuse the prepared model and its helper layers.
+            subanalyzer._analysis_inputs = self._analysis_inputs
+            subanalyzer._prepared_model = self._prepared_model
+            subanalyzer._special_helper_layers = self._special_helper_layers
+
+            tmp = subanalyzer._create_analysis(
+                model, stop_analysis_at_tensors=stop_analysis_at_tensors)
+            if isinstance(tmp, tuple):
+                if len(tmp) == 3:
+                    outputs, debug_outputs, constants = tmp
+                elif len(tmp) == 2:
+                    outputs, debug_outputs = tmp
+                    constants = list()
+                elif len(tmp) == 1:
+                    outputs = tmp[0]
+                    constants, debug_outputs = list(), list()
+                else:
+                    raise Exception("Unexpected output from _create_analysis.")
+            else:
+                outputs = tmp
+                constants, debug_outputs = list(), list()
+
+            if len(iutils.to_list(debug_outputs)) > 0:
+                raise Exception("No debug output at subanalyzer is supported.")
+
+            outputs = iutils.to_list(outputs)
+            analysis_outputs += outputs
+            constant_inputs += iutils.to_list(constants)
+            self._n_subanalyzer_outputs.append(len(outputs))
+
+        return analysis_outputs, list(), constant_inputs
+
+    def analyze(self, X, *args, **kwargs):
+        """
+        Same interface as :class:`AnalyzerNetworkBase` besides that
+        a list with the analysis of each subanalyzer is returned.
+        """
+        tmp = iutils.to_list(
+            super(AnalyzerEnsemble, self).analyze(X, *args, **kwargs))
+
+        ret, start = [], 0
+        for n in self._n_subanalyzer_outputs:
+            analysis = tmp[start:start+n]
+            ret.append(analysis[0] if len(analysis) == 1 else analysis)
+            start += n
+        return ret
+
+    def _get_analyzer_model_state(self):
+        state = super(AnalyzerEnsemble, self)._get_analyzer_model_state()
+        state.update({"n_subanalyzer_outputs": self._n_subanalyzer_outputs})
+        return state
+
+    def _set_analyzer_model_state(self, state):
+        state = dict(state)
+        self._n_subanalyzer_outputs = state.pop("n_subanalyzer_outputs")
+        super(AnalyzerEnsemble, self)._set_analyzer_model_state(state)
+
+    def _get_state(self):
+        state = {
+            "subanalyzers": [x.save() for x in self._subanalyzers],
+            "allow_lambda_layers": self._allow_lambda_layers,
+            "disable_model_checks": self._disable_model_checks,
+            "precision": self._precision,
+        }
+        return state
+
+    @classmethod
+    def _state_to_kwargs(clazz, state):
+        subanalyzers = [base.AnalyzerBase.load(class_name, sa_state)
+                        for class_name, sa_state in state.pop("subanalyzers")]
+        allow_lambda_layers = state.pop("allow_lambda_layers")
+        disable_model_checks = state.pop("disable_model_checks")
+        precision = state.pop("precision")
+        assert len(state) == 0
+
+        # Each subanalyzer recreated its own model, share the first one.
+        for subanalyzer in subanalyzers[1:]:
+            subanalyzer._model = subanalyzers[0]._model
+
+        return {"subanalyzers": subanalyzers,
+                "allow_lambda_layers": allow_lambda_layers,
+                "disable_model_checks": disable_model_checks,
+                "precision": precision}
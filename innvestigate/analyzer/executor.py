@@ -0,0 +1,244 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+from builtins import zip
+import six
+from six.moves import queue
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import concurrent.futures
+import numpy as np
+import threading
+import time
+
+
+from .. import utils as iutils
+from ..utils.keras import backend as iK
+
+
+__all__ = ["AnalyzeExecutor"]
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+def _split(x, sections):
+    """
+    Splits (nested lists, tuples or dicts of) arrays along the batch axis.
+    """
+    if isinstance(x, (list, tuple)):
+        return [type(x)(y) for y in zip(*[_split(y, sections) for y in x])]
+    elif isinstance(x, dict):
+        keys = list(x.keys())
+        return [dict(zip(keys, y))
+                for y in zip(*[_split(x[k], sections) for k in keys])]
+    else:
+        return np.split(x, sections)
+
+
+def _get_neuron_selection(kwargs, n_samples):
+    """
+    Returns the neuron selection of a request broadcast to its samples,
+    i.e., with shape (n_samples,) or (n_samples, k), or None.
+    """
+    if "neuron_selection" not in kwargs:
+        return None
+
+    ret = np.asarray(kwargs["neuron_selection"])
+    if ret.ndim < 2:
+        ret = ret.flatten()
+        if ret.size == 1:
+            ret = np.repeat(ret, n_samples)
+    elif ret.ndim == 2 and ret.shape[0] == 1:
+        ret = np.repeat(ret, n_samples, axis=0)
+    return ret
+
+
+def _set_exception(requests, e):
+    """Sets the exception on all requests' futures that are not done."""
+    for request in requests:
+        if not request[2].done():
+            request[2].set_exception(e)
+
+
+def _equal_kwargs(a, b):
+    """Compares two kwargs dicts, which might contain arrays."""
+    if set(a.keys()) != set(b.keys()):
+        return False
+    for k in a:
+        if isinstance(a[k], np.ndarray) or isinstance(b[k], np.ndarray):
+            if not np.array_equal(a[k], b[k]):
+                return False
+        elif a[k] != b[k]:
+            return False
+    return True
+
+
+class AnalyzeExecutor(object):
+    """Runs the analyze calls of an analyzer in a dedicated thread.
+
+    The thread uses the graph and session that are the defaults when the
+    executor is created. Requests that are submitted while the thread
+    is busy or within batch_window seconds are analyzed
+    together in one batch.
+
+    >>> executor = AnalyzeExecutor(analyzer, batch_window=0.01)
+    >>> future = executor.submit(X)
+    >>> analysis = future.result()
+    >>> # Or with asyncio:
+    >>> analysis = await asyncio.wrap_future(executor.submit(X))
+
+    :param analyzer: The analyzer to run.
+    :param batch_window: Seconds to wait for further requests
+      before a batch is analyzed.
+    :param max_batch_size: The maximal number of samples in one batch.
+      Requests are not split, i.e., if None or a single request is
+      larger, all are analyzed at once.
+    """
+
+    def __init__(self, analyzer, batch_window=0.005, max_batch_size=None):
+        self._analyzer = analyzer
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size
+
+        self._queue = queue.Queue()
+        self._session_scope = iK.get_session_scope()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, X, **kwargs):
+        """
+        Schedules an analyze call.
+
+        :param X: Input as expected by the analyzer.
+        :param kwargs: Passed to the analyzer's :func:`analyze`.
+        :return: A :class:`concurrent.futures.Future` for the analysis.
+        """
+        if self._thread is None:
+            raise RuntimeError("Cannot submit after shutdown.")
+
+        future = concurrent.futures.Future()
+        self._queue.put((iutils.to_list(X), kwargs, future))
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stops the executor after all submitted requests are done.
+
+        :param wait: Wait until the thread stopped.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            if wait:
+                self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        with self._session_scope:
+            stop = False
+            while not stop:
+                request = self._queue.get()
+                if request is None:
+                    break
+
+                requests = [request]
+                # Errors of a batch are passed on to its futures,
+                # the thread keeps serving the following requests.
+                try:
+                    stop = self._collect_requests(requests)
+                    self._analyze_requests(requests)
+                except Exception as e:
+                    _set_exception(requests, e)
+
+    def _collect_requests(self, requests):
+        """
+        Appends the requests that arrive within the batch window.
+
+        :return: Whether the executor was shut down meanwhile.
+        """
+        n_samples = len(requests[0][0][0])
+        deadline = time.time()+self._batch_window
+        while(self._max_batch_size is None or
+              n_samples < self._max_batch_size):
+            try:
+                timeout = max(deadline-time.time(), 0)
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return True
+            requests.append(request)
+            n_samples += len(request[0][0])
+        return False
+
+    def _analyze_requests(self, requests):
+        requests = [x for x in requests
+                    if x[2].set_running_or_notify_cancel()]
+        # Only compatible requests can be joined,
+        # the others are analyzed in separate batches.
+        while len(requests) > 0:
+            batch, rest = [requests[0]], []
+            for x in requests[1:]:
+                if self._can_join(requests[0], x):
+                    batch.append(x)
+                else:
+                    rest.append(x)
+            self._analyze_batch(batch)
+            requests = rest
+
+    def _get_batch_kwargs(self, kwargs):
+        return {k: v for k, v in six.iteritems(kwargs)
+                if k != "neuron_selection"}
+
+    def _can_join(self, a, b):
+        """
+        Requests can be analyzed in one batch if they have the same
+        parameters besides the neuron selection and their neuron
+        selections can be concatenated along the samples.
+        """
+        if not _equal_kwargs(self._get_batch_kwargs(a[1]),
+                             self._get_batch_kwargs(b[1])):
+            return False
+
+        n_a, n_b = len(a[0][0]), len(b[0][0])
+        selection_a = _get_neuron_selection(a[1], n_a)
+        selection_b = _get_neuron_selection(b[1], n_b)
+        if selection_a is None or selection_b is None:
+            return selection_a is None and selection_b is None
+        # Selections that do not fit to the samples
+        # are passed on as they are and fail separately.
+        return (selection_a.ndim in [1, 2] and
+                len(selection_a) == n_a and len(selection_b) == n_b and
+                selection_a.shape[1:] == selection_b.shape[1:])
+
+    def _analyze_batch(self, requests):
+        try:
+            if len(requests) == 1:
+                X, kwargs, future = requests[0]
+                future.set_result(self._analyzer.analyze(X, **kwargs))
+                return
+
+            X = [np.concatenate(x) for x in zip(*[r[0] for r in requests])]
+            n_samples = [len(r[0][0]) for r in requests]
+            kwargs = self._get_batch_kwargs(requests[0][1])
+
+            if "neuron_selection" in requests[0][1]:
+                kwargs["neuron_selection"] = np.concatenate([
+                    _get_neuron_selection(r_kwargs, n)
+                    for (_, r_kwargs, _), n in zip(requests, n_samples)])
+
+            analysis = self._analyzer.analyze(X, **kwargs)
+            sections = np.cumsum(n_samples)[:-1]
+            for future, x in zip([r[2] for r in requests],
+                                 _split(analysis, sections)):
+                future.set_result(x)
+        except Exception as e:
+            _set_exception(requests, e)
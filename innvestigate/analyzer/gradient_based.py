@@ -148,6 +148,9 @@ class InputTimesGradient(Gradient):
     :param model: A Keras model.
     """
 
+    # The gradient is multiplied with the (not repeated) input.
+    _multi_target_shares_forward_pass = False
+
     def __init__(self, model, **kwargs):
 
         self._add_model_softmax_check()
@@ -0,0 +1,121 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+import six
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import collections
+
+
+__all__ = [
+    "ReverseHooks",
+    "ReverseProfiler",
+]
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+class ReverseHooks(object):
+    """Interface for instrumenting analyzers that revert the model.
+
+    Pass an instance to the parameter reverse_hooks of
+    :class:`innvestigate.analyzer.base.ReverseAnalyzerBase`.
+    The default implementation ignores all events.
+    """
+
+    def on_reverse_mapping_init(self, layer, duration, n_ops):
+        """
+        Called after the reverse mapping for a layer was initialized.
+
+        :param layer: The reverted layer.
+        :param duration: Time spent in seconds.
+        :param n_ops: Number of graph operations created or None
+          if the backend does not support to count them.
+        """
+        pass
+
+    def on_reverse_node(self, nid, layer, duration, n_ops):
+        """
+        Called after a node of the model was reverted,
+        i.e., the reverse mapping was applied.
+
+        :param nid: The node id as used by
+          :func:`innvestigate.utils.keras.graph.reverse_model`.
+        :param layer: The reverted layer.
+        :param duration: Time spent in seconds.
+        :param n_ops: Number of graph operations created or None
+          if the backend does not support to count them.
+        """
+        pass
+
+    def on_analyze(self, statistics):
+        """
+        Called for each analyzed batch with statistics of the tensors
+        in the reverted model.
+
+        :param statistics: A dict with the entries
+          'ids' (the (node id, tensor id) of each tensor),
+          'layers' (the name of the layer that created the forward tensor)
+          and the arrays 'min', 'max', 'abs_mean' and 'not_finite'
+          (the number of values that are not finite)
+          with one value per tensor.
+        """
+        pass
+
+
+class ReverseProfiler(ReverseHooks):
+    """Records all events and summarizes them per layer type.
+
+    >>> profiler = ReverseProfiler()
+    >>> analyzer = LRPZ(model, reverse_hooks=profiler)
+    >>> analyzer.analyze(X)
+    >>> for layer_type, duration, n_ops in profiler.get_build_summary():
+    >>>     print(layer_type, duration, n_ops)
+    """
+
+    def __init__(self):
+        self.mapping_init_events = []
+        self.node_events = []
+        self.analyze_statistics = []
+
+    def on_reverse_mapping_init(self, layer, duration, n_ops):
+        self.mapping_init_events.append({
+            "layer": layer.name,
+            "layer_type": layer.__class__.__name__,
+            "duration": duration,
+            "n_ops": n_ops,
+        })
+
+    def on_reverse_node(self, nid, layer, duration, n_ops):
+        self.node_events.append({
+            "nid": nid,
+            "layer": layer.name,
+            "layer_type": layer.__class__.__name__,
+            "duration": duration,
+            "n_ops": n_ops,
+        })
+
+    def on_analyze(self, statistics):
+        self.analyze_statistics.append(statistics)
+
+    def get_build_summary(self):
+        """
+        Returns a list of (layer type, duration, number of operations)
+        tuples, sorted by the time spent to revert layers of this type.
+        """
+        duration = collections.defaultdict(float)
+        n_ops = collections.defaultdict(int)
+        for event in self.mapping_init_events+self.node_events:
+            duration[event["layer_type"]] += event["duration"]
+            n_ops[event["layer_type"]] += event["n_ops"] or 0
+
+        return sorted([(k, v, n_ops[k]) for k, v in six.iteritems(duration)],
+                      key=lambda x: x[1], reverse=True)
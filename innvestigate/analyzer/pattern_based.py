@@ -102,7 +102,8 @@ class PatternNetReverseKernelLayer(kgraph.ReverseMappingBase):
 
         # Layers that apply the backward pass.
         grad_act = ilayers.GradientWRT(len(act_Xs))
-        grad_pattern = ilayers.GradientWRT(len(Xs))
+        grad_pattern = kgraph.get_gradient_wrt_layer(self._pattern_layer,
+                                                      len(Xs))
 
         # First step: propagate through the activation layer.
         # Workaround for linear activations.
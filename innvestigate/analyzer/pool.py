@@ -0,0 +1,237 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+from builtins import range, zip
+from six.moves import queue
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import keras.backend as K
+import multiprocessing
+import numpy as np
+
+
+from . import base
+from .. import utils as iutils
+
+
+__all__ = ["AnalyzerPool"]
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+def _shared_array_views(buffers, capacity, shapes, dtype):
+    return [np.frombuffer(b, dtype=dtype).reshape((capacity,)+shape)
+            for b, shape in zip(buffers, shapes)]
+
+
+def _format_error(e):
+    return "%s: %s" % (e.__class__.__name__, e)
+
+
+def _worker(class_name, state, capacity, shapes, dtype,
+            input_buffers, output_buffers, tasks, results):
+    inputs = _shared_array_views(input_buffers, capacity, shapes, dtype)
+    outputs = _shared_array_views(output_buffers, capacity, shapes, dtype)
+    try:
+        analyzer = base.AnalyzerBase.load(class_name, state)
+        load_error = None
+    except Exception as e:
+        # Report the error for each task, such that the parent
+        # does not wait for results.
+        load_error = "Loading the analyzer failed: %s" % _format_error(e)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if load_error is not None:
+            results.put(load_error)
+            continue
+
+        n, kwargs = task
+        try:
+            analysis = iutils.to_list(
+                analyzer.analyze([x[:n] for x in inputs], **kwargs))
+            if len(analysis) != len(outputs):
+                raise ValueError("Expected one analysis per model input.")
+            for out, x in zip(outputs, analysis):
+                out[:n] = x
+            results.put(None)
+        except Exception as e:
+            results.put(_format_error(e))
+
+
+class AnalyzerPool(object):
+    """Runs an analyzer in several worker processes.
+
+    Each worker rebuilds the analyzer from its :func:`save` state.
+    :func:`analyze` splits the input across the workers and gathers the
+    analyses in order. Inputs and analyses are passed through
+    shared memory buffers, only the neuron selection gets pickled.
+
+    Only analyzers that return one analysis of the same shape
+    for each model input are supported.
+
+    >>> with AnalyzerPool(analyzer, n_workers=8) as pool:
+    >>>     analysis = pool.analyze(X)
+
+    :param analyzer: The analyzer to run, needs to support :func:`save`.
+    :param n_workers: Number of worker processes, defaults
+      to the number of CPUs.
+    :param max_batch_size: Maximal number of samples a worker analyzes
+      at once. Determines the size of the shared memory buffers.
+    :param poll_interval: Seconds between the checks whether
+      a worker process, which is awaited, is still alive.
+    """
+
+    def __init__(self, analyzer, n_workers=None, max_batch_size=32,
+                 poll_interval=0.1):
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        if n_workers < 1 or max_batch_size < 1:
+            raise ValueError("n_workers and max_batch_size "
+                             "need to be positive integers.")
+
+        self._capacity = max_batch_size
+        self._poll_interval = poll_interval
+        self._shapes = [tuple(K.int_shape(x)[1:])
+                        for x in analyzer._model.inputs]
+        if any(None in shape for shape in self._shapes):
+            raise ValueError("The input shape for the model needs "
+                             "to be fully specified (except the batch axis).")
+        self._dtype = np.dtype(K.floatx())
+
+        # Workers should not inherit the TensorFlow state of this process.
+        if hasattr(multiprocessing, "get_context"):
+            context = multiprocessing.get_context("spawn")
+        else:
+            context = multiprocessing
+
+        class_name, state = analyzer.save()
+        typecode = self._dtype.char
+        self._workers = []
+        for _ in range(n_workers):
+            size = [self._capacity*int(np.prod(shape))
+                    for shape in self._shapes]
+            input_buffers = [context.RawArray(typecode, n) for n in size]
+            output_buffers = [context.RawArray(typecode, n) for n in size]
+            tasks, results = context.Queue(), context.Queue()
+
+            process = context.Process(
+                target=_worker,
+                args=(class_name, state, self._capacity, self._shapes,
+                      self._dtype, input_buffers, output_buffers,
+                      tasks, results))
+            process.daemon = True
+            process.start()
+
+            self._workers.append({
+                "process": process,
+                "inputs": _shared_array_views(
+                    input_buffers, self._capacity, self._shapes, self._dtype),
+                "outputs": _shared_array_views(
+                    output_buffers, self._capacity, self._shapes, self._dtype),
+                "tasks": tasks,
+                "results": results,
+            })
+
+    def _get_result(self, worker):
+        """
+        Waits for the result of a worker's task.
+
+        :return: None on success, otherwise the error message.
+        """
+        while True:
+            try:
+                return worker["results"].get(timeout=self._poll_interval)
+            except queue.Empty:
+                if not worker["process"].is_alive():
+                    break
+        # The result might have been sent just before the process ended.
+        try:
+            return worker["results"].get(timeout=self._poll_interval)
+        except queue.Empty:
+            return ("The worker process died (exit code %s)." %
+                    worker["process"].exitcode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def analyze(self, X, neuron_selection=None):
+        """
+        Same interface as :class:`AnalyzerNetworkBase`.
+
+        The neuron selection has to be an integer
+        or one index per sample.
+        """
+        if self._workers is None:
+            raise RuntimeError("The pool is closed.")
+
+        X = iutils.to_list(X)
+        n_samples = len(X[0])
+        if neuron_selection is not None:
+            neuron_selection = np.asarray(neuron_selection)
+            if neuron_selection.ndim > 1:
+                raise ValueError("Only one neuron index per sample "
+                                 "is supported.")
+            neuron_selection = neuron_selection.flatten()
+            if neuron_selection.size == 1:
+                neuron_selection = np.repeat(neuron_selection, n_samples)
+
+        ret = [np.empty((n_samples,)+shape, dtype=self._dtype)
+               for shape in self._shapes]
+        step = self._capacity*len(self._workers)
+        for start in range(0, n_samples, step):
+            end = min(start+step, n_samples)
+            # Split evenly across the workers.
+            bounds = np.linspace(start, end,
+                                 len(self._workers)+1).astype(np.int64)
+
+            jobs = []
+            for worker, a, b in zip(self._workers, bounds[:-1], bounds[1:]):
+                if a == b:
+                    continue
+                for buffer, x in zip(worker["inputs"], X):
+                    buffer[:b-a] = x[a:b]
+                kwargs = {}
+                if neuron_selection is not None:
+                    kwargs["neuron_selection"] = neuron_selection[a:b]
+                worker["tasks"].put((b-a, kwargs))
+                jobs.append((worker, a, b))
+
+            errors = []
+            # Wait for all jobs, such that no results are left
+            # in the queues if one failed.
+            for worker, a, b in jobs:
+                error = self._get_result(worker)
+                if error is not None:
+                    errors.append(error)
+                    continue
+                for r, buffer in zip(ret, worker["outputs"]):
+                    r[a:b] = buffer[:b-a]
+            if len(errors) > 0:
+                raise Exception("Analysis failed in worker: %s" % errors[0])
+
+        if len(ret) == 1:
+            ret = ret[0]
+        return ret
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._workers is not None:
+            for worker in self._workers:
+                worker["tasks"].put(None)
+            for worker in self._workers:
+                worker["process"].join()
+            self._workers = None
@@ -256,6 +256,7 @@ class AddReverseLayer(kgraph.ReverseMappingBase):
 
     def __init__(self, layer, state):
         ##print("in AddReverseLayer.init:", layer.__class__.__name__,"-> Dedicated ReverseLayer class" ) #debug
+        self._layer = layer
         self._layer_wo_act = kgraph.copy_layer_wo_activation(layer,
                                                              name_template="reversed_kernel_%s")
 
@@ -268,8 +269,10 @@ class AddReverseLayer(kgraph.ReverseMappingBase):
         # the gradient is 1 for each output-to-input connection, which corresponds to the "weights"
         # of the layer. It should thus be sufficient to reweight the relevances and and do a gradient_wrt
         grad = ilayers.GradientWRT(len(Xs))
-        # Get activations.
-        Zs = kutils.apply(self._layer_wo_act, Xs)
+        # Get activations, reuse the forward pass if possible.
+        Zs = kgraph.get_pre_activation_tensors(self._layer, Ys)
+        if Zs is None:
+            Zs = kutils.apply(self._layer_wo_act, Xs)
         # Divide incoming relevance by the activations.
         tmp = [ilayers.SafeDivide()([a, b])
                for a, b in zip(Rs, Zs)]
@@ -287,6 +290,7 @@ class AveragePoolingReverseLayer(kgraph.ReverseMappingBase):
 
     def __init__(self, layer, state):
         ##print("in AveragePoolingRerseLayer.init:", layer.__class__.__name__,"-> Dedicated ReverseLayer class" ) #debug
+        self._layer = layer
         self._layer_wo_act = kgraph.copy_layer_wo_activation(layer,
                                                              name_template="reversed_kernel_%s")
 
@@ -299,9 +303,12 @@ class AveragePoolingReverseLayer(kgraph.ReverseMappingBase):
         # the gradient is 1 for each output-to-input connection, which corresponds to the "weights"
         # of the layer. It should thus be sufficient to reweight the relevances and and do a gradient_wrt
 
-        grad = ilayers.GradientWRT(len(Xs))
-        # Get activations.
-        Zs = kutils.apply(self._layer_wo_act, Xs)
+        grad = kgraph.get_gradient_wrt_layer(self._layer_wo_act,
+                                             len(Xs))
+        # Get activations, reuse the forward pass if possible.
+        Zs = kgraph.get_pre_activation_tensors(self._layer, Ys)
+        if Zs is None:
+            Zs = kutils.apply(self._layer_wo_act, Xs)
         # Divide incoming relevance by the activations.
         tmp = [ilayers.SafeDivide()([a, b])
                for a, b in zip(Rs, Zs)]
@@ -325,11 +332,22 @@ class LRP(base.ReverseAnalyzerBase):
       gradient.
 
     :param input_layer_rule: either a Rule object, atuple of (low, high) the min/max pixel values of the inputs
+
+    :param freeze_weights: Rules that apply the layers with transformed
+      weights, e.g., only the positive ones, compute them once and store
+      them in variables instead of recomputing them for each analysis.
+      Call :func:`refresh_weights` after the model's weights changed.
     """
 
+    _build_attributes = base.ReverseAnalyzerBase._build_attributes + (
+        "_rule_objects",
+    )
+
     def __init__(self, model, *args, **kwargs):
         rule = kwargs.pop("rule", None)
         input_layer_rule = kwargs.pop("input_layer_rule", None)
+        self._freeze_weights = kwargs.pop("freeze_weights", False)
+        self._rule_objects = []
 
         self._add_model_softmax_check()
         self._add_model_check(
@@ -408,18 +426,49 @@ class LRP(base.ReverseAnalyzerBase):
                     rule_class = rule
                     break
         else:
-            ##print(str(rules[0]), '(via pop)') #debug
-            rule_class = self._rules.pop()
+            rule_class = self._get_rule_from_list(layer,
+                                                  reverse_state["model"])
 
         if rule_class is None:
             raise Exception("No rule applies to layer: %s" % layer)
 
         if isinstance(rule_class, six.string_types):
             rule_class = LRP_RULES[rule_class]
+        if self._freeze_weights:
+            reverse_state = dict(reverse_state, freeze_weights=True)
         rule = rule_class(layer, reverse_state)
+        self._rule_objects.append(rule)
 
         return rule.apply
 
+    def _get_rule_from_list(self, layer, model):
+        """
+        Returns the rule for layer if the rules are given as list.
+
+        The rules are assigned in the order of the model's layers,
+        starting with the last rule, independent of the order
+        in which the layers get reverted.
+        """
+        if getattr(self, "_rule_assignment", (None,))[0] is not model:
+            rules = list(self._rules)
+            assignment = {}
+            layers, _, _ = kgraph.trace_model_execution(model)
+            for l in layers:
+                if(len(rules) > 0 and
+                   self._reverse_mapping(l) == self.create_rule_mapping):
+                    assignment[l] = rules.pop()
+            self._rule_assignment = (model, assignment)
+        return self._rule_assignment[1].get(layer, None)
+
+    def refresh_weights(self):
+        """
+        Updates the weights frozen by the rules, i.e., needs to be called
+        when the model's weights changed and freeze_weights is True.
+        """
+        for rule in self._rule_objects:
+            if hasattr(rule, "refresh_weights"):
+                rule.refresh_weights()
+
     def _create_analysis(self, *args, **kwargs):
         ####################################################################
         ### Functionality responible for backwards rule selection below ####
@@ -485,15 +534,18 @@ class LRP(base.ReverseAnalyzerBase):
         state = super(LRP, self)._get_state()
         state.update({"rule": self._rule})
         state.update({"input_layer_rule": self._input_layer_rule})
+        state.update({"freeze_weights": self._freeze_weights})
         return state
 
     @classmethod
     def _state_to_kwargs(clazz, state):
         rule = state.pop("rule")
         input_layer_rule = state.pop("input_layer_rule")
+        freeze_weights = state.pop("freeze_weights")
         kwargs = super(LRP, clazz)._state_to_kwargs(state)
         kwargs.update({"rule": rule,
-                       "input_layer_rule": input_layer_rule})
+                       "input_layer_rule": input_layer_rule,
+                       "freeze_weights": freeze_weights})
         return kwargs
 
 
@@ -61,6 +61,73 @@ __all__ = [
 ]
 
 
+# Kernel layers for which AlphaBetaRule and BoundedRule
+# stack the differently weighted kernels into one layer.
+FUSED_KERNEL_LAYERS = (
+    keras.layers.Dense,
+    keras.layers.Conv1D,
+    keras.layers.Conv2D,
+    keras.layers.Conv3D,
+)
+
+
+def _get_input_channel_axis(layer):
+    if layer.get_config().get("data_format") == "channels_first":
+        return 1
+    else:
+        return -1
+
+
+def _safe_divide(a, b):
+    # Same as ilayers.SafeDivide, i.e., divide in float32
+    # if the inputs have a reduced precision.
+    dtype = K.dtype(a)
+    a, b = iK.to_accumulation_dtype(a), iK.to_accumulation_dtype(b)
+    ret = a / (b + K.cast(K.equal(b, 0), K.dtype(b)) * K.epsilon())
+    return iK.from_accumulation_dtype(ret, dtype)
+
+
+def _split_in_halves(x, axis):
+    # Returns the first and the second half along axis.
+    n = K.shape(x)[axis] // 2
+    index = [slice(None)] * K.ndim(x)
+    index[axis] = slice(None, n)
+    first = x[tuple(index)]
+    index[axis] = slice(n, None)
+    return first, x[tuple(index)]
+
+
+
+class _TransformedWeightsRule(kgraph.ReverseMappingBase):
+    """
+    Base class for rules that apply the layer with transformed weights.
+
+    If the state passed to the rule contains freeze_weights=True,
+    symbolic weight transformations are evaluated once and stored
+    in variables. Then :func:`refresh_weights` needs to be called
+    when the weights of the layer change.
+    """
+
+    def _freeze_weights(self, state, weights):
+        if(not state.get("freeze_weights", False) or
+           all(isinstance(x, np.ndarray) for x in weights)):
+            return weights
+
+        if not hasattr(self, "_frozen_weights"):
+            self._frozen_weights = []
+        variables = [K.variable(x) for x in K.batch_get_value(weights)]
+        self._frozen_weights += list(zip(variables, weights))
+        return variables
+
+    def refresh_weights(self):
+        """Recomputes the frozen weights from the layer's weights."""
+        frozen_weights = getattr(self, "_frozen_weights", [])
+        if len(frozen_weights) > 0:
+            variables, weights = zip(*frozen_weights)
+            K.batch_set_value(list(zip(variables,
+                                       K.batch_get_value(weights))))
+
+
 
 class ZRule(kgraph.ReverseMappingBase):
     """
@@ -69,15 +136,21 @@ class ZRule(kgraph.ReverseMappingBase):
     """
 
     def __init__(self, layer, state, bias=True):
+        self._layer = layer
+        self._bias = bias
         self._layer_wo_act = kgraph.copy_layer_wo_activation(layer,
                                                              keep_bias=bias,
                                                              name_template="reversed_kernel_%s")
 
     def apply(self, Xs, Ys, Rs, reverse_state):
-        grad = ilayers.GradientWRT(len(Xs))
-
-        # Get activations.
-        Zs = kutils.apply(self._layer_wo_act, Xs)
+        grad = kgraph.get_gradient_wrt_layer(self._layer_wo_act,
+                                             len(Xs))
+
+        # Get activations, reuse the forward pass if possible.
+        Zs = kgraph.get_pre_activation_tensors(self._layer, Ys,
+                                               keep_bias=self._bias)
+        if Zs is None:
+            Zs = kutils.apply(self._layer_wo_act, Xs)
         # Divide incoming relevance by the activations.
         tmp = [ilayers.SafeDivide()([a, b])
                for a, b in zip(Rs, Zs)]
@@ -112,20 +185,33 @@ class EpsilonRule(kgraph.ReverseMappingBase):
 
     def __init__(self, layer, state, epsilon = 1e-7, bias=True):
         self._epsilon = rutils.assert_lrp_epsilon_param(epsilon, self)
+        self._layer = layer
+        self._bias = bias
         self._layer_wo_act = kgraph.copy_layer_wo_activation(
             layer, keep_bias=bias, name_template="reversed_kernel_%s")
 
 
     def apply(self, Xs, Ys, Rs, reverse_state):
-        grad = ilayers.GradientWRT(len(Xs))
-        # The epsilon rule aligns epsilon with the (extended) sign: 0 is considered to be positive
-        prepare_div = keras.layers.Lambda(lambda x: x + (K.cast(K.greater_equal(x,0), K.floatx())*2-1)*self._epsilon)
-
-        # Get activations.
-        Zs = kutils.apply(self._layer_wo_act, Xs)
+        grad = kgraph.get_gradient_wrt_layer(self._layer_wo_act,
+                                             len(Xs))
+        def divide(inputs):
+            # Divide in float32 if the inputs have a reduced precision,
+            # otherwise epsilon might vanish.
+            r, z = inputs
+            dtype = K.dtype(r)
+            r, z = iK.to_accumulation_dtype(r), iK.to_accumulation_dtype(z)
+            # The epsilon rule aligns epsilon with the (extended) sign: 0 is considered to be positive
+            z = z + (K.cast(K.greater_equal(z, 0), K.dtype(z))*2-1)*self._epsilon
+            return iK.from_accumulation_dtype(r / z, dtype)
+
+        # Get activations, reuse the forward pass if possible.
+        Zs = kgraph.get_pre_activation_tensors(self._layer, Ys,
+                                               keep_bias=self._bias)
+        if Zs is None:
+            Zs = kutils.apply(self._layer_wo_act, Xs)
 
         # Divide incoming relevance by the activations.
-        tmp = [ilayers.Divide()([a, prepare_div(b)])
+        tmp = [keras.layers.Lambda(divide)([a, b])
                for a, b in zip(Rs, Zs)]
         # Propagate the relevance to input neurons
         # using the gradient.
@@ -145,7 +231,7 @@ class EpsilonIgnoreBiasRule(EpsilonRule):
 
 
 
-class WSquareRule(kgraph.ReverseMappingBase):
+class WSquareRule(_TransformedWeightsRule):
     """W**2 rule from Deep Taylor Decomposition"""
 
     def __init__(self, layer, state, copy_weights=False):
@@ -157,6 +243,7 @@ class WSquareRule(kgraph.ReverseMappingBase):
         if layer.use_bias:
             weights = weights[:-1]
         weights = [x**2 for x in weights]
+        weights = self._freeze_weights(state, weights)
 
         self._layer_wo_act_b = kgraph.copy_layer_wo_activation(
             layer,
@@ -166,7 +253,8 @@ class WSquareRule(kgraph.ReverseMappingBase):
 
 
     def apply(self, Xs, Ys, Rs, reverse_state):
-        grad = ilayers.GradientWRT(len(Xs))
+        grad = kgraph.get_gradient_wrt_layer(self._layer_wo_act_b,
+                                             len(Xs))
         # Create dummy forward path to take the derivative below.
         Ys = kutils.apply(self._layer_wo_act_b, Xs)
 
@@ -199,6 +287,7 @@ class FlatRule(WSquareRule):
             if layer.use_bias:
                 weights = weights[:-1]
             weights = [K.ones_like(x) for x in weights]
+        weights = self._freeze_weights(state, weights)
 
         self._layer_wo_act_b = kgraph.copy_layer_wo_activation(
             layer,
@@ -209,7 +298,7 @@ class FlatRule(WSquareRule):
 
 
 
-class AlphaBetaRule(kgraph.ReverseMappingBase):
+class AlphaBetaRule(_TransformedWeightsRule):
     """
     This decomposition rule handles the positive forward
     activations (x*w > 0) and negative forward activations
@@ -255,19 +344,82 @@ class AlphaBetaRule(kgraph.ReverseMappingBase):
             positive_weights = [x * iK.to_floatx(x > 0) for x in weights]
             negative_weights = [x * iK.to_floatx(x < 0) for x in weights]
 
-        self._layer_wo_act_positive = kgraph.copy_layer_wo_activation(
-            layer,
-            keep_bias=bias,
-            weights=positive_weights,
-            name_template="reversed_kernel_positive_%s")
-        self._layer_wo_act_negative = kgraph.copy_layer_wo_activation(
-            layer,
-            keep_bias=bias,
-            weights=negative_weights,
-            name_template="reversed_kernel_negative_%s")
+        self._layer_wo_act_activator = None
+        if type(layer) in FUSED_KERNEL_LAYERS and not beta:
+            # Only the activator term xpos*wpos + xneg*wneg is needed.
+            # Stack the positive and negative inputs along the input
+            # channels and the weights along the kernel's input axis,
+            # such that one application of the layer computes it.
+            config = layer.get_config()
+            config["name"] = "reversed_kernel_activator_%s" % config["name"]
+            config["activation"] = None
+            config["use_bias"] = bias and config["use_bias"]
+            self._channel_axis = _get_input_channel_axis(layer)
+            input_shape = list(layer.get_input_shape_at(0))
+            input_shape[self._channel_axis] *= 2
+
+            if copy_weights:
+                concatenate = np.concatenate
+            else:
+                concatenate = K.concatenate
+            # The positive and negative bias add up to the bias.
+            activator_weights = (
+                [concatenate([positive_weights[0], negative_weights[0]],
+                             axis=-2)] +
+                [a + b for a, b in zip(positive_weights[1:],
+                                       negative_weights[1:])])
+            activator_weights = self._freeze_weights(state,
+                                                     activator_weights)
+            self._layer_wo_act_stacked = None
+            self._layer_wo_act_activator = kgraph.get_layer_from_config(
+                layer, config, weights=activator_weights,
+                input_shapes=tuple(input_shape))
+        elif type(layer) in FUSED_KERNEL_LAYERS:
+            # Stack the positive and negative weights along the output
+            # channels, such that one application of the layer computes
+            # the contributions for both.
+            config = layer.get_config()
+            config["name"] = "reversed_kernel_stacked_%s" % config["name"]
+            config["activation"] = None
+            config["use_bias"] = bias and config["use_bias"]
+            if "units" in config:
+                config["units"] *= 2
+            else:
+                config["filters"] *= 2
+            self._channel_axis = _get_input_channel_axis(layer)
+
+            if copy_weights:
+                concatenate = np.concatenate
+            else:
+                concatenate = K.concatenate
+            stacked_weights = [concatenate([a, b], axis=-1)
+                               for a, b in zip(positive_weights,
+                                               negative_weights)]
+            stacked_weights = self._freeze_weights(state, stacked_weights)
+            self._layer_wo_act_stacked = kgraph.get_layer_from_config(
+                layer, config, weights=stacked_weights)
+        else:
+            self._layer_wo_act_stacked = None
+            positive_weights = self._freeze_weights(state, positive_weights)
+            negative_weights = self._freeze_weights(state, negative_weights)
+            self._layer_wo_act_positive = kgraph.copy_layer_wo_activation(
+                layer,
+                keep_bias=bias,
+                weights=positive_weights,
+                name_template="reversed_kernel_positive_%s")
+            self._layer_wo_act_negative = kgraph.copy_layer_wo_activation(
+                layer,
+                keep_bias=bias,
+                weights=negative_weights,
+                name_template="reversed_kernel_negative_%s")
 
 
     def apply(self, Xs, Ys, Rs, reverse_state):
+        if self._layer_wo_act_activator is not None:
+            return self._apply_fused_activator(Xs, Rs)
+        if self._layer_wo_act_stacked is not None:
+            return self._apply_fused(Xs, Rs)
+
         #this method is correct, but wasteful
         grad = ilayers.GradientWRT(len(Xs))
         times_alpha = keras.layers.Lambda(lambda x: x * self._alpha)
@@ -317,9 +469,93 @@ class AlphaBetaRule(kgraph.ReverseMappingBase):
         else:
             return activator_relevances
 
+    def _apply_fused(self, Xs, Rs):
+        # The positive and negative inputs are stacked along the batch axis,
+        # the layer's outputs for the positive and negative weights along
+        # the channel axis. I.e., with one forward and one backward pass
+        # we get all combinations of positive and negative parts.
+        axis = self._channel_axis
+        alpha, beta = self._alpha, self._beta
+
+        def forward(x):
+            x_pos = x * K.cast(K.greater(x, 0), K.floatx())
+            x_neg = x * K.cast(K.less(x, 0), K.floatx())
+            return K.concatenate([x_pos, x_neg], axis=0)
+
+        def backward_signal(inputs):
+            z, r = inputs
+            z_pos_x, z_neg_x = _split_in_halves(z, 0)
+            # Contributions of the positive and negative weights.
+            z_pos_x_pos_w, z_pos_x_neg_w = _split_in_halves(z_pos_x, axis)
+            z_neg_x_pos_w, z_neg_x_neg_w = _split_in_halves(z_neg_x, axis)
+
+            # xpos*wpos + xneg*wneg
+            activator = alpha * _safe_divide(
+                r, z_pos_x_pos_w + z_neg_x_neg_w)
+            if beta:
+                # xpos*wneg + xneg*wpos
+                inhibitor = -beta * _safe_divide(
+                    r, z_pos_x_neg_w + z_neg_x_pos_w)
+            else:
+                inhibitor = K.zeros_like(activator)
+
+            return K.concatenate(
+                [K.concatenate([activator, inhibitor], axis=axis),
+                 K.concatenate([inhibitor, activator], axis=axis)],
+                axis=0)
+
+        def combine(inputs):
+            x, grad = inputs
+            x_pos = x * K.cast(K.greater(x, 0), K.floatx())
+            x_neg = x * K.cast(K.less(x, 0), K.floatx())
+            grad_pos_x, grad_neg_x = _split_in_halves(grad, 0)
+            return x_pos * grad_pos_x + x_neg * grad_neg_x
+
+        ret = []
+        for X, R in zip(Xs, Rs):
+            X_stacked = keras.layers.Lambda(forward)(X)
+            Z_stacked = kutils.apply(self._layer_wo_act_stacked, [X_stacked])
+            signal = keras.layers.Lambda(backward_signal)(Z_stacked+[R])
+            grad = kgraph.get_gradient_wrt_layer(
+                self._layer_wo_act_stacked, 1)([X_stacked]+Z_stacked+[signal])
+            ret.append(keras.layers.Lambda(combine)([X]+iutils.to_list(grad)))
+        return ret
+
+    def _apply_fused_activator(self, Xs, Rs):
+        # The positive and negative inputs are stacked along the channel
+        # axis, i.e., with one forward and one backward pass we get the
+        # activator term and the gradients for both parts of the input.
+        axis = self._channel_axis
+        alpha = self._alpha
+
+        def forward(x):
+            x_pos = x * K.cast(K.greater(x, 0), K.floatx())
+            x_neg = x * K.cast(K.less(x, 0), K.floatx())
+            return K.concatenate([x_pos, x_neg], axis=axis)
+
+        def backward_signal(inputs):
+            z, r = inputs
+            return alpha * _safe_divide(r, z)
+
+        def combine(inputs):
+            x, grad = inputs
+            x_pos = x * K.cast(K.greater(x, 0), K.floatx())
+            x_neg = x * K.cast(K.less(x, 0), K.floatx())
+            grad_pos_x, grad_neg_x = _split_in_halves(grad, axis)
+            return x_pos * grad_pos_x + x_neg * grad_neg_x
+
+        ret = []
+        for X, R in zip(Xs, Rs):
+            X_stacked = keras.layers.Lambda(forward)(X)
+            Z = kutils.apply(self._layer_wo_act_activator, [X_stacked])
+            signal = keras.layers.Lambda(backward_signal)(Z+[R])
+            grad = kgraph.get_gradient_wrt_layer(
+                self._layer_wo_act_activator, 1)([X_stacked]+Z+[signal])
+            ret.append(keras.layers.Lambda(combine)([X]+iutils.to_list(grad)))
+        return ret
+
 
 
-        
 class AlphaBetaIgnoreBiasRule(AlphaBetaRule):
     """Same as AlphaBetaRule but ignores biases."""
     def __init__(self, *args, **kwargs):
@@ -370,7 +606,7 @@ class Alpha1Beta0IgnoreBiasRule(AlphaBetaRule):
 
 
 
-class BoundedRule(kgraph.ReverseMappingBase):
+class BoundedRule(_TransformedWeightsRule):
     """Z_B rule from the Deep Taylor Decomposition"""
     # TODO: this only works for relu networks, needs to be extended.
     # TODO: check
@@ -394,23 +630,46 @@ class BoundedRule(kgraph.ReverseMappingBase):
             positive_weights = [x * iK.to_floatx(x > 0) for x in weights]
             negative_weights = [x * iK.to_floatx(x < 0) for x in weights]
 
+        self._fused = (
+            type(layer) in FUSED_KERNEL_LAYERS and
+            np.ndim(low) == 0 and np.ndim(high) == 0 and
+            ilayers.ExplicitGradientWRT.is_supported(layer,
+                                                     ignore_activation=True))
         self._layer_wo_act = kgraph.copy_layer_wo_activation(
             layer,
             keep_bias=False,
             name_template="reversed_kernel_%s")
-        self._layer_wo_act_positive = kgraph.copy_layer_wo_activation(
-            layer,
-            keep_bias=False,
-            weights=positive_weights,
-            name_template="reversed_kernel_positive_%s")
-        self._layer_wo_act_negative = kgraph.copy_layer_wo_activation(
-            layer,
-            keep_bias=False,
-            weights=negative_weights,
-            name_template="reversed_kernel_negative_%s")
+        if self._fused:
+            # The terms low*W+ and high*W- do not depend on the input.
+            # Fold them into one kernel, see _apply_fused.
+            bounds_weights = [low * w_pos + high * w_neg
+                              for w_pos, w_neg in zip(positive_weights,
+                                                      negative_weights)]
+            bounds_weights = self._freeze_weights(state, bounds_weights)
+            self._layer_wo_act_bounds = kgraph.copy_layer_wo_activation(
+                layer,
+                keep_bias=False,
+                weights=bounds_weights,
+                name_template="reversed_kernel_bounds_%s")
+        else:
+            positive_weights = self._freeze_weights(state, positive_weights)
+            negative_weights = self._freeze_weights(state, negative_weights)
+            self._layer_wo_act_positive = kgraph.copy_layer_wo_activation(
+                layer,
+                keep_bias=False,
+                weights=positive_weights,
+                name_template="reversed_kernel_positive_%s")
+            self._layer_wo_act_negative = kgraph.copy_layer_wo_activation(
+                layer,
+                keep_bias=False,
+                weights=negative_weights,
+                name_template="reversed_kernel_negative_%s")
 
     # TODO: clean up this implementation and add more documentation
     def apply(self, Xs, Ys, Rs, reverse_state):
+        if self._fused:
+            return self._apply_fused(Xs, Rs)
+
         grad = ilayers.GradientWRT(len(Xs))
         to_low = keras.layers.Lambda(lambda x: x * 0 + self._low)
         to_high = keras.layers.Lambda(lambda x: x * 0 + self._high)
@@ -442,6 +701,39 @@ class BoundedRule(kgraph.ReverseMappingBase):
 
         return tmp
 
+    def _apply_fused(self, Xs, Rs):
+        # With the kernel Wb = low*W+ + high*W- the forward pass is
+        # x*W - 1*Wb. The second term does not depend on the input,
+        # i.e., it is computed for a single sample and broadcast along
+        # the batch axis. The backward pass computes the gradients of
+        # both kernels explicitly, i.e., the relevance is
+        # x*(W^T s) - Wb^T s at the cost of two transposed kernels.
+        def ones_for_one_sample(x):
+            return K.ones_like(x[:1])
+
+        def subtract(inputs):
+            a, b = inputs
+            return a - b
+
+        def combine(inputs):
+            x, grad, grad_bounds = inputs
+            return x * grad - grad_bounds
+
+        grad = kgraph.get_gradient_wrt_layer(self._layer_wo_act, 1)
+        grad_bounds = kgraph.get_gradient_wrt_layer(
+            self._layer_wo_act_bounds, 1)
+        ret = []
+        for X, R in zip(Xs, Rs):
+            ones = keras.layers.Lambda(ones_for_one_sample)(X)
+            A = kutils.apply(self._layer_wo_act, [X])
+            B = kutils.apply(self._layer_wo_act_bounds, [ones])
+            Z = keras.layers.Lambda(subtract)(A+B)
+            tmp = ilayers.SafeDivide()([R, Z])
+            ret.append(keras.layers.Lambda(combine)(
+                [X]+iutils.to_list(grad([X, Z, tmp])) +
+                iutils.to_list(grad_bounds([X, Z, tmp]))))
+        return ret
+
 
 
 class ZPlusRule(Alpha1Beta0IgnoreBiasRule):
@@ -458,7 +750,7 @@ class ZPlusRule(Alpha1Beta0IgnoreBiasRule):
 
 
 
-class ZPlusFastRule(kgraph.ReverseMappingBase):
+class ZPlusFastRule(_TransformedWeightsRule):
     """
     The ZPlus rule is a special case of the AlphaBetaRule
     for alpha=1, beta=0 and assumes inputs x >= 0.
@@ -478,6 +770,7 @@ class ZPlusFastRule(kgraph.ReverseMappingBase):
             if layer.use_bias:
                 weights = weights[:-1]
             weights = [x * iK.to_floatx(x > 0) for x in weights]
+        weights = self._freeze_weights(state, weights)
 
         self._layer_wo_act_b_positive = kgraph.copy_layer_wo_activation(
             layer,
@@ -486,7 +779,8 @@ class ZPlusFastRule(kgraph.ReverseMappingBase):
             name_template="reversed_kernel_positive_%s")
 
     def apply(self, Xs, Ys, Rs, reverse_state):
-        grad = ilayers.GradientWRT(len(Xs))
+        grad = kgraph.get_gradient_wrt_layer(
+            self._layer_wo_act_b_positive, len(Xs))
 
         #TODO: assert all inputs are positive, instead of only keeping the positives.
         #keep_positives = keras.layers.Lambda(lambda x: x * K.cast(K.greater(x,0), K.floatx()))
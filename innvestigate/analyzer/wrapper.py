@@ -11,7 +11,6 @@ from builtins import zip
 
 import keras.models
 import keras.backend as K
-import numpy as np
 
 
 from . import base
@@ -86,11 +85,18 @@ class AugmentReduceBase(WrapperBase):
     :param augment_by_n: Number of samples to create.
     """
 
+    # Set by subclasses whose first augmented sample equals the input.
+    # Then the neurons are selected on the augmented forward pass.
+    _first_augmented_sample_is_input = False
+
     def __init__(self, subanalyzer, *args, **kwargs):
         self._augment_by_n = kwargs.pop("augment_by_n", 2)
         self._neuron_selection_mode = subanalyzer._neuron_selection_mode
 
-        if self._neuron_selection_mode != "all":
+        if(self._neuron_selection_mode == "max_activation" and
+           self._first_augmented_sample_is_input):
+            subanalyzer._max_activation_group_size = self._augment_by_n
+        elif self._neuron_selection_mode != "all":
             # TODO: this is not transparent, find a better way.
             subanalyzer._neuron_selection_mode = "index"
         super(AugmentReduceBase, self).__init__(subanalyzer,
@@ -107,7 +113,11 @@ class AugmentReduceBase(WrapperBase):
         if not self._keras_based_augment_reduce:
             return
 
-        self._subanalyzer.create_analyzer_model()
+        if self._subanalyzer._max_activation_group_size is not None:
+            # The build cache does not distinguish the neuron selection.
+            self._subanalyzer._create_analyzer_model()
+        else:
+            self._subanalyzer.create_analyzer_model()
 
         if self._subanalyzer._n_debug_output > 0:
             raise Exception("No debug output at subanalyzer is supported.")
@@ -128,9 +138,29 @@ class AugmentReduceBase(WrapperBase):
             raise Exception("No extra output is allowed "
                             "with this wrapper.")
 
+        n_analysis_inputs = len(self._subanalyzer._analysis_inputs)
+        analysis_inputs = extra_inputs[:n_analysis_inputs]
+        constant_inputs = extra_inputs[n_analysis_inputs:]
+        if(self._neuron_selection_mode == "max_activation" and
+           self._subanalyzer._max_activation_group_size is not None):
+            # The subanalyzer selects the neurons based on
+            # the first augmented samples.
+            neuron_selection = []
+        elif self._neuron_selection_mode == "max_activation":
+            # Select the neurons inside the graph, based on the
+            # forward pass of the un-augmented input.
+            neuron_selection = [self._keras_get_max_activation_indices(inputs)]
+            extra_inputs = constant_inputs
+        else:
+            neuron_selection = analysis_inputs
+
         new_inputs = iutils.to_list(self._augment(inputs))
-        # print(type(new_inputs), type(extra_inputs))
-        tmp = iutils.to_list(model(new_inputs+extra_inputs))
+        # The neuron selection is given per sample,
+        # broadcast it to match the augmented samples.
+        repeat = ilayers.Repeat(self._augment_by_n, axis=0)
+        new_extra_inputs = ([repeat(x) for x in neuron_selection] +
+                            constant_inputs)
+        tmp = iutils.to_list(model(new_inputs+new_extra_inputs))
         new_outputs = iutils.to_list(self._reduce(tmp))
         new_constant_inputs = self._keras_get_constant_inputs()
 
@@ -139,27 +169,34 @@ class AugmentReduceBase(WrapperBase):
             outputs=new_outputs+extra_outputs)
         self._subanalyzer._analyzer_model = new_model
 
+        if self._neuron_selection_mode == "max_activation":
+            # The analyzer model selects the neurons on its own now,
+            # i.e., no indices are expected at analyze calls.
+            self._subanalyzer._neuron_selection_mode = "max_activation"
+
+    def _keras_get_max_activation_indices(self, X):
+        model = self._subanalyzer._model
+        if all(x is y for x, y in zip(X, model.inputs)):
+            # Reuse the forward pass of the model.
+            Y = model.outputs
+        else:
+            Y = iutils.to_list(model(X))
+
+        if len(Y) > 1:
+            raise ValueError("Only models with one output tensor are allowed.")
+        # Flatten to form (batch_size, other_dimensions):
+        if K.ndim(Y[0]) > 2:
+            Y = iutils.to_list(keras.layers.Flatten()(Y))
+        return ilayers.ArgMax(axis=-1, keepdims=True)(Y[0])
+
     def analyze(self, X, *args, **kwargs):
         if self._keras_based_augment_reduce is True:
             if not hasattr(self._subanalyzer, "_analyzer_model"):
                 self.create_analyzer_model()
 
-            ns_mode = self._neuron_selection_mode
-            if ns_mode in ["max_activation", "index"]:
-                if ns_mode == "max_activation":
-                    tmp = self._subanalyzer._model.predict(X)
-                    indices = np.argmax(tmp, axis=1)
-                else:
-                    if len(args):
-                        args = list(args)
-                        indices = args.pop(0)
-                    else:
-                        indices = kwargs.pop("neuron_selection")
-
-                # broadcast to match augmented samples.
-                indices = np.repeat(indices, self._augment_by_n)
-
-                kwargs["neuron_selection"] = indices
+            # With max_activation the indices are computed and
+            # with index they are broadcasted to match the augmented
+            # samples inside the analyzer model.
             return self._subanalyzer.analyze(X, *args, **kwargs)
         else:
             raise DeprecationWarning("Not supported anymore.")
@@ -258,6 +295,9 @@ class PathIntegrator(AugmentReduceBase):
     :param reference_inputs: The reference input.
     """
 
+    # The path starts at the input.
+    _first_augmented_sample_is_input = True
+
     def __init__(self, subanalyzer, *args, **kwargs):
         steps = kwargs.pop("steps", 16)
         self._reference_inputs = kwargs.pop("reference_inputs", 0)
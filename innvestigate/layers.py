@@ -28,10 +28,12 @@ __all__ = [
     "ZerosLike",
     "OnesLike",
     "AsFloatX",
+    "Cast",
     "FiniteCheck",
 
     "Gradient",
     "GradientWRT",
+    "ExplicitGradientWRT",
 
     "Min",
     "Max",
@@ -46,8 +48,11 @@ __all__ = [
     "Sum",
     "Mean",
     "CountNonZero",
+    "AbsMax",
+    "ArgMax",
 
     "Identity",
+    "ActivationInput",
     "Abs",
     "Square",
     "Clip",
@@ -59,6 +64,7 @@ __all__ = [
     "SafeDivide",
 
     "Repeat",
+    "Subsample",
     "Reshape",
     "MultiplyWithLinspace",
     "TestPhaseGaussianNoise",
@@ -67,6 +73,12 @@ __all__ = [
     "Broadcast",
     "Gather",
     "GatherND",
+    "BatchGather",
+    "BatchRepeat",
+    "BatchReshape",
+    "TopK",
+    "ColormapLookup",
+    "ImportGraph",
 ]
 
 
@@ -106,6 +118,15 @@ class AsFloatX(keras.layers.Layer):
         return [iK.to_floatx(tmp) for tmp in iutils.to_list(x)]
 
 
+class Cast(keras.layers.Layer):
+    def __init__(self, dtype, *args, **kwargs):
+        self._cast_dtype = dtype
+        super(Cast, self).__init__(*args, **kwargs)
+
+    def call(self, x):
+        return [K.cast(tmp, self._cast_dtype) for tmp in iutils.to_list(x)]
+
+
 class FiniteCheck(keras.layers.Layer):
     def call(self, x):
         return [K.sum(iK.to_floatx(iK.is_not_finite(tmp)))
@@ -195,6 +216,73 @@ class GradientWRT(keras.layers.Layer):
         return mask
 
 
+class ExplicitGradientWRT(keras.layers.Layer):
+    """Returns the gradient wrt to the input of a layer given the gradient
+    for its output. Expects [input, output, known gradient].
+
+    Unlike :class:`GradientWRT` the gradient is computed with explicit
+    reverse operations, i.e., a transposed kernel or convolution
+    or the gradient operation of the pooling, instead of the automatic
+    differentiation of the backend.
+    Only layers for which :func:`is_supported` returns True can be used.
+
+    :param layer: The layer that computed the output.
+      Its current weights are used.
+    """
+
+    def __init__(self, layer, **kwargs):
+        self._layer = layer
+        super(ExplicitGradientWRT, self).__init__(**kwargs)
+
+    @staticmethod
+    def is_supported(layer, ignore_activation=False):
+        """
+        :param ignore_activation: Only check the layer without its
+          activation, which the gradient does not consider.
+        """
+        linear_activations = [None, keras.activations.get("linear")]
+        is_linear = (ignore_activation or
+                     getattr(layer, "activation", None) in linear_activations)
+        if type(layer) is keras.layers.Dense:
+            return is_linear
+        elif type(layer) in (keras.layers.Conv1D,
+                             keras.layers.Conv2D,
+                             keras.layers.Conv3D):
+            return (is_linear and
+                    layer.padding in ("valid", "same") and
+                    all(x == 1 for x in layer.dilation_rate))
+        elif type(layer) in (keras.layers.MaxPooling2D,
+                             keras.layers.AveragePooling2D):
+            return (K.backend() == "tensorflow" and
+                    layer.data_format == "channels_last")
+        else:
+            return False
+
+    def call(self, x):
+        X, Y, known_Y = x
+        layer = self._layer
+        if type(layer) is keras.layers.Dense:
+            return K.dot(known_Y, K.transpose(layer.kernel))
+        elif type(layer) in (keras.layers.MaxPooling2D,
+                             keras.layers.AveragePooling2D):
+            if type(layer) is keras.layers.MaxPooling2D:
+                pool_mode = "max"
+            else:
+                pool_mode = "avg"
+            return iK.pool2d_gradient(X, Y, known_Y,
+                                      layer.pool_size, layer.strides,
+                                      padding=layer.padding,
+                                      pool_mode=pool_mode)
+        else:
+            return iK.conv_transpose(known_Y, layer.kernel, X,
+                                     layer.strides,
+                                     padding=layer.padding,
+                                     data_format=layer.data_format)
+
+    def compute_output_shape(self, input_shapes):
+        return input_shapes[0]
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -259,6 +347,23 @@ class CountNonZero(_Reduce):
                      keepdims=keepdims)
 
 
+class AbsMax(_Reduce):
+    "Returns the value with the highest magnitude, keeping its sign."
+
+    def _apply_reduce(self, x, axis, keepdims):
+        pos_max = K.max(x, axis=axis, keepdims=keepdims)
+        neg_max = K.min(x, axis=axis, keepdims=keepdims)
+        return K.switch(K.greater_equal(pos_max, -neg_max), pos_max, neg_max)
+
+
+class ArgMax(_Reduce):
+    def _apply_reduce(self, x, axis, keepdims):
+        ret = K.argmax(x, axis=axis)
+        if keepdims:
+            ret = K.expand_dims(ret, axis=axis)
+        return ret
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -283,6 +388,17 @@ class Identity(_Map):
         return K.identity(x)
 
 
+class ActivationInput(_Map):
+    "Returns the input of the activation function that computed x."
+
+    def _apply_map(self, x):
+        ret = iK.get_activation_input(x)
+        if ret is None:
+            raise ValueError("Tensor is not the output of an activation.")
+        # Each application needs its own Keras tensor.
+        return K.identity(ret)
+
+
 class Abs(_Map):
     def _apply_map(self, x):
         return K.abs(x)
@@ -448,7 +564,11 @@ class SafeDivide(keras.layers.Layer):
 
     def call(self, x):
         a, b = x
-        return a / (b + iK.to_floatx(K.equal(b, K.constant(0))) * self._factor)
+        # Divide in float32 if the inputs have a reduced precision.
+        dtype = K.dtype(a)
+        a, b = iK.to_accumulation_dtype(a), iK.to_accumulation_dtype(b)
+        ret = a / (b + K.cast(K.equal(b, 0), K.dtype(b)) * self._factor)
+        return iK.from_accumulation_dtype(ret, dtype)
 
     def compute_output_shape(self, input_shapes):
         return input_shapes[0]
@@ -481,6 +601,20 @@ class Repeat(keras.layers.Layer):
             return (input_shape[0]*self._n,)+input_shape[1:]
 
 
+class Subsample(keras.layers.Layer):
+    "Selects every n-th sample, starting with the first one."
+
+    def __init__(self, n, *args, **kwargs):
+        self._n = n
+        return super(Subsample, self).__init__(*args, **kwargs)
+
+    def call(self, x):
+        return x[::self._n]
+
+    def compute_output_shape(self, input_shapes):
+        return (None,)+tuple(input_shapes[1:])
+
+
 class Reshape(keras.layers.Layer):
 
     def __init__(self, shape, *args, **kwargs):
@@ -592,21 +726,28 @@ class RunningMeans(keras.layers.Layer):
     def build(self, input_shapes):
         means_shape, counts_shape = input_shapes
 
+        # Accumulate in float32, a reduced precision
+        # cannot represent large counts.
         self.means = self.add_weight(shape=means_shape,
                                      initializer="zeros",
                                      name="means",
+                                     dtype="float32",
                                      trainable=False)
         self.counts = self.add_weight(shape=counts_shape,
                                       initializer="zeros",
                                       name="counts",
+                                      dtype="float32",
                                       trainable=False)
         self.built = True
 
     def call(self, x):
         def safe_divide(a, b):
-            return a / (b + iK.to_floatx(K.equal(b, K.constant(0))) * 1)
+            return a / (b + K.cast(K.equal(b, 0), K.dtype(b)) * 1)
 
         means, counts = x
+        means_dtype, counts_dtype = K.dtype(means), K.dtype(counts)
+        means = iK.to_accumulation_dtype(means)
+        counts = iK.to_accumulation_dtype(counts)
 
         new_counts = counts + self.counts
 
@@ -624,7 +765,8 @@ class RunningMeans(keras.layers.Layer):
             K.update(self.counts, new_counts),
         ])
 
-        return [new_means, new_counts]
+        return [iK.from_accumulation_dtype(new_means, means_dtype),
+                iK.from_accumulation_dtype(new_counts, counts_dtype)]
 
     def compute_output_shape(self, input_shapes):
         return input_shapes
@@ -658,3 +800,127 @@ class GatherND(keras.layers.Layer):
 
     def compute_output_shape(self, input_shapes):
         return input_shapes[1][:2]+input_shapes[0][2:]
+
+
+class BatchGather(keras.layers.Layer):
+    "Selects for each sample the given indices, expects [x, indices]."
+
+    def call(self, inputs):
+        x, indices = inputs
+        return iK.batch_gather(x, indices)
+
+    def compute_output_shape(self, input_shapes):
+        return input_shapes[1][:2]
+
+
+class BatchRepeat(keras.layers.Layer):
+    """Repeats each sample as often as the reference has columns,
+    expects [x, reference]."""
+
+    def call(self, inputs):
+        x, reference = inputs
+        k = K.shape(reference)[1]
+        tmp = K.tile(K.expand_dims(x, axis=1),
+                     [1, k]+[1 for _ in range(K.ndim(x)-1)])
+        shape = K.int_shape(x)[1:]
+        if None in shape:
+            shape = K.concatenate([K.shape(x)[:1]*k, K.shape(x)[1:]])
+        else:
+            # Keep the static shape.
+            shape = (-1,)+shape
+        return K.reshape(tmp, shape)
+
+    def compute_output_shape(self, input_shapes):
+        return (None,)+tuple(input_shapes[0][1:])
+
+
+class BatchReshape(keras.layers.Layer):
+    """Reshapes x from (n*k, ...) to (n, k, ...), where (n, k) is
+    the shape of the reference, expects [x, reference]."""
+
+    def call(self, inputs):
+        x, reference = inputs
+        shape = K.concatenate([K.shape(reference)[:2], K.shape(x)[1:]])
+        return K.reshape(x, shape)
+
+    def compute_output_shape(self, input_shapes):
+        return tuple(input_shapes[1][:2])+tuple(input_shapes[0][1:])
+
+
+class TopK(keras.layers.Layer):
+    """Selects for each sample the k values with the highest magnitude.
+
+    If sparse, returns the [indices, values] of the selected entries
+    in the flattened sample, ordered by decreasing magnitude.
+    Otherwise, returns x with all other entries set to zero.
+    """
+
+    def __init__(self, k, sparse=True, *args, **kwargs):
+        self._k = k
+        self._sparse = sparse
+        super(TopK, self).__init__(*args, **kwargs)
+
+    def call(self, x):
+        flat_x = K.batch_flatten(x)
+        abs_values, indices = iK.top_k(K.abs(flat_x), self._k)
+        if self._sparse:
+            return [indices, iK.batch_gather(flat_x, indices)]
+        else:
+            # Ties on the threshold keep more than k entries.
+            threshold = K.reshape(
+                abs_values[:, -1], [-1]+[1 for _ in range(K.ndim(x)-1)])
+            mask = K.cast(K.greater_equal(K.abs(x), threshold), K.dtype(x))
+            return x*mask
+
+    def compute_output_shape(self, input_shape):
+        if self._sparse:
+            return [(input_shape[0], self._k), (input_shape[0], self._k)]
+        else:
+            return input_shape
+
+    def compute_mask(self, inputs, mask=None):
+        # One mask per output.
+        return [None, None] if self._sparse else None
+
+
+class ColormapLookup(keras.layers.Layer):
+    """Maps the values of x onto the colors of a lookup table
+    with shape (n_colors, n_channels). The values are truncated
+    to integers and clipped to the table's range."""
+
+    def __init__(self, lut, *args, **kwargs):
+        self._lut = np.asarray(lut)
+        super(ColormapLookup, self).__init__(*args, **kwargs)
+
+    def call(self, x):
+        lut = K.constant(self._lut, dtype=self._lut.dtype.name)
+        indices = K.cast(K.clip(x, 0, len(self._lut)-1), "int32")
+        return K.gather(lut, indices)
+
+    def compute_output_shape(self, input_shape):
+        return tuple(input_shape)+(self._lut.shape[1],)
+
+
+class ImportGraph(keras.layers.Layer):
+    """Computes the outputs of a graph serialized with
+    :func:`innvestigate.utils.keras.backend.freeze_graph`,
+    expects the tensors mapped on the graph's inputs."""
+
+    def __init__(self, graph_def, input_names, output_names, output_shapes,
+                 *args, **kwargs):
+        self._graph_def = graph_def
+        self._input_names = input_names
+        self._output_names = output_names
+        self._output_shapes = output_shapes
+        super(ImportGraph, self).__init__(*args, **kwargs)
+
+    def call(self, x):
+        input_map = {k: v for k, v in zip(self._input_names,
+                                          iutils.to_list(x))}
+        ret = iK.import_graph(self._graph_def, input_map,
+                              self._output_names, name=self.name)
+        return ret[0] if len(ret) == 1 else ret
+
+    def compute_output_shape(self, input_shapes):
+        ret = [tuple(x) for x in self._output_shapes]
+        return ret[0] if len(ret) == 1 else ret
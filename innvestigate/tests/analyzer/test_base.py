@@ -8,13 +8,23 @@ from __future__ import \
 ###############################################################################
 
 
+import keras.backend as K
+import keras.layers
+import keras.models
+import numpy as np
 import pytest
 
 
+import innvestigate.utils as iutils
+import innvestigate.utils.visualizations as ivis
 from innvestigate.utils.tests import dryrun
+from innvestigate.utils.tests import networks
 
+from innvestigate.analyzer.base import AnalyzerBase
 from innvestigate.analyzer import BaselineGradient
 from innvestigate.analyzer import Gradient
+from innvestigate.analyzer import InputTimesGradient
+from innvestigate.analyzer import LRPZ
 
 
 ###############################################################################
@@ -141,6 +151,527 @@ def test_precommit__AnalyzerNetworkBase_neuron_selection_index():
     dryrun.test_analyzer(method, "mnist.*")
 
 
+def _test_analyze_batch_size(method, network_filter, neuron_selection=None):
+    for network in networks.iterator(network_filter, clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = method(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+
+        kwargs = {}
+        if neuron_selection is not None:
+            kwargs["neuron_selection"] = neuron_selection
+        analysis = analyzer.analyze(x, **kwargs)
+        chunked_analysis = analyzer.analyze(x, batch_size=2, **kwargs)
+
+        assert chunked_analysis.shape == analysis.shape
+        assert np.allclose(chunked_analysis, analysis)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_batch_size():
+
+    def method(model):
+        return Gradient(model)
+
+    _test_analyze_batch_size(method, "trivia.*:mnist.log_reg")
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_batch_size_neuron_selection_index():
+
+    def method(model):
+        return Gradient(model, neuron_selection_mode="index")
+
+    _test_analyze_batch_size(method, "trivia.*:mnist.log_reg",
+                             neuron_selection=0)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_neuron_selection_multi_target():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model, neuron_selection_mode="index")
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        neuron_selection = np.random.randint(network["output_n"],
+                                             size=(5, 3))
+
+        analysis = analyzer.analyze(x, neuron_selection=neuron_selection)
+        chunked_analysis = analyzer.analyze(
+            x, neuron_selection=neuron_selection, batch_size=2)
+
+        assert analysis.shape == (5, 3)+x.shape[1:]
+        assert np.allclose(chunked_analysis, analysis)
+        for i in range(3):
+            tmp = analyzer.analyze(x, neuron_selection=neuron_selection[:, i])
+            assert np.allclose(analysis[:, i], tmp)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_multi_target():
+
+    inputs = keras.layers.Input(shape=(4,))
+    tmp = keras.layers.Dense(5, activation="relu", name="dense_1")(inputs)
+    outputs = keras.layers.Dense(3, name="dense_2")(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=outputs)
+    x = np.random.rand(6, 4)
+    neuron_selection = np.random.randint(3, size=(6, 2))
+
+    def get_ops(tensors):
+        ret, stack = set(), [t.op for t in tensors]
+        while len(stack) > 0:
+            op = stack.pop()
+            if op not in ret:
+                ret.add(op)
+                stack += [t.op for t in op.inputs]
+        return ret
+
+    for analyzer_class in (Gradient, LRPZ, InputTimesGradient):
+        analyzer = analyzer_class(model, neuron_selection_mode="index")
+        analysis = analyzer.analyze(x, neuron_selection=neuron_selection)
+        layer_analysis = analyzer.analyze(x,
+                                          neuron_selection=neuron_selection,
+                                          return_layers=["dense_1"])
+        for i in range(2):
+            tmp = analyzer.analyze(x, neuron_selection=neuron_selection[:, i])
+            assert np.allclose(analysis[:, i], tmp)
+            tmp = analyzer.analyze(x, neuron_selection=neuron_selection[:, i],
+                                   return_layers=["dense_1"])
+            assert np.allclose(layer_analysis["dense_1"][:, i],
+                               tmp["dense_1"])
+
+        if analyzer_class is InputTimesGradient:
+            # Repeats the samples instead.
+            continue
+        # The dense layers are only computed on the not repeated samples.
+        multi_target_model = [
+            v[1] for k, v in analyzer._derived_analyzer_models.items()
+            if k[1] == ("multi_target", ())][0]
+        ops = [op for op in get_ops(multi_target_model.outputs)
+               if op.type == "MatMul"]
+        assert any(t is inputs for op in ops for t in op.inputs)
+        assert not any(t.op.name.startswith("batch_repeat")
+                       for op in ops for t in op.inputs)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_reduce_and_output_dtype():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x)
+
+        tmp = analyzer.analyze(x, reduce_axis=-1)
+        assert np.allclose(tmp, analysis.sum(axis=-1))
+
+        tmp = analyzer.analyze(x, reduce_axis=-1, reduce_op="absmax",
+                               output_dtype=np.float16)
+        pos, neg = analysis.max(axis=-1), analysis.min(axis=-1)
+        assert tmp.dtype == np.float16
+        assert np.allclose(tmp, np.where(pos >= -neg, pos, neg),
+                           rtol=1e-2, atol=1e-3)
+
+        with pytest.raises(ValueError):
+            analyzer.analyze(x, reduce_axis=-1, reduce_op="mean")
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_heatmap():
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+
+        expected = ivis.heatmap(analyzer.analyze(x))
+        analysis = analyzer.analyze(x, heatmap="seismic")
+
+        assert analysis.dtype == np.uint8
+        assert analysis.shape == expected.shape
+        # Values on the boundary between two colors might differ.
+        diff = np.abs(analysis.astype(np.float32)-expected*255)
+        assert np.mean(diff <= 1) > 0.99
+        assert np.all(diff <= 16)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_top_k():
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x).reshape((5, -1))
+
+        indices, values = analyzer.analyze(x, top_k=10, return_sparse=True)
+        chunked_indices, _ = analyzer.analyze(x, top_k=10,
+                                              return_sparse=True,
+                                              batch_size=2)
+        assert indices.shape == (5, 10) and values.shape == (5, 10)
+        assert np.all(chunked_indices == indices)
+        for i in range(5):
+            expected = np.sort(np.abs(analysis[i]))[::-1][:10]
+            assert np.allclose(np.abs(values[i]), expected)
+            assert np.allclose(analysis[i, indices[i]], values[i])
+
+        dense = analyzer.analyze(x, top_k=10).reshape((5, -1))
+        for i in range(5):
+            assert np.count_nonzero(dense[i]) >= 10
+            assert np.allclose(dense[i, indices[i]], values[i])
+
+        with pytest.raises(ValueError):
+            analyzer.analyze(x, return_sparse=True)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_return_layers():
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x)
+
+        input_name, flatten_name = [l.name for l in model.layers[:2]]
+        ret = analyzer.analyze(x, return_layers=[input_name, flatten_name])
+        assert sorted(ret.keys()) == sorted([input_name, flatten_name])
+        assert np.allclose(ret[input_name], analysis)
+        assert np.allclose(ret[flatten_name], analysis.reshape((5, -1)))
+
+        with pytest.raises(ValueError):
+            analyzer.analyze(x, return_layers=["no_such_layer"])
+
+        # The analysis at the layers is postprocessed as well.
+        analyzer = Gradient(model, postprocess="abs")
+        ret = analyzer.analyze(x, return_layers=[flatten_name])
+        assert np.allclose(ret[flatten_name],
+                           np.abs(analysis.reshape((5, -1))))
+
+        # Requests with return_layers can be joined by the executor.
+        analyzer.start_analyze_executor(batch_window=0.1)
+        try:
+            futures = [analyzer.analyze_async(x[i:i+2],
+                                              return_layers=[flatten_name])
+                       for i in range(0, 5, 2)]
+            tmp = [f.result() for f in futures]
+        finally:
+            analyzer.stop_analyze_executor()
+        assert all(list(r.keys()) == [flatten_name] for r in tmp)
+        assert np.allclose(np.concatenate([r[flatten_name] for r in tmp]),
+                           ret[flatten_name])
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_stop_at_layers():
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        analysis = Gradient(model).analyze(x)
+
+        flatten_name = model.layers[1].name
+        analyzer = Gradient(model, reverse_stop_at_layers=[flatten_name])
+        assert np.allclose(analyzer.analyze(x), analysis.reshape((5, -1)))
+
+        class_name, state = analyzer.save()
+        new_analyzer = AnalyzerBase.load(class_name, state)
+        assert np.allclose(new_analyzer.analyze(x), analysis.reshape((5, -1)))
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_stop_at_layers_rewritten_model():
+
+    inputs = keras.layers.Input(shape=(6,))
+    tmp = keras.layers.Dense(5)(inputs)
+    tmp = keras.layers.BatchNormalization()(tmp)
+    activation = keras.layers.Activation("relu", name="activation")
+    tmp = activation(tmp)
+    tmp = keras.layers.Dense(3)(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=tmp)
+    model.set_weights([np.random.rand(*w.shape)+0.5
+                       for w in model.get_weights()])
+    # The layer is also applied outside of the model.
+    activation(keras.layers.Input(shape=(5,)))
+    x = np.random.rand(4, 6)
+
+    expected = Gradient(model, reverse_stop_at_layers=["activation"])
+    expected = expected.analyze(x)
+    expected_layers = Gradient(model).analyze(x,
+                                              return_layers=["activation"])
+    assert np.allclose(expected_layers["activation"], expected)
+
+    # Folding and casting the model adds nodes to the reused layers.
+    for kwargs, tolerance in [
+            ({"reverse_fold_batch_normalization": True}, 1e-4),
+            ({"precision": "float16"}, 1e-2),
+            ({"reverse_fold_batch_normalization": True,
+              "precision": "float16"}, 1e-2)]:
+        analyzer = Gradient(model, reverse_stop_at_layers=["activation"],
+                            **kwargs)
+        assert np.allclose(analyzer.analyze(x), expected,
+                           rtol=tolerance, atol=tolerance)
+
+        analyzer = Gradient(model, **kwargs)
+        analysis = analyzer.analyze(x, return_layers=["activation"])
+        assert np.allclose(analysis["activation"], expected,
+                           rtol=tolerance, atol=tolerance)
+
+    # A nested model is not executed as layer, only its layers are.
+    inner_model = keras.models.Model(inputs=inputs, outputs=tmp)
+    outer_inputs = keras.layers.Input(shape=(6,))
+    outer_model = keras.models.Model(
+        inputs=outer_inputs,
+        outputs=keras.layers.Dense(2)(inner_model(outer_inputs)))
+    with pytest.raises(ValueError):
+        Gradient(outer_model,
+                 reverse_stop_at_layers=[inner_model.name]).analyze(x)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_fold_batch_normalization():
+
+    inputs = keras.layers.Input(shape=(6,))
+    tmp = keras.layers.Dense(5)(inputs)
+    tmp = keras.layers.BatchNormalization()(tmp)
+    tmp = keras.layers.Activation("relu")(tmp)
+    tmp = keras.layers.Dense(3)(tmp)
+    tmp = keras.layers.BatchNormalization()(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=tmp)
+    model.set_weights([np.random.rand(*w.shape)+0.5
+                       for w in model.get_weights()])
+    x = np.random.rand(4, 6)
+
+    # The folded model computes the same function, i.e.,
+    # the gradient does not change.
+    analysis = Gradient(model).analyze(x)
+    analyzer = Gradient(model, reverse_fold_batch_normalization=True)
+    assert np.allclose(analyzer.analyze(x), analysis, rtol=1e-4, atol=1e-6)
+    assert not any(isinstance(layer, keras.layers.BatchNormalization)
+                   for layer in analyzer._prepared_model.layers)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseAnalyzerBase_fold_batch_normalization_names():
+
+    inputs = keras.layers.Input(shape=(6,))
+    tmp = keras.layers.Dense(5, name="dense")(inputs)
+    tmp = keras.layers.BatchNormalization(name="bn")(tmp)
+    tmp = keras.layers.Activation("relu")(tmp)
+    tmp = keras.layers.Dense(3)(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=tmp)
+    model.set_weights([np.random.rand(*w.shape)+0.5
+                       for w in model.get_weights()])
+    x = np.random.rand(4, 6)
+
+    expected = Gradient(model).analyze(x, return_layers=["bn"])["bn"]
+
+    # The folded layer computes the output of both layers.
+    for name in ["dense", "bn"]:
+        analyzer = Gradient(model, reverse_fold_batch_normalization=True)
+        assert analyzer._prepared_model.get_layer("dense") is not None
+        analysis = analyzer.analyze(x, return_layers=[name])
+        assert np.allclose(analysis[name], expected, rtol=1e-4, atol=1e-6)
+
+        analyzer = Gradient(model, reverse_stop_at_layers=[name],
+                            reverse_fold_batch_normalization=True)
+        assert np.allclose(analyzer.analyze(x), expected,
+                           rtol=1e-4, atol=1e-6)
+
+    class_name, state = analyzer.save()
+    new_analyzer = AnalyzerBase.load(class_name, state)
+    assert np.allclose(new_analyzer.analyze(x), analysis,
+                       rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_shared_prepared_model():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        analyzer1 = Gradient(model, neuron_selection_mode="index")
+        analyzer2 = BaselineGradient(model, neuron_selection_mode="index")
+        analysis1 = analyzer1.analyze(x, neuron_selection=0)
+        analysis2 = analyzer2.analyze(x, neuron_selection=0)
+
+        assert analyzer1._prepared_model is analyzer2._prepared_model
+        assert np.allclose(analysis1, analysis2, rtol=1e-5, atol=1e-7)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerBase_analyze_generator():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(5, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x)
+
+        for workers in [0, 2]:
+            generator = iutils.BatchSequence(x, batch_size=2)
+            tmp = list(analyzer.analyze_generator(generator, workers=workers))
+
+            assert len(tmp) == len(generator)
+            assert np.allclose(np.concatenate(tmp), analysis)
+
+        # Plain generators need steps, checked before the first batch.
+        with pytest.raises(ValueError):
+            analyzer.analyze_generator(iter([x]))
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerBase_analyze_async():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model, neuron_selection_mode="index")
+        x = np.random.rand(6, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x, neuron_selection=0)
+
+        # Use a long window to make sure the requests are joined.
+        analyzer.start_analyze_executor(batch_window=0.1)
+        try:
+            futures = [analyzer.analyze_async(x[i:i+2], neuron_selection=0)
+                       for i in range(0, 6, 2)]
+            tmp = [f.result() for f in futures]
+        finally:
+            analyzer.stop_analyze_executor()
+
+        assert np.allclose(np.concatenate(tmp), analysis)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerBase_analyze_async_mixed_requests():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model, neuron_selection_mode="index")
+        x = np.random.rand(2, *(network["input_shape"][1:]))
+        n = network["output_n"]
+
+        # Selections of different forms, only some can be joined.
+        selections = [0,
+                      np.arange(2) % n,
+                      np.zeros((1, 2), dtype=np.int32),
+                      np.ones((2, 2), dtype=np.int32) % n,
+                      np.zeros((2, 3), dtype=np.int32)]
+        expected = [analyzer.analyze(x, neuron_selection=neuron_selection)
+                    for neuron_selection in selections]
+
+        analyzer.start_analyze_executor(batch_window=0.1)
+        try:
+            futures = [analyzer.analyze_async(x,
+                                              neuron_selection=selection)
+                       for selection in selections]
+            # Misses the neuron selection.
+            futures.append(analyzer.analyze_async(x))
+            tmp = [f.result() for f in futures[:-1]]
+            with pytest.raises(ValueError):
+                futures[-1].result()
+        finally:
+            analyzer.stop_analyze_executor()
+
+        for a, e in zip(tmp, expected):
+            assert a.shape == e.shape
+            assert np.allclose(a, e)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_analyze_overhead(monkeypatch):
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        analyzer = Gradient(model)
+        x = np.random.rand(1, *(network["input_shape"][1:]))
+        analysis = analyzer.analyze(x)
+        assert np.allclose(analyzer._analyzer_model.predict_on_batch(x),
+                           analysis)
+
+        # Further calls neither compile a function again nor use
+        # the Keras prediction path.
+        compiled = []
+        function = K.function
+
+        def counting_function(*args, **kwargs):
+            compiled.append(args)
+            return function(*args, **kwargs)
+
+        def predict_on_batch(*args, **kwargs):
+            raise AssertionError("The prediction path is used.")
+
+        monkeypatch.setattr(K, "function", counting_function)
+        monkeypatch.setattr(analyzer._analyzer_model, "predict_on_batch",
+                            predict_on_batch)
+        for _ in range(10):
+            assert np.allclose(analyzer.analyze(x), analysis)
+        assert len(compiled) == 0
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerNetworkBase_precision():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+        expected = Gradient(model).analyze(x)
+
+        with pytest.raises(ValueError):
+            Gradient(model, precision="float64")
+        analyzer = Gradient(model, precision="float16")
+        analysis = analyzer.analyze(x)
+        assert analysis.dtype == expected.dtype
+        assert np.allclose(analysis, expected, rtol=1e-2, atol=1e-2)
+
+        name = model.layers[-1].name
+        analysis_layer = analyzer.analyze(x, return_layers=[name])[name]
+        assert analysis_layer.dtype == expected.dtype
+
+        class_name, state = analyzer.save()
+        new_analyzer = AnalyzerBase.load(class_name, state)
+        assert np.allclose(new_analyzer.analyze(x), analysis)
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -229,3 +760,31 @@ def test_fast__SerializeReverseAnalyzerkBase():
 
     dryrun.test_serialize_analyzer(method, "trivia.*:mnist.log_reg")
  
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__SerializeAnalyzerNetworkBase_analyzer_model():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        for neuron_selection_mode in ["max_activation", "index"]:
+            kwargs = {}
+            if neuron_selection_mode == "index":
+                kwargs["neuron_selection"] = 0
+
+            analyzer = Gradient(model,
+                                neuron_selection_mode=neuron_selection_mode)
+            analysis = analyzer.analyze(x, **kwargs)
+
+            class_name, state = analyzer.save(include_analyzer_model=True)
+            new_analyzer = AnalyzerBase.load(class_name, state)
+            # The analyzer model is restored and not created again.
+            assert hasattr(new_analyzer, "_analyzer_model")
+            assert not hasattr(new_analyzer, "_prepared_model")
+
+            assert np.allclose(new_analyzer.analyze(x, **kwargs), analysis)
@@ -0,0 +1,111 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import keras.models
+import numpy as np
+import pytest
+
+
+from innvestigate.analyzer import cache
+from innvestigate.utils.tests import networks
+
+from innvestigate.analyzer import Gradient
+from innvestigate.analyzer import LRPAlpha2Beta1
+from innvestigate.analyzer import LRPEpsilon
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerModelCache():
+
+    build_cache = cache.build_cache
+    maxsize = build_cache.maxsize
+    build_cache.maxsize = 2
+    try:
+        for network in networks.iterator("trivia.*:mnist.log_reg",
+                                         clear_sessions=True):
+            build_cache.invalidate()
+            model = keras.models.Model(inputs=network["in"],
+                                       outputs=network["out"])
+            x = np.random.rand(3, *(network["input_shape"][1:]))
+
+            analyzer = Gradient(model)
+            analysis = analyzer.analyze(x)
+            assert len(build_cache) == 1
+
+            # Same model and configuration, reuse the analyzer model.
+            new_analyzer = Gradient(model)
+            assert np.allclose(new_analyzer.analyze(x), analysis)
+            assert (new_analyzer._analyzer_model is
+                    analyzer._analyzer_model)
+            assert len(build_cache) == 1
+
+            # Different configurations.
+            LRPEpsilon(model, epsilon=0.1).analyze(x)
+            LRPEpsilon(model, epsilon=1).analyze(x)
+            assert len(build_cache) == 2
+
+            # The gradient entry was least recently used.
+            new_analyzer = Gradient(model)
+            new_analyzer.analyze(x)
+            assert (new_analyzer._analyzer_model is not
+                    analyzer._analyzer_model)
+
+            build_cache.invalidate(model)
+            assert len(build_cache) == 0
+    finally:
+        build_cache.invalidate()
+        build_cache.maxsize = maxsize
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerModelCache_build_attributes():
+
+    build_cache = cache.build_cache
+    maxsize = build_cache.maxsize
+    build_cache.maxsize = 2
+    try:
+        for network in networks.iterator("trivia.*:mnist.log_reg",
+                                         clear_sessions=True):
+            build_cache.invalidate()
+            model = keras.models.Model(inputs=network["in"],
+                                       outputs=network["out"])
+            x = np.random.rand(3, *(network["input_shape"][1:]))
+
+            analyzer = LRPAlpha2Beta1(model, freeze_weights=True)
+            analyzer.analyze(x)
+            new_analyzer = LRPAlpha2Beta1(model, freeze_weights=True)
+            new_analyzer.analyze(x)
+            assert (new_analyzer._analyzer_model is
+                    analyzer._analyzer_model)
+
+            # The rules are restored, but the lists are not shared.
+            assert len(new_analyzer._rule_objects) > 0
+            assert (new_analyzer._rule_objects ==
+                    analyzer._rule_objects)
+            assert (new_analyzer._rule_objects is not
+                    analyzer._rule_objects)
+            assert (new_analyzer._special_helper_layers is not
+                    analyzer._special_helper_layers)
+
+            # Refreshing the frozen weights works after a cache hit.
+            model.set_weights([w * -2 for w in model.get_weights()])
+            new_analyzer.refresh_weights()
+            expected = LRPAlpha2Beta1(model).analyze(x)
+            assert np.allclose(new_analyzer.analyze(x), expected)
+    finally:
+        build_cache.invalidate()
+        build_cache.maxsize = maxsize
@@ -0,0 +1,129 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import keras.models
+import numpy as np
+import pytest
+
+
+from innvestigate import create_analyzers
+from innvestigate.utils.tests import networks
+
+from innvestigate.analyzer.base import AnalyzerBase
+from innvestigate.analyzer import AnalyzerEnsemble
+from innvestigate.analyzer import Gradient
+from innvestigate.analyzer import InputTimesGradient
+from innvestigate.analyzer import LRPZ
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+def _test_ensemble(method, network_filter):
+    for network in networks.iterator(network_filter, clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        subanalyzers = method(model)
+        expected = [a.analyze(x) for a in subanalyzers]
+
+        ensemble = AnalyzerEnsemble(method(model))
+        analysis = ensemble.analyze(x)
+        assert len(analysis) == len(expected)
+        for a, e in zip(analysis, expected):
+            assert np.allclose(a, e)
+
+        class_name, state = ensemble.save()
+        new_ensemble = AnalyzerBase.load(class_name, state)
+        analysis = new_ensemble.analyze(x)
+        for a, e in zip(analysis, expected):
+            assert np.allclose(a, e)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerEnsemble():
+
+    def method(model):
+        return [Gradient(model),
+                InputTimesGradient(model),
+                LRPZ(model)]
+
+    _test_ensemble(method, "trivia.*:mnist.log_reg")
+
+
+@pytest.mark.precommit
+def test_precommit__AnalyzerEnsemble():
+
+    def method(model):
+        return [Gradient(model),
+                InputTimesGradient(model),
+                LRPZ(model)]
+
+    _test_ensemble(method, "mnist.*")
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzerEnsemble_precision():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        expected = [Gradient(model).analyze(x), LRPZ(model).analyze(x)]
+
+        with pytest.raises(ValueError):
+            AnalyzerEnsemble([Gradient(model, precision="float16"),
+                              LRPZ(model)])
+        ensemble = AnalyzerEnsemble([Gradient(model), LRPZ(model)],
+                                    precision="float16")
+        analysis = ensemble.analyze(x)
+        for a, e in zip(analysis, expected):
+            assert a.dtype == e.dtype
+            assert np.allclose(a, e, rtol=1e-2, atol=1e-2)
+
+        class_name, state = ensemble.save()
+        new_ensemble = AnalyzerBase.load(class_name, state)
+        assert new_ensemble._precision == "float16"
+        for a, e in zip(new_ensemble.analyze(x), analysis):
+            assert np.allclose(a, e)
+
+        # The precision is taken from the subanalyzers.
+        ensemble = create_analyzers(["gradient", "lrp.z"], model,
+                                    precision="float16")
+        assert ensemble._precision == "float16"
+        for a, e in zip(ensemble.analyze(x), analysis):
+            assert np.allclose(a, e)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__create_analyzers():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        ensemble = create_analyzers(
+            ["gradient", ("lrp.epsilon", {"epsilon": 0.1})],
+            model, neuron_selection_mode="index")
+        analysis = ensemble.analyze(x, neuron_selection=0)
+
+        assert len(analysis) == 2
+        for a in analysis:
+            assert a.shape == x.shape
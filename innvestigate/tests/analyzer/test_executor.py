@@ -0,0 +1,51 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import numpy as np
+import pytest
+
+
+from innvestigate.analyzer.executor import AnalyzeExecutor
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+class _DoublingAnalyzer(object):
+
+    def analyze(self, X, **kwargs):
+        return X[0]*2
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__AnalyzeExecutor_survives_batch_errors(monkeypatch):
+    executor = AnalyzeExecutor(_DoublingAnalyzer(), batch_window=0.1)
+    try:
+        # The sample count of a scalar input cannot be determined.
+        future = executor.submit(np.float32(1))
+        with pytest.raises(TypeError):
+            future.result(timeout=10)
+
+        def can_join(a, b):
+            raise ValueError("Cannot join.")
+        monkeypatch.setattr(executor, "_can_join", can_join)
+        futures = [executor.submit(np.ones((1, 2))) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=10)
+
+        monkeypatch.undo()
+        x = np.random.rand(3, 2)
+        assert np.allclose(executor.submit(x).result(timeout=10), x*2)
+    finally:
+        executor.shutdown()
@@ -0,0 +1,60 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import keras.models
+import numpy as np
+import pytest
+
+
+from innvestigate.utils.tests import networks
+
+from innvestigate.analyzer import LRPZ
+from innvestigate.analyzer import ReverseProfiler
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__ReverseProfiler():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        profiler = ReverseProfiler()
+        analyzer = LRPZ(model, reverse_hooks=profiler)
+        analysis = analyzer.analyze(x)
+
+        assert len(profiler.mapping_init_events) > 0
+        assert len(profiler.node_events) > 0
+        for event in profiler.node_events:
+            assert event["duration"] >= 0
+            assert event["n_ops"] is None or event["n_ops"] >= 0
+
+        summary = profiler.get_build_summary()
+        durations = [duration for _, duration, _ in summary]
+        assert durations == sorted(durations, reverse=True)
+
+        assert len(profiler.analyze_statistics) == 1
+        statistics = profiler.analyze_statistics[0]
+        n_tensors = len(statistics["ids"])
+        assert len(statistics["layers"]) == n_tensors
+        for k in ["min", "max", "abs_mean", "not_finite"]:
+            assert statistics[k].shape == (n_tensors,)
+        assert np.all(statistics["min"] <= statistics["max"])
+        assert np.all(statistics["not_finite"] == 0)
+        assert np.min(statistics["min"]) <= analysis.min()
+        assert np.max(statistics["max"]) >= analysis.max()
@@ -0,0 +1,80 @@
+# Get Python six functionality:
+from __future__ import\
+    absolute_import, print_function, division, unicode_literals
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+import keras.models
+import numpy as np
+import pytest
+
+
+from innvestigate.utils.tests import networks
+
+from innvestigate.analyzer import AnalyzerPool
+from innvestigate.analyzer import Gradient
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+@pytest.mark.precommit
+def test_precommit__AnalyzerPool():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(7, *(network["input_shape"][1:]))
+
+        for neuron_selection_mode, neuron_selection in [
+                ("max_activation", None),
+                ("index", 0)]:
+            analyzer = Gradient(model,
+                                neuron_selection_mode=neuron_selection_mode)
+            kwargs = {}
+            if neuron_selection is not None:
+                kwargs["neuron_selection"] = neuron_selection
+            analysis = analyzer.analyze(x, **kwargs)
+
+            # Batches larger than the buffers need several rounds.
+            with AnalyzerPool(analyzer, n_workers=2, max_batch_size=2) as pool:
+                pool_analysis = pool.analyze(x, **kwargs)
+
+            assert pool_analysis.shape == analysis.shape
+            assert np.allclose(pool_analysis, analysis, atol=1e-6)
+
+
+class _NotLoadableGradient(Gradient):
+    """Not exported by innvestigate.analyzer, i.e., load fails."""
+    pass
+
+
+@pytest.mark.precommit
+def test_precommit__AnalyzerPool_worker_errors():
+
+    for network in networks.iterator("mnist.log_reg", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(4, *(network["input_shape"][1:]))
+
+        # The workers fail at startup.
+        with AnalyzerPool(_NotLoadableGradient(model), n_workers=2) as pool:
+            with pytest.raises(Exception) as e:
+                pool.analyze(x)
+            assert "Loading the analyzer failed" in str(e.value)
+
+        # A worker process dies.
+        with AnalyzerPool(Gradient(model), n_workers=2) as pool:
+            pool.analyze(x)
+            pool._workers[0]["process"].terminate()
+            pool._workers[0]["process"].join()
+            with pytest.raises(Exception) as e:
+                pool.analyze(x)
+            assert "died" in str(e.value)
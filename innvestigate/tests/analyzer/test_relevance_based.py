@@ -8,12 +8,20 @@ from __future__ import\
 ###############################################################################
 
 
+import keras.backend as K
+import keras.layers
+import keras.models
+import numpy as np
 import pytest
+import time
 
 
+from innvestigate.utils.keras import backend as iK
 from innvestigate.utils.tests import dryrun
+from innvestigate.utils.tests import networks
 
 from innvestigate.analyzer import BaselineLRPZ
+from innvestigate.analyzer import LRP
 from innvestigate.analyzer import LRPZ
 from innvestigate.analyzer import LRPZIgnoreBias
 from innvestigate.analyzer import LRPZPlus
@@ -26,6 +34,7 @@ from innvestigate.analyzer import LRPAlpha2Beta1
 from innvestigate.analyzer import LRPAlpha2Beta1IgnoreBias
 from innvestigate.analyzer import LRPAlpha1Beta0
 from innvestigate.analyzer import LRPAlpha1Beta0IgnoreBias
+from innvestigate.analyzer.relevance_based import relevance_rule as rrule
 
 
 ###############################################################################
@@ -107,6 +116,80 @@ def test_fast__LRPZ__with_boxed_input_layer_rule():
     dryrun.test_analyzer(method, "trivia.*:mnist.log_reg")
 
 
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRPZ__with_boxed_input_layer_rule__fused_dense():
+    # The bounded rule folds the bounds into one stacked layer,
+    # compare against the rule written out in numpy.
+    low, high = -1, 2
+    inp = keras.layers.Input(shape=(5,))
+    layer = keras.layers.Dense(3)
+    model = keras.models.Model(inputs=inp, outputs=layer(inp))
+    W, b = np.random.randn(5, 3), np.random.randn(3)
+    layer.set_weights([W, b])
+    x = np.random.rand(4, 5)
+
+    y = x.dot(W)+b
+    R = np.zeros_like(y)
+    idx = np.argmax(y, axis=1)
+    R[np.arange(len(y)), idx] = y[np.arange(len(y)), idx]
+
+    W_pos, W_neg = W*(W > 0), W*(W < 0)
+    z = x.dot(W)-low*np.ones_like(x).dot(W_pos)-high*np.ones_like(x).dot(W_neg)
+    s = R/z
+    expected = x*s.dot(W.T)-low*s.dot(W_pos.T)-high*s.dot(W_neg.T)
+
+    analysis = LRPZ(model, input_layer_rule=(low, high)).analyze(x)
+    assert np.allclose(analysis, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRPZ__with_boxed_input_layer_rule__fused_conv2d(monkeypatch):
+    # The bound term of the convolution depends on the padding,
+    # compare against the unfused rule.
+    inp = keras.layers.Input(shape=(9, 9, 3))
+    tmp = keras.layers.Conv2D(4, (3, 3), strides=(2, 2), padding="same",
+                              activation="relu")(inp)
+    tmp = keras.layers.Flatten()(tmp)
+    model = keras.models.Model(inputs=inp,
+                               outputs=keras.layers.Dense(3)(tmp))
+    x = np.random.rand(4, 9, 9, 3)
+
+    analysis = LRPZ(model, input_layer_rule=(-1, 2)).analyze(x)
+    monkeypatch.setattr(rrule, "FUSED_KERNEL_LAYERS", ())
+    expected = LRPZ(model, input_layer_rule=(-1, 2)).analyze(x)
+    assert np.allclose(analysis, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.slow
+@pytest.mark.application
+@pytest.mark.imagenet
+def test_imagenet__LRPZ_reuses_forward_pass():
+
+    for network in networks.iterator("imagenet.vgg16", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+
+        # FLOPs of the convolutions in the forward pass for one sample.
+        flops = 0
+        for layer in model.layers:
+            if isinstance(layer, keras.layers.Conv2D):
+                flops += (2*np.prod(layer.output_shape[1:]) *
+                          np.prod(K.int_shape(layer.kernel)[:-1]))
+
+        def count_convolutions():
+            return len([op for op in iK.get_graph().get_operations()
+                        if op.type == "Conv2D"])
+
+        n_convolutions = count_convolutions()
+        analyzer = LRPZ(model)
+        analyzer.create_analyzer_model()
+        # The reverse pass should not compute the convolutions again.
+        assert count_convolutions() == n_convolutions
+        print("Saved GFLOPs per sample: %.2f" % (flops/1e9))
+
+
 @pytest.mark.fast
 @pytest.mark.precommit
 def test_fast__LRPZIgnoreBias():
@@ -217,6 +300,178 @@ def test_fast__LRPAlpha1Beta0IgnoreBias():
     dryrun.test_analyzer(method, "trivia.*:mnist.log_reg")
 
 
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRPAlpha2Beta1__fused_dense():
+    # The positive and negative parts are computed with one stacked layer,
+    # compare against the rule written out in numpy.
+    inp = keras.layers.Input(shape=(5,))
+    layer = keras.layers.Dense(3)
+    model = keras.models.Model(inputs=inp, outputs=layer(inp))
+    W, b = np.random.randn(5, 3), np.random.randn(3)
+    layer.set_weights([W, b])
+    x = np.random.randn(4, 5)
+
+    y = x.dot(W)+b
+    R = np.zeros_like(y)
+    idx = np.argmax(y, axis=1)
+    R[np.arange(len(y)), idx] = y[np.arange(len(y)), idx]
+
+    W_pos, W_neg = W*(W > 0), W*(W < 0)
+    b_pos, b_neg = b*(b > 0), b*(b < 0)
+    x_pos, x_neg = x*(x > 0), x*(x < 0)
+
+    def relevance(W1, W2):
+        z = x_pos.dot(W1)+x_neg.dot(W2)+b_pos+b_neg
+        s = R/z
+        return x_pos*s.dot(W1.T)+x_neg*s.dot(W2.T)
+
+    expected = 2*relevance(W_pos, W_neg)-relevance(W_neg, W_pos)
+    analysis = LRPAlpha2Beta1(model).analyze(x)
+    assert np.allclose(analysis, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRPAlphaBeta__fused_conv2d(monkeypatch):
+    # Beta=0 uses a layer with stacked input channels instead,
+    # compare both fused variants against the unfused rule.
+    inp = keras.layers.Input(shape=(9, 9, 3))
+    tmp = keras.layers.Conv2D(4, (3, 3), strides=(2, 2), padding="same",
+                              activation="relu")(inp)
+    tmp = keras.layers.Flatten()(tmp)
+    model = keras.models.Model(inputs=inp,
+                               outputs=keras.layers.Dense(3)(tmp))
+    x = np.random.randn(4, 9, 9, 3)
+
+    analyzer_classes = (LRPAlpha2Beta1, LRPAlpha1Beta0,
+                        LRPAlpha1Beta0IgnoreBias, LRPZPlus)
+    fused = [c(model).analyze(x) for c in analyzer_classes]
+    monkeypatch.setattr(rrule, "FUSED_KERNEL_LAYERS", ())
+    for analyzer_class, analysis in zip(analyzer_classes, fused):
+        expected = analyzer_class(model).analyze(x)
+        assert np.allclose(analysis, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRP__rule_list_order():
+
+    inputs = keras.layers.Input(shape=(4,))
+    layers = [keras.layers.Dense(5, activation="relu"),
+              keras.layers.Dense(4, activation="relu"),
+              keras.layers.Dense(3)]
+    tmp = inputs
+    for layer in layers:
+        tmp = layer(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=tmp)
+    model.set_weights([np.random.randn(*w.shape)
+                       for w in model.get_weights()])
+    x = np.random.rand(6, 4)
+
+    def conditions(rules):
+        return [((lambda l, s, layer=layer: l is layer), rule)
+                for layer, rule in zip(layers, rules)]
+
+    # The rules of the list are assigned from the last
+    # to the first layer of the model.
+    rules = ["Z", "Epsilon", "WSquare"]
+    analysis = LRP(model, rule=rules).analyze(x)
+    expected = LRP(model, rule=conditions(rules[::-1])).analyze(x)
+    assert np.allclose(analysis, expected)
+    other = LRP(model, rule=conditions(rules)).analyze(x)
+    assert not np.allclose(analysis, other)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__LRP__freeze_weights():
+
+    def method(model, **kwargs):
+        return LRPAlpha2Beta1(model, input_layer_rule=(-1, 1), **kwargs)
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+
+        analyzer = method(model, freeze_weights=True)
+        assert np.allclose(analyzer.analyze(x), method(model).analyze(x))
+
+        # The frozen weights are only updated on request.
+        model.set_weights([w * -2 for w in model.get_weights()])
+        analyzer.refresh_weights()
+        assert np.allclose(analyzer.analyze(x), method(model).analyze(x))
+
+
+@pytest.mark.precommit
+def test_precommit__LRP__precision():
+
+    for network in networks.iterator("mnist.*:cifar10.*",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(16, *(network["input_shape"][1:]))
+        y = np.max(model.predict_on_batch(x), axis=1)
+        # Each layer adds a relative rounding error in the order
+        # of the machine epsilon.
+        tolerance = len(model.layers) * np.finfo(np.float16).eps
+
+        for method in [LRPEpsilon, LRPAlpha1Beta0]:
+            errors = {}
+            for precision in [None, "float16"]:
+                analyzer = method(model, precision=precision)
+                analysis = analyzer.analyze(x)
+                assert analysis.dtype == np.dtype(K.floatx())
+                assert np.all(np.isfinite(analysis))
+
+                # Relevance lost or created w.r.t. the explained output.
+                relevance = analysis.reshape((len(x), -1)).sum(axis=1)
+                errors[precision] = np.mean(np.abs(relevance-y) /
+                                            (np.abs(y)+K.epsilon()))
+
+            assert errors["float16"] <= errors[None]+tolerance
+
+
+@pytest.mark.slow
+@pytest.mark.application
+@pytest.mark.imagenet
+def test_imagenet__LRP__precision_benchmark():
+
+    n_calls = 10
+    for network in networks.iterator("imagenet.vgg16", clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(8, *(network["input_shape"][1:]))
+
+        def get_convolutions():
+            return [op for op in iK.get_graph().get_operations()
+                    if op.type.startswith("Conv2D")]
+
+        durations = {}
+        for precision in [None, "float16"]:
+            n_convolutions = len(get_convolutions())
+            analyzer = LRPEpsilon(model, precision=precision)
+            analyzer.analyze(x)
+            if precision is not None:
+                # The forward and the reverse convolutions
+                # are computed in the reduced precision.
+                convolutions = get_convolutions()[n_convolutions:]
+                assert len(convolutions) > 0
+                assert all(op.outputs[0].dtype.name == precision
+                           for op in convolutions)
+
+            t_start = time.time()
+            for _ in range(n_calls):
+                analyzer.analyze(x)
+            durations[precision] = (time.time()-t_start)/n_calls
+
+        # Only GPUs with float16 support are faster, thus not asserted.
+        print("%s: speedup with float16 %.2fx" %
+              (network["name"], durations[None]/durations["float16"]))
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
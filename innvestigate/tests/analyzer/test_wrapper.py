@@ -8,10 +8,14 @@ from __future__ import\
 ###############################################################################
 
 
+import keras.layers
+import keras.models
+import numpy as np
 import pytest
 
 
 from innvestigate.utils.tests import dryrun
+from innvestigate.utils.tests import networks
 
 from innvestigate.analyzer import WrapperBase
 from innvestigate.analyzer import AugmentReduceBase
@@ -155,3 +159,57 @@ def test_fast__SerializePathIntegrator():
         return PathIntegrator(Gradient(model))
 
     dryrun.test_serialize_analyzer(method, "trivia.*:mnist.log_reg")
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__PathIntegrator_neuron_selection_max():
+
+    for network in networks.iterator("trivia.*:mnist.log_reg",
+                                     clear_sessions=True):
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        x = np.random.rand(3, *(network["input_shape"][1:]))
+        indices = np.argmax(model.predict(x).reshape((3, -1)), axis=1)
+
+        analyzer = PathIntegrator(Gradient(model))
+        index_analyzer = PathIntegrator(
+            Gradient(model, neuron_selection_mode="index"))
+
+        analysis = analyzer.analyze(x)
+        assert np.allclose(analysis, index_analyzer.analyze(x, indices))
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__PathIntegrator_neuron_selection_max_forward_pass():
+
+    inputs = keras.layers.Input(shape=(4,))
+    tmp = keras.layers.Dense(5, activation="relu")(inputs)
+    outputs = keras.layers.Dense(3)(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=outputs)
+    x = np.random.rand(6, 4)
+    indices = np.argmax(model.predict(x), axis=1)
+
+    analyzer = PathIntegrator(Gradient(model), steps=4)
+    index_analyzer = PathIntegrator(
+        Gradient(model, neuron_selection_mode="index"), steps=4)
+    assert np.allclose(analyzer.analyze(x),
+                       index_analyzer.analyze(x, indices))
+
+    def get_ops(tensors):
+        ret, stack = set(), [t.op for t in tensors]
+        while len(stack) > 0:
+            op = stack.pop()
+            if op not in ret:
+                ret.add(op)
+                stack += [t.op for t in op.inputs]
+        return ret
+
+    # The neurons are selected on the augmented forward pass, i.e.,
+    # the model is not applied on the inputs themselves.
+    ops = get_ops(analyzer._subanalyzer._analyzer_model.outputs)
+    assert not any(t is inputs for op in ops if op.type == "MatMul"
+                   for t in op.inputs)
+    # One forward pass on the augmented inputs.
+    assert len([op for op in ops if op.type == "Relu"]) == 1
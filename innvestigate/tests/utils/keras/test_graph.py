@@ -8,10 +8,15 @@ from __future__ import\
 ###############################################################################
 
 
+import keras.backend as K
+import keras.layers
 import keras.models
+import numpy as np
 import pytest
+import time
 
 
+from innvestigate import layers as ilayers
 from innvestigate.utils.keras import graph as kgraph
 from innvestigate.utils.tests import networks
 
@@ -78,3 +83,216 @@ def test_fast__get_model_execution_graph_with_inputs():
         graph = kgraph.get_model_execution_graph(model,
                                                  keep_input_layers=True)
         kgraph.print_model_execution_graph(graph)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__get_pre_activation_tensors():
+
+    inputs = keras.layers.Input(shape=(4,))
+    x = np.random.rand(3, 4)
+
+    for activation in [None, "relu", "tanh"]:
+        layer = keras.layers.Dense(5, activation=activation)
+        Ys = layer(inputs)
+        Zs = kgraph.get_pre_activation_tensors(layer, Ys)
+
+        layer_wo_act = kgraph.copy_layer_wo_activation(layer)
+        expected = layer_wo_act(inputs)
+        f = K.function([inputs], Zs+[expected])
+        z, e = f([x])
+        assert np.allclose(z, e)
+
+        assert kgraph.get_pre_activation_tensors(
+            layer, Ys, keep_bias=False) is None
+
+    # Custom activations might end with an activation operation
+    # whose input is not the pre-activation.
+    for activation in [lambda x: K.tanh(2 * x),
+                       lambda x: K.relu(x - 1)]:
+        layer = keras.layers.Dense(5, activation=activation)
+        Ys = layer(inputs)
+        assert kgraph.get_pre_activation_tensors(layer, Ys) is None
+
+
+def _gradient_wrt_layer(layer, X, explicit):
+    Y = layer(X)
+    known_Y = keras.layers.Lambda(lambda x: x * 0 + 0.5)(Y)
+    if explicit:
+        grad = kgraph.get_gradient_wrt_layer(layer, 1)
+        assert isinstance(grad, ilayers.ExplicitGradientWRT)
+    else:
+        grad = ilayers.GradientWRT(1)
+    return grad([X, Y, known_Y])
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__get_gradient_wrt_layer():
+
+    cases = [
+        ((7,), keras.layers.Dense(4)),
+        ((6, 3), keras.layers.Dense(4)),
+        ((9, 3), keras.layers.Conv1D(4, 3, strides=2)),
+        ((9, 9, 3), keras.layers.Conv2D(4, (3, 3))),
+        ((9, 9, 3), keras.layers.Conv2D(4, (3, 2), strides=(2, 2),
+                                        padding="same")),
+        ((5, 5, 5, 2), keras.layers.Conv3D(3, (2, 2, 2), strides=2)),
+        ((9, 9, 3), keras.layers.MaxPooling2D()),
+        ((9, 9, 3), keras.layers.AveragePooling2D((3, 3), padding="same")),
+    ]
+    for shape, layer in cases:
+        X = keras.layers.Input(shape=shape)
+        outputs = [_gradient_wrt_layer(layer, X, explicit)
+                   for explicit in [False, True]]
+        model = keras.models.Model(inputs=X, outputs=outputs)
+
+        x = np.random.rand(2, *shape)
+        expected, explicit = model.predict_on_batch(x)
+        assert explicit.shape == x.shape
+        assert np.allclose(expected, explicit, rtol=1e-4, atol=1e-5)
+
+    # Layers with activations are not supported.
+    layer = keras.layers.Dense(4, activation="relu")
+    layer(keras.layers.Input(shape=(7,)))
+    assert isinstance(kgraph.get_gradient_wrt_layer(layer, 1),
+                      ilayers.GradientWRT)
+
+
+def _set_random_weights(model):
+    weights = [np.random.rand(*w.shape)+0.5 for w in model.get_weights()]
+    model.set_weights(weights)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__fold_batch_normalization():
+
+    inputs = keras.layers.Input(shape=(8, 8, 3))
+    tmp = keras.layers.Conv2D(4, (3, 3))(inputs)
+    tmp = keras.layers.BatchNormalization()(tmp)
+    tmp = keras.layers.Activation("relu")(tmp)
+    # Not foldable due to the activation.
+    tmp = keras.layers.Conv2D(4, (3, 3), activation="relu")(tmp)
+    tmp = keras.layers.BatchNormalization()(tmp)
+    tmp = keras.layers.Flatten()(tmp)
+    tmp = keras.layers.Dense(5, use_bias=False)(tmp)
+    tmp = keras.layers.BatchNormalization(center=False)(tmp)
+    model = keras.models.Model(inputs=inputs, outputs=tmp)
+    _set_random_weights(model)
+
+    folded_model = kgraph.fold_batch_normalization(model)
+    assert kgraph.fold_batch_normalization(model) is folded_model
+    n_batch_normalization_layers = len([
+        layer for layer in folded_model.layers
+        if isinstance(layer, keras.layers.BatchNormalization)])
+    assert n_batch_normalization_layers == 1
+
+    x = np.random.rand(2, 8, 8, 3)
+    assert np.allclose(model.predict_on_batch(x),
+                       folded_model.predict_on_batch(x),
+                       rtol=1e-4, atol=1e-5)
+
+    # The folded layers keep the names of the kernel layers.
+    _, layer_names = kgraph.fold_batch_normalization(
+        model, return_layer_names=True)
+    kernel_layers = [layer for layer in model.layers
+                     if isinstance(layer, (keras.layers.Conv2D,
+                                           keras.layers.Dense))]
+    assert ([layer.name for layer in kernel_layers] ==
+            [layer.name for layer in folded_model.layers
+             if isinstance(layer, (keras.layers.Conv2D,
+                                   keras.layers.Dense))])
+    assert layer_names == {
+        model.layers[2].name: [kernel_layers[0].name],
+        model.layers[-1].name: [kernel_layers[-1].name]}
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__trace_model_execution_cache():
+
+    network_filter = "trivia.*:mnist.log_reg"
+
+    for network in networks.iterator(network_filter):
+
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+
+        trace = kgraph.trace_model_execution(model)
+        assert kgraph.trace_model_execution(model) is trace
+
+        kgraph.invalidate_model_cache(model)
+        new_trace = kgraph.trace_model_execution(model)
+        assert new_trace is not trace
+        assert [x[0] for x in new_trace[1]] == [x[0] for x in trace[1]]
+
+
+@pytest.mark.slow
+@pytest.mark.application
+@pytest.mark.imagenet
+def test_imagenet__trace_model_execution_benchmark():
+
+    network_filter = "imagenet.*"
+
+    results = []
+    for network in networks.iterator(network_filter, clear_sessions=True):
+
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+
+        start = time.time()
+        _, execution_list, _ = kgraph.trace_model_execution(model)
+        duration = time.time()-start
+
+        results.append((network["name"], len(execution_list), duration))
+        print("%s: %i nodes traced in %.3fs" % results[-1])
+
+    # The time per node should not grow with the network size.
+    results = sorted(results, key=lambda x: x[1])
+    time_per_node = [duration/n for _, n, duration in results]
+    smallest, largest = results[0][1], results[-1][1]
+    assert time_per_node[-1] < max(time_per_node[0], 1e-4)*(
+        largest/float(smallest))**0.5
+
+
+@pytest.mark.slow
+@pytest.mark.application
+@pytest.mark.imagenet
+def test_imagenet__get_gradient_wrt_layer_benchmark():
+
+    def run(model, explicit):
+        X = model.inputs[0]
+        outputs = []
+        start = time.time()
+        for layer in model.layers[1:]:
+            if not ilayers.ExplicitGradientWRT.is_supported(layer):
+                continue
+            tmp = layer.get_input_at(0)
+            outputs.append(_gradient_wrt_layer(layer, tmp, explicit))
+        build_duration = time.time()-start
+
+        grad_model = keras.models.Model(inputs=X, outputs=outputs)
+        x = np.random.rand(1, *K.int_shape(X)[1:])
+        grad_model.predict_on_batch(x)
+        start = time.time()
+        for _ in range(3):
+            grad_model.predict_on_batch(x)
+        run_duration = (time.time()-start)/3
+        return len(outputs), build_duration, run_duration
+
+    for network in networks.iterator("imagenet.vgg16", clear_sessions=True):
+        # Remove the activations to make all kernel layers supported.
+        model = keras.models.Model(inputs=network["in"],
+                                   outputs=network["out"])
+        for layer in model.layers:
+            if hasattr(layer, "activation"):
+                layer.activation = keras.activations.get("linear")
+
+        n, gradient_build, gradient_run = run(model, False)
+        n, explicit_build, explicit_run = run(model, True)
+        assert n > 0
+        print("%s: %i layers, build: %.3fs (gradient) vs %.3fs (explicit), "
+              "run: %.3fs (gradient) vs %.3fs (explicit)" %
+              (network["name"], n, gradient_build, explicit_build,
+               gradient_run, explicit_run))
@@ -30,3 +30,15 @@ def test_fast__visualizations():
     ivis.graymap(get_X())
     ivis.gamma(get_X())
     ivis.clip_quantile(get_X(), 0.95)
+
+
+@pytest.mark.fast
+@pytest.mark.precommit
+def test_fast__get_cmap_lut():
+    X = np.random.rand(1, 28, 28, 3)
+    tmp = ivis.project(X.sum(axis=-1), output_range=(0, 255))
+
+    lut = ivis.get_cmap_lut()
+    assert lut.shape == (256, 3) and lut.dtype == np.uint8
+    assert np.allclose(lut[tmp.astype(np.int64)],
+                       np.round(ivis.heatmap(X)*255))
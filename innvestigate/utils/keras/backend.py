@@ -9,16 +9,32 @@ from builtins import zip
 ###############################################################################
 
 
+import contextlib
 import keras.backend as K
+import keras.backend.common
+import numpy as np
 
 
 __all__ = [
     "to_floatx",
+    "floatx_scope",
+    "to_accumulation_dtype",
+    "from_accumulation_dtype",
+    "get_graph",
+    "count_graph_ops",
+    "get_session_scope",
     "gradients",
+    "conv_transpose",
+    "pool2d_gradient",
     "is_not_finite",
+    "get_activation_input",
     "extract_conv2d_patches",
     "gather",
     "gather_nd",
+    "batch_gather",
+    "top_k",
+    "freeze_graph",
+    "import_graph",
 ]
 
 
@@ -31,6 +47,93 @@ def to_floatx(x):
     return K.cast(x, K.floatx())
 
 
+@contextlib.contextmanager
+def floatx_scope(dtype):
+    """Sets the default float type of Keras within the scope.
+
+    Unlike K.set_floatx this also accepts 'bfloat16'.
+    """
+    # K.set_floatx does not accept bfloat16.
+    old_dtype = keras.backend.common._FLOATX
+    keras.backend.common._FLOATX = dtype
+    try:
+        yield
+    finally:
+        keras.backend.common._FLOATX = old_dtype
+
+
+# Types with a reduced precision, in which sums and divisions
+# should not be computed.
+_REDUCED_PRECISION_DTYPES = ["float16", "bfloat16"]
+
+
+def to_accumulation_dtype(x):
+    """Casts x to float32 if it has a reduced precision."""
+    if K.dtype(x) in _REDUCED_PRECISION_DTYPES:
+        return K.cast(x, "float32")
+    else:
+        return x
+
+
+def from_accumulation_dtype(x, dtype):
+    """Casts x back to dtype, clipping values outside its finite range."""
+    if K.dtype(x) == dtype:
+        return x
+    if dtype == "float16":
+        max_value = float(np.finfo(np.float16).max)
+        x = K.clip(x, -max_value, max_value)
+    return K.cast(x, dtype)
+
+
+def get_graph():
+    """Returns the graph in which the Keras tensors are created.
+
+    Only the TensorFlow backend has a notion of graphs,
+    otherwise None is returned.
+    """
+    backend = K.backend()
+    if backend == "tensorflow":
+        # no global import => do not break if module is not present
+        import tensorflow
+        return tensorflow.get_default_graph()
+    else:
+        return None
+
+
+def count_graph_ops():
+    """Returns the number of operations in the current graph or None.
+
+    Operations are never removed from a graph, thus the difference of two
+    calls is the number of operations created in between.
+    """
+    graph = get_graph()
+    if graph is None:
+        return None
+    # Counts the created operations in constant time,
+    # unlike len(graph.get_operations()).
+    return graph.version
+
+
+@contextlib.contextmanager
+def _session_scope(graph, session):
+    if graph is None:
+        yield
+    else:
+        with graph.as_default(), session.as_default():
+            yield
+
+
+def get_session_scope():
+    """Captures the current graph and session.
+
+    :return: A context manager that sets the captured graph and session
+      as defaults, e.g., to run Keras functions in another thread.
+    """
+    graph = get_graph()
+    session = K.get_session() if graph is not None else None
+    return _session_scope(graph, session)
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -66,6 +169,100 @@ def gradients(Xs, Ys, known_Ys):
         raise NotImplementedError()
 
 
+def _get_output_shape(x):
+    # Keep the static dimensions to preserve the static shape.
+    dynamic_shape = K.shape(x)
+    return [dynamic_shape[i] if dim is None else dim
+            for i, dim in enumerate(K.int_shape(x))]
+
+
+def conv_transpose(x, kernel, output_like, strides,
+                   padding="valid", data_format=None):
+    """Transposed convolution for 1D, 2D and 3D convolutions.
+
+    Computes the gradient of a convolution with the given kernel
+    wrt to its input, i.e., the input has the shape of the
+    convolution's output.
+
+    :param x: Input tensor.
+    :param kernel: Kernel of the forward convolution.
+    :param output_like: Tensor with the shape of the forward
+      convolution's input.
+    :param strides: Strides of the forward convolution.
+    :param padding: Padding of the forward convolution.
+    :param data_format: Data format of the forward convolution.
+    :return: The transposed convolution of x.
+    """
+    output_shape = _get_output_shape(output_like)
+    ndim = K.ndim(kernel)-2
+    if ndim == 1:
+        # Use a 2D convolution with a height of one.
+        if data_format == "channels_first":
+            axis = 2
+        else:
+            axis = 1
+        x = K.expand_dims(x, axis=axis)
+        kernel = K.expand_dims(kernel, axis=0)
+        output_shape = output_shape[:axis]+[1]+output_shape[axis:]
+        ret = K.conv2d_transpose(x, kernel, output_shape,
+                                 strides=(1,)+tuple(strides),
+                                 padding=padding,
+                                 data_format=data_format)
+        return K.squeeze(ret, axis=axis)
+    elif ndim == 2:
+        return K.conv2d_transpose(x, kernel, output_shape,
+                                  strides=tuple(strides),
+                                  padding=padding,
+                                  data_format=data_format)
+    elif ndim == 3:
+        return K.conv3d_transpose(x, kernel, output_shape,
+                                  strides=tuple(strides),
+                                  padding=padding,
+                                  data_format=data_format)
+    else:
+        raise ValueError("Only 1D, 2D and 3D convolutions are supported.")
+
+
+def pool2d_gradient(x, y, known_y, pool_size, strides,
+                    padding="valid", pool_mode="max"):
+    """Gradient of a 2D pooling operation wrt to its input.
+
+    Works only for the data format channels_last.
+
+    :param x: Input of the pooling operation.
+    :param y: Output of the pooling operation.
+    :param known_y: Gradient for y.
+    :param pool_size: Pool size of the pooling operation.
+    :param strides: Strides of the pooling operation.
+    :param padding: Padding of the pooling operation.
+    :param pool_mode: Either 'max' or 'avg'.
+    :return: The gradient for x.
+    """
+    backend = K.backend()
+    if backend == "theano":
+        # todo: add theano function.
+        raise NotImplementedError()
+    elif backend == "tensorflow":
+        # no global import => do not break if module is not present
+        from tensorflow.python.ops import gen_nn_ops
+
+        ksize = [1]+list(pool_size)+[1]
+        strides = [1]+list(strides)+[1]
+        if pool_mode == "max":
+            ret = gen_nn_ops.max_pool_grad(x, y, known_y, ksize, strides,
+                                           padding.upper())
+        elif pool_mode == "avg":
+            ret = gen_nn_ops.avg_pool_grad(K.shape(x), known_y,
+                                           ksize, strides, padding.upper())
+        else:
+            raise ValueError("Invalid pool_mode: %s" % pool_mode)
+        ret.set_shape(K.int_shape(x))
+        return ret
+    else:
+        # todo: add cntk
+        raise NotImplementedError()
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -95,6 +292,29 @@ def is_not_finite(x):
 ###############################################################################
 
 
+# Operations that compute an element-wise activation on their only input.
+_ACTIVATION_OPS = ["Relu", "Relu6", "Elu", "Selu", "Sigmoid", "Tanh",
+                   "Softplus", "Softsign"]
+
+
+def get_activation_input(x):
+    """Returns the input of the activation function that computed x.
+
+    Only single, element-wise activation operations are detected.
+    If x was not computed by one, None is returned.
+    The caller needs to make sure that the activation function
+    consists only of this operation, e.g., for
+    lambda x: K.tanh(2*x) the input of Tanh is returned.
+    """
+    backend = K.backend()
+    if backend == "tensorflow":
+        if getattr(x, "op", None) is None or x.op.type not in _ACTIVATION_OPS:
+            return None
+        return x.op.inputs[0]
+    else:
+        return None
+
+
 def extract_conv2d_patches(x, kernel_shape, strides, rates, padding):
     """Extracts conv2d patches like TF function extract_image_patches.
 
@@ -169,3 +389,109 @@ def gather_nd(x, indices):
     else:
         # todo: add cntk
         raise NotImplementedError()
+
+
+def batch_gather(x, indices):
+    """Gathers for each sample the given indices along the second axis.
+
+    Works as TensorFlow's batch_gather for 2D tensors,
+    i.e., ret[i, j] = x[i, indices[i, j]].
+    """
+    backend = K.backend()
+    if backend == "theano":
+        # todo: add theano function.
+        raise NotImplementedError()
+    elif backend == "tensorflow":
+        # no global import => do not break if module is not present
+        import tensorflow
+
+        n, k = tensorflow.shape(indices)[0], tensorflow.shape(indices)[1]
+        sample_indices = tensorflow.tile(
+            tensorflow.expand_dims(tensorflow.range(n), 1), [1, k])
+        indices = tensorflow.stack(
+            [sample_indices, tensorflow.cast(indices, "int32")], axis=-1)
+        return tensorflow.gather_nd(x, indices)
+    else:
+        # todo: add cntk
+        raise NotImplementedError()
+
+
+def top_k(x, k):
+    """Returns the k largest values along the last axis and their indices.
+
+    Works as TensorFlow's top_k, i.e., the values are sorted
+    in descending order.
+    """
+    backend = K.backend()
+    if backend == "theano":
+        # todo: add theano function.
+        raise NotImplementedError()
+    elif backend == "tensorflow":
+        # no global import => do not break if module is not present
+        import tensorflow
+
+        values, indices = tensorflow.nn.top_k(x, k=k)
+        return values, indices
+    else:
+        # todo: add cntk
+        raise NotImplementedError()
+
+
+###############################################################################
+###############################################################################
+###############################################################################
+
+
+def freeze_graph(outputs):
+    """Serializes the graph that computes the outputs.
+
+    All variables are converted to constants.
+
+    :param outputs: List of output tensors.
+    :return: The serialized graph definition.
+    """
+    backend = K.backend()
+    if backend == "theano":
+        # todo: add theano function.
+        raise NotImplementedError()
+    elif backend == "tensorflow":
+        # no global import => do not break if module is not present
+        import tensorflow
+
+        session = K.get_session()
+        graph_def = tensorflow.graph_util.convert_variables_to_constants(
+            session,
+            session.graph.as_graph_def(),
+            [x.op.name for x in outputs])
+        return graph_def.SerializeToString()
+    else:
+        # todo: add cntk
+        raise NotImplementedError()
+
+
+def import_graph(graph_def, input_map, output_names, name="import"):
+    """Imports a graph serialized with :func:`freeze_graph`.
+
+    :param graph_def: The serialized graph definition.
+    :param input_map: Maps the names of input tensors to new tensors.
+    :param output_names: The names of the tensors to return.
+    :param name: Name scope of the imported graph.
+    :return: The list of output tensors.
+    """
+    backend = K.backend()
+    if backend == "theano":
+        # todo: add theano function.
+        raise NotImplementedError()
+    elif backend == "tensorflow":
+        # no global import => do not break if module is not present
+        import tensorflow
+
+        tmp = tensorflow.GraphDef()
+        tmp.ParseFromString(graph_def)
+        return tensorflow.import_graph_def(tmp,
+                                           input_map=input_map,
+                                           return_elements=output_names,
+                                           name=name)
+    else:
+        # todo: add cntk
+        raise NotImplementedError()
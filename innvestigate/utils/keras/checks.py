@@ -401,6 +401,8 @@ def is_input_layer(layer, ignore_reshape_layers=True):
     # Note: In the sequential api the Sequential object
     # adds the Input layer if the user does not.
     kgraph = get_kgraph()
+    # Prevents circular imports.
+    from ... import layers as ilayers
 
     layer_inputs = kgraph.get_input_layers(layer)
     # We ignore certain layers, that do not modify
@@ -410,6 +412,7 @@ def is_input_layer(layer, ignore_reshape_layers=True):
         keras.layers.Flatten,
         keras.layers.Permute,
         keras.layers.Reshape,
+        ilayers.Cast,
     )
     while any([isinstance(x, IGNORED_LAYERS) for x in layer_inputs]):
         tmp = set()
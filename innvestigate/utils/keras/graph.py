@@ -11,13 +11,17 @@ import six
 
 
 import inspect
+import keras.activations
 import keras.backend as K
 import keras.engine.topology
 import keras.layers
 import keras.models
 import numpy as np
+import time
+import weakref
 
 
+from . import backend as iK
 from . import checks as kchecks
 from ... import layers as ilayers
 from ... import utils as iutils
@@ -30,13 +34,19 @@ __all__ = [
     "get_layer_outbound_count",
     "get_layer_neuronwise_io",
     "copy_layer_wo_activation",
+    "get_pre_activation_tensors",
+    "get_gradient_wrt_layer",
     "copy_layer",
     "pre_softmax_tensors",
     "model_wo_softmax",
+    "fold_batch_normalization",
+    "cast_model",
 
     "get_model_layers",
     "model_contains",
 
+    "get_model_cache",
+    "invalidate_model_cache",
     "trace_model_execution",
     "get_model_execution_trace",
     "get_model_execution_graph",
@@ -239,7 +249,8 @@ def update_symbolic_weights(layer, weight_mapping):
 def get_layer_from_config(old_layer,
                           new_config,
                           weights=None,
-                          reuse_symbolic_tensors=True):
+                          reuse_symbolic_tensors=True,
+                          input_shapes=None):
     """Creates a new layer from a config
 
     Creates a new layer given a changed config and weights etc.
@@ -252,6 +263,8 @@ def get_layer_from_config(old_layer,
     :param reuse_symbolic_tensors: If the weights of the
       old_layer are used copy the symbolic ones or copy
       the Numpy weights.
+    :param input_shapes: The input shapes to build the new layer with.
+      If None the input shapes of old_layer are used.
     :return: The new layer instance.
     """
     new_layer = old_layer.__class__.from_config(new_config)
@@ -263,7 +276,8 @@ def get_layer_from_config(old_layer,
             weights = old_layer.get_weights()
 
     if len(weights) > 0:
-        input_shapes = old_layer.get_input_shape_at(0)
+        if input_shapes is None:
+            input_shapes = old_layer.get_input_shape_at(0)
         # todo: inspect and set initializers to something fast for speedup
         new_layer.build(input_shapes)
 
@@ -275,7 +289,7 @@ def get_layer_from_config(old_layer,
                 raise ValueError("Expect either all weights to be "
                                  "np tensors or symbolic tensors.")
 
-            symbolic_names = get_symbolic_weight_names(old_layer)
+            symbolic_names = get_symbolic_weight_names(new_layer)
             update = {name: weight
                       for name, weight in zip(symbolic_names, weights)}
             update_symbolic_weights(new_layer, update)
@@ -320,6 +334,90 @@ def copy_layer_wo_activation(layer,
     return get_layer_from_config(layer, config, weights=weights, **kwargs)
 
 
+# Activation functions that are computed by a single element-wise
+# operation, i.e., its input is the pre-activation.
+# See :func:`innvestigate.utils.keras.backend.get_activation_input`.
+_SINGLE_OP_ACTIVATIONS = [
+    keras.activations.elu,
+    keras.activations.relu,
+    keras.activations.sigmoid,
+    keras.activations.softplus,
+    keras.activations.softsign,
+    keras.activations.tanh,
+]
+
+
+def get_pre_activation_tensors(layer, Ys, keep_bias=True):
+    """Returns the layer's outputs before the activation is applied.
+
+    The tensors are recovered from the forward pass, i.e., this is
+    equivalent to applying the copy created by
+    :func:`copy_layer_wo_activation` without computing the layer again.
+
+    :param layer: The layer that computed Ys.
+    :param Ys: The output tensors of the layer.
+    If Ys were created by reapplying the layer on repeated inputs,
+    see parameter repeat_reference of :func:`reverse_model`, and the
+    gradient of the layer without activation is computed explicitly,
+    see :class:`innvestigate.layers.ExplicitGradientWRT`, the repeated
+    tensors of the forward pass are returned. They are not connected
+    to the layer's inputs in the graph.
+
+    :param keep_bias: Keep a potential bias.
+    :return: The tensors or None if they cannot be recovered,
+      e.g., because the bias should be removed or the activation
+      is not a single element-wise operation.
+    """
+    Ys = iutils.to_list(Ys)
+    if keep_bias is False and getattr(layer, "use_bias", False):
+        return None
+
+    repeated = [getattr(Y, "_iNNvestigate_repeated", None) for Y in Ys]
+    if(None not in repeated and
+       ilayers.ExplicitGradientWRT.is_supported(layer,
+                                                ignore_activation=True)):
+        tmp = get_pre_activation_tensors(layer, [Y for Y, _ in repeated],
+                                         keep_bias=keep_bias)
+        if tmp is not None:
+            return [ilayers.BatchRepeat()([x, reference])
+                    for x, (_, reference) in zip(tmp, repeated)]
+
+    if not kchecks.contains_activation(layer):
+        # Nothing to remove.
+        return Ys
+    if not hasattr(layer, "activation"):
+        # Activation layers.
+        return None
+    if layer.activation in (None, keras.activations.linear):
+        return Ys
+    if layer.activation not in _SINGLE_OP_ACTIVATIONS:
+        # E.g., custom activations like lambda x: K.relu(x-1) end with
+        # an activation operation, but its input is not the
+        # pre-activation.
+        return None
+    if any(iK.get_activation_input(Y) is None for Y in Ys):
+        return None
+    return [ilayers.ActivationInput()(Y) for Y in Ys]
+
+
+def get_gradient_wrt_layer(layer, n_inputs):
+    """Returns a layer that computes the gradient wrt to the inputs of layer.
+
+    The returned layer has the same interface as
+    :class:`innvestigate.layers.GradientWRT`. If possible, it computes
+    the gradient with explicit reverse operations, see
+    :class:`innvestigate.layers.ExplicitGradientWRT`.
+
+    :param layer: The layer that computes the outputs.
+    :param n_inputs: The number of inputs of the layer.
+    :return: The gradient layer.
+    """
+    if n_inputs == 1 and ilayers.ExplicitGradientWRT.is_supported(layer):
+        return ilayers.ExplicitGradientWRT(layer)
+    else:
+        return ilayers.GradientWRT(n_inputs)
+
+
 def copy_layer(layer,
                keep_bias=True,
                name_template=None,
@@ -384,6 +482,209 @@ def model_wo_softmax(model):
                               name=model.name)
 
 
+def _get_folded_layer(layer, bn_layer, name):
+    # Scale and shift the outputs of layer as the batch normalization
+    # does in inference mode.
+    factor = 1 / K.sqrt(bn_layer.moving_variance + bn_layer.epsilon)
+    if bn_layer.scale:
+        factor = factor * bn_layer.gamma
+    kernel = layer.kernel * factor
+    if layer.use_bias:
+        bias = layer.bias
+    else:
+        bias = 0
+    bias = (bias - bn_layer.moving_mean) * factor
+    if bn_layer.center:
+        bias = bias + bn_layer.beta
+
+    config = layer.get_config()
+    config["name"] = name
+    config["use_bias"] = True
+    return get_layer_from_config(layer, config, weights=[kernel, bias])
+
+
+def fold_batch_normalization(model, return_layer_names=False):
+    """Folds batch normalization layers into the preceding layers.
+
+    Creates a new model in which each batch normalization layer that
+    normalizes the output channels of a Dense or convolutional layer
+    without activation is merged into that layer. The batch normalization
+    is considered in inference mode, i.e., the moving statistics are used.
+    A merged layer keeps the name of the Dense or convolutional layer
+    unless that layer is shared, and computes its weights from the
+    symbolic weights of both layers. The other layers are reused.
+    The result is memoized, see :func:`get_model_cache`.
+
+    :param model: A Keras model.
+    :param return_layer_names: Also return a dict that maps the names
+      of merged layers, whose outputs are computed by differently named
+      layers in the new model, on the names of these layers.
+    :return: The new model or model if there is nothing to fold.
+      If return_layer_names is true, a tuple of the model and the dict.
+    """
+    cache = get_model_cache(model)
+    key = "batch_normalization_folded"
+    if key not in cache:
+        cache[key] = _fold_batch_normalization(model)
+    ret, layer_names = cache[key]
+    if return_layer_names:
+        return ret, {k: list(v) for k, v in six.iteritems(layer_names)}
+    return ret
+
+
+def _fold_batch_normalization(model):
+
+    from . import apply as kapply
+    _, execution_list, outputs = trace_model_execution(model)
+
+    # Use ids for constant time lookups.
+    producers, n_uses, n_calls = {}, {}, {}
+    for layer, Xs, Ys in execution_list:
+        n_calls[id(layer)] = n_calls.get(id(layer), 0) + 1
+        for x in iutils.to_list(Xs):
+            n_uses[id(x)] = n_uses.get(id(x), 0) + 1
+        for y in iutils.to_list(Ys):
+            producers[id(y)] = layer
+    output_ids = set(id(x) for x in outputs)
+
+    linear_activations = [None, keras.activations.get("linear")]
+    kernel_layers = (keras.layers.Dense,
+                     keras.layers.Conv1D,
+                     keras.layers.Conv2D,
+                     keras.layers.Conv3D)
+    # Maps the output of a foldable layer to the batch normalization.
+    folds = {}
+    for layer, Xs, Ys in execution_list:
+        Xs = iutils.to_list(Xs)
+        if not kchecks.is_batch_normalization_layer(layer) or len(Xs) != 1:
+            continue
+        x = Xs[0]
+        producer = producers.get(id(x), None)
+        if(type(producer) not in kernel_layers or
+           producer.activation not in linear_activations or
+           n_uses[id(x)] != 1 or id(x) in output_ids):
+            continue
+
+        ndim = K.ndim(x)
+        if producer.get_config().get("data_format") == "channels_first":
+            channel_axis = 1
+        else:
+            channel_axis = ndim-1
+        if layer.axis % ndim != channel_axis:
+            continue
+        folds[id(x)] = (layer, iutils.to_list(Ys)[0])
+
+    if len(folds) == 0:
+        return model, {}
+
+    n_folds = {}
+    for layer, Xs, Ys in execution_list:
+        Ys = iutils.to_list(Ys)
+        if len(Ys) == 1 and id(Ys[0]) in folds:
+            n_folds[id(layer)] = n_folds.get(id(layer), 0) + 1
+
+    tensor_mapping = {id(x): x for x in model.inputs}
+    # Maps the names of the merged layers on the names of the new layers.
+    layer_names, folded_names = {}, set()
+    for layer, Xs, Ys in execution_list:
+        Xs, Ys = iutils.to_list(Xs), iutils.to_list(Ys)
+        if isinstance(layer, keras.layers.InputLayer):
+            continue
+        if id(Xs[0]) in folds and kchecks.is_batch_normalization_layer(layer):
+            # Already merged into the preceding layer.
+            continue
+
+        new_Xs = [tensor_mapping[id(x)] for x in Xs]
+        if len(Ys) == 1 and id(Ys[0]) in folds:
+            bn_layer, bn_Y = folds[id(Ys[0])]
+            # A shared layer is folded several times or is also
+            # applied without folding, the copies get new names.
+            name = None
+            if(n_folds[id(layer)] == n_calls[id(layer)] and
+               layer.name not in folded_names):
+                name = layer.name
+            folded_names.add(layer.name)
+            folded_layer = _get_folded_layer(layer, bn_layer, name)
+            tensor_mapping[id(bn_Y)] = kapply(folded_layer, new_Xs)[0]
+            for merged_layer in (layer, bn_layer):
+                if merged_layer.name != folded_layer.name:
+                    layer_names.setdefault(merged_layer.name, []).append(
+                        folded_layer.name)
+        else:
+            new_Ys = iutils.to_list(kapply(layer, new_Xs))
+            tensor_mapping.update({id(k): v for k, v in zip(Ys, new_Ys)})
+
+    ret = keras.models.Model(
+        inputs=model.inputs,
+        outputs=[tensor_mapping[id(x)] for x in outputs],
+        name=model.name)
+    # Layers that are also applied without folding are still present.
+    ret_names = set(layer.name for layer in ret.layers)
+    for k, v in six.iteritems(layer_names):
+        if k in ret_names:
+            v.insert(0, k)
+    return ret, layer_names
+
+
+def cast_model(model, dtype):
+    """Creates a model that computes in another float type.
+
+    The float inputs of the model are cast to dtype. The layers with
+    weights are copied and use the symbolic weights cast to dtype,
+    the other layers are reused. To get tensors of dtype when the new
+    model is reverted, the graph should be built in
+    :func:`innvestigate.utils.keras.backend.floatx_scope`.
+    The result is memoized, see :func:`get_model_cache`.
+
+    :param model: A Keras model.
+    :param dtype: The float type, e.g., 'float16'.
+    :return: The new model.
+    """
+    cache = get_model_cache(model)
+    key = ("cast_model", dtype)
+    if key in cache:
+        return cache[key]
+
+    from . import apply as kapply
+    _, execution_list, outputs = trace_model_execution(model)
+
+    # Use ids for constant time lookups.
+    tensor_mapping = {}
+    cast = ilayers.Cast(dtype)
+    for x in model.inputs:
+        if K.dtype(x).startswith("float") and K.dtype(x) != dtype:
+            tensor_mapping[id(x)] = iutils.to_list(cast(x))[0]
+        else:
+            tensor_mapping[id(x)] = x
+
+    # Shared layers are copied once.
+    layer_copies = {}
+    for layer, Xs, Ys in execution_list:
+        Xs, Ys = iutils.to_list(Xs), iutils.to_list(Ys)
+        if isinstance(layer, keras.layers.InputLayer):
+            continue
+
+        if len(layer.weights) > 0:
+            if id(layer) not in layer_copies:
+                config = layer.get_config()
+                config["dtype"] = dtype
+                weights = [K.cast(x, dtype) for x in layer.weights]
+                layer_copies[id(layer)] = get_layer_from_config(
+                    layer, config, weights=weights)
+            layer = layer_copies[id(layer)]
+
+        new_Xs = [tensor_mapping[id(x)] for x in Xs]
+        new_Ys = iutils.to_list(kapply(layer, new_Xs))
+        tensor_mapping.update({id(k): v for k, v in zip(Ys, new_Ys)})
+
+    ret = keras.models.Model(
+        inputs=model.inputs,
+        outputs=[tensor_mapping[id(x)] for x in outputs],
+        name=model.name)
+    cache[key] = ret
+    return ret
+
+
 ###############################################################################
 ###############################################################################
 ###############################################################################
@@ -392,10 +693,13 @@ def model_wo_softmax(model):
 def get_model_layers(model):
     """Returns all layers of a model."""
     ret = []
+    # Use ids for constant time lookups.
+    collected_ids = set()
 
     def collect_layers(container):
         for layer in container.layers:
-            assert layer not in ret
+            assert id(layer) not in collected_ids
+            collected_ids.add(id(layer))
             ret.append(layer)
             if kchecks.is_network(layer):
                 collect_layers(layer)
@@ -430,6 +734,44 @@ def model_contains(model, layer_condition, return_only_counts=False):
 ###############################################################################
 
 
+# Maps models on (graph, dict) tuples, see get_model_cache.
+_model_caches = weakref.WeakKeyDictionary()
+
+
+def get_model_cache(model):
+    """
+    Returns a dict to memoize values derived from a model,
+    e.g., its execution trace.
+
+    The dict is kept as long as the model exists and is dropped
+    when the Keras graph changes or :func:`invalidate_model_cache`
+    is called.
+
+    :param model: A kera model.
+    """
+    graph = iK.get_graph()
+    entry = _model_caches.get(model, None)
+    if entry is None or entry[0] is not graph:
+        entry = (graph, {})
+        _model_caches[model] = entry
+    return entry[1]
+
+
+def invalidate_model_cache(model=None):
+    """
+    Drops the memoized values of a model.
+
+    Needed when the model's layers are changed in-place.
+
+    :param model: A kera model. If None the values of all models
+      are dropped.
+    """
+    if model is None:
+        _model_caches.clear()
+    else:
+        _model_caches.pop(model, None)
+
+
 def trace_model_execution(model, reapply_on_copied_layers=False):
     """
     Trace and linearize excecution of a model and it's possible containers.
@@ -437,11 +779,23 @@ def trace_model_execution(model, reapply_on_copied_layers=False):
     with (layer, input_tensors, output_tensors), and, possible regenerated,
     outputs of the exectution.
 
+    The trace is memoized per model, i.e., the same triple
+    is returned for subsequent calls and should not be modified.
+    See :func:`invalidate_model_cache`.
+
     :param model: A kera model.
     :param reapply_on_copied_layers: If the execution needs to be linearized,
       reapply with copied layers. Might be slow. Prevents changes of the
       original layer's node lists.
     """
+    cache = get_model_cache(model)
+    key = ("execution_trace", reapply_on_copied_layers)
+    if key not in cache:
+        cache[key] = _trace_model_execution(model, reapply_on_copied_layers)
+    return cache[key]
+
+
+def _trace_model_execution(model, reapply_on_copied_layers):
 
     # Get all layers in model.
     layers = get_model_layers(model)
@@ -545,11 +899,12 @@ def trace_model_execution(model, reapply_on_copied_layers=False):
     # E.g., a layer was also applied outside of the model. Then its
     # node list contains nodes that do not contribute to the model's output.
     # Those nodes are filtered here.
-    used_as_input = [x for x in outputs]
+    # Use ids for constant time lookups.
+    used_as_input = set(id(x) for x in outputs)
     tmp = []
     for l, Xs, Ys in reversed(list(executed_nodes)):
-        if all([y in used_as_input for y in Ys]):
-            used_as_input += Xs
+        if all([id(y) in used_as_input for y in iutils.to_list(Ys)]):
+            used_as_input.update(id(x) for x in iutils.to_list(Xs))
             tmp.append((l, Xs, Ys))
     executed_nodes = list(reversed(tmp))
 
@@ -807,7 +1162,11 @@ def reverse_model(model, reverse_mappings,
                   clip_all_reversed_tensors=False,
                   project_bottleneck_tensors=False,
                   execution_trace=None,
-                  reapply_on_copied_layers=False):
+                  reapply_on_copied_layers=False,
+                  target_tensors=None,
+                  hooks=None,
+                  repeat_reference=None,
+                  repeat_substitutes=None):
     """
     Reverses a Keras model based on the given reverse functions.
     It returns the reverted tensors for the according model inputs.
@@ -837,6 +1196,27 @@ def reverse_model(model, reverse_mappings,
     :param reapply_on_copied_layers: When a model execution needs to
       linearized and copy layers before reapplying them. See
       :func:`trace_model_execution`.
+    :param target_tensors: If given, the reverted tensors for these
+      tensors are returned instead of the ones for the model inputs.
+      Layers that produce these tensors are not reverted,
+      i.e., the reversal stops at the target tensors.
+    :param hooks: An object with the interface of
+      :class:`innvestigate.analyzer.instrumentation.ReverseHooks` that
+      receives the time spent and the number of graph operations created
+      for initializing the reverse mapping of each layer and
+      for reverting each node.
+    :param repeat_reference: If given, a tensor of shape (n, k), where n
+      is the batch size of the model's tensors. Then the model is
+      reverted k times per sample without repeating the forward pass:
+      the reverse mappings get the forward tensors repeated k times
+      along the batch axis and the outputs of the layers applied again
+      on these. The reapplied layers are only computed if a mapping
+      needs their outputs, see also :func:`get_pre_activation_tensors`.
+      The head mapping is applied on the reapplied model outputs and
+      the reverted tensors have the batch size n*k.
+    :param repeat_substitutes: A dict that maps forward tensors on
+      tensors of batch size n*k that should be used instead of
+      repeating them, e.g., for neuron indices that differ per repetition.
     """
 
     # Set default values ######################################################
@@ -912,6 +1292,35 @@ def reverse_model(model, reverse_mappings,
 
         return tmp["final_tensor"]
 
+    if target_tensors is not None:
+        target_tensor_ids = set(id(x) for x in target_tensors)
+
+    # Repeat the forward tensors ##############################################
+
+    from . import apply as kapply
+
+    repeated_tensors = {}
+    if repeat_substitutes is not None:
+        for k, v in six.iteritems(repeat_substitutes):
+            repeated_tensors[id(k)] = v
+    reapplied_tensors = {}
+
+    def repeat(X):
+        if id(X) not in repeated_tensors:
+            repeated_tensors[id(X)] = ilayers.BatchRepeat()(
+                [X, repeat_reference])
+        return repeated_tensors[id(X)]
+
+    def reapply(layer, Xs, Ys):
+        key = tuple(id(Y) for Y in Ys)
+        if key not in reapplied_tensors:
+            tmp = iutils.to_list(kapply(layer, [repeat(X) for X in Xs]))
+            for Y, repeated_Y in zip(Ys, tmp):
+                # Allows to recover values of the forward pass.
+                repeated_Y._iNNvestigate_repeated = (Y, repeat_reference)
+            reapplied_tensors[key] = ([repeat(X) for X in Xs], tmp)
+        return reapplied_tensors[key]
+
     # Reverse the model #######################################################
     _print("Reverse model: {}".format(model))
 
@@ -929,11 +1338,28 @@ def reverse_model(model, reverse_mappings,
 
     # Initialize the reverse mapping functions.
     initialized_reverse_mappings = {}
-    for layer in layers:
+
+    def get_reverse_mapping(layer):
         # A layer can be shared, i.e., applied several times.
         # Allow to share a ReverMappingBase for each layer instance
         # in order to reduce the overhead.
-
+        # The mappings are initialized lazily, i.e., only for layers
+        # that get reverted.
+        if layer not in initialized_reverse_mappings:
+            if hooks is not None:
+                start, n_ops = time.time(), iK.count_graph_ops()
+            initialized_reverse_mappings[layer] = init_reverse_mapping(layer)
+            if hooks is not None:
+                hooks.on_reverse_mapping_init(
+                    layer, time.time()-start, count_new_ops(n_ops))
+        return initialized_reverse_mappings[layer]
+
+    def count_new_ops(n_ops_before):
+        if n_ops_before is None:
+            return None
+        return iK.count_graph_ops()-n_ops_before
+
+    def init_reverse_mapping(layer):
         meta_reverse_mapping = reverse_mappings(layer)
         if meta_reverse_mapping is None:
             reverse_mapping = default_reverse_mapping
@@ -978,7 +1404,7 @@ def reverse_model(model, reverse_mappings,
                 # Nothing meta here
                 reverse_mapping = meta_reverse_mapping
 
-        initialized_reverse_mappings[layer] = reverse_mapping
+        return reverse_mapping
 
     if project_bottleneck_tensors:
         bottleneck_tensors.update(
@@ -988,9 +1414,21 @@ def reverse_model(model, reverse_mappings,
                 execution_list))
 
     # Initialize the reverse tensor mappings.
+    if repeat_reference is None:
+        head_tensors = outputs
+    else:
+        head_tensors = [repeat(tmp) for tmp in outputs]
+        for layer, Xs, Ys in execution_list:
+            if isinstance(layer, keras.layers.InputLayer):
+                continue
+            Xs, Ys = iutils.to_list(Xs), iutils.to_list(Ys)
+            for i, tmp in enumerate(outputs):
+                if tmp in Ys:
+                    _, local_Ys = reapply(layer, Xs, Ys)
+                    head_tensors[i] = local_Ys[Ys.index(tmp)]
     add_reversed_tensors(-1,
                          outputs,
-                         [head_mapping(tmp) for tmp in outputs])
+                         [head_mapping(tmp) for tmp in head_tensors])
 
     # Follow the list and revert the graph.
     for _nid, (layer, Xs, Ys) in enumerate(reverse_execution_list):
@@ -1010,27 +1448,43 @@ def reverse_model(model, reverse_mappings,
                 # reversed tensor set because it depends on a tensor
                 # that is listed in stop_mapping_at_tensors.
                 continue
+            if(target_tensors is not None and
+               any(id(ys) in target_tensor_ids for ys in Ys)):
+                # Stop the reversal at the targets.
+                continue
             reversed_Ys = [get_reversed_tensor(ys)
                            for ys in Ys]
             local_stop_mapping_at_tensors = [x for x in Xs
                                              if x in stop_mapping_at_tensors]
+            local_Xs, local_Ys = Xs, Ys
+            if repeat_reference is not None:
+                local_Xs, local_Ys = reapply(layer, Xs, Ys)
+                local_stop_mapping_at_tensors = [
+                    repeat(x) for x in local_stop_mapping_at_tensors]
 
             _print("  [NID: {}] Reverse layer-node {}".format(nid, layer))
-            reverse_mapping = initialized_reverse_mappings[layer]
+            reverse_mapping = get_reverse_mapping(layer)
+            if hooks is not None:
+                start, n_ops = time.time(), iK.count_graph_ops()
             reversed_Xs = reverse_mapping(
-                Xs, Ys, reversed_Ys,
+                local_Xs, local_Ys, reversed_Ys,
                 {
                     "nid": nid,
                     "model": model,
                     "layer": layer,
                     "stop_mapping_at_tensors": local_stop_mapping_at_tensors,
                 })
+            if hooks is not None:
+                hooks.on_reverse_node(
+                    nid, layer, time.time()-start, count_new_ops(n_ops))
             reversed_Xs = iutils.to_list(reversed_Xs)
             add_reversed_tensors(nid, Xs, reversed_Xs)
 
     # Return requested values #################################################
+    if target_tensors is None:
+        target_tensors = model.inputs
     reversed_input_tensors = [get_reversed_tensor(tmp)
-                              for tmp in model.inputs
+                              for tmp in target_tensors
                               if tmp not in stop_mapping_at_tensors]
     if return_all_reversed_tensors is True:
         return reversed_input_tensors, reversed_tensors
@@ -17,6 +17,7 @@ __all__ = [
     "project",
     "heatmap",
     "graymap",
+    "get_cmap_lut",
     "gamma",
     "clip_quantile",
 ]
@@ -105,6 +106,26 @@ def graymap(X, **kwargs):
     return heatmap(X, cmap_type="gray", **kwargs)
 
 
+def get_cmap_lut(cmap_type="seismic", alpha_cmap=False):
+    """Returns the colors of a color map as lookup table.
+
+    The lookup table maps the values 0 to 255, as computed by
+    :func:`heatmap`, onto uint8 colors. It can be used with
+    :class:`innvestigate.layers.ColormapLookup` to create heatmaps
+    inside a Keras graph.
+
+    :param cmap_type: The color map to use. Default 'seismic'.
+    :param alpha_cmap: Should the alpha component of the cmap be included.
+    :return: An uint8 array with shape (256, 3) or (256, 4).
+    """
+    cmap = plt.cm.get_cmap(cmap_type)
+
+    lut = cmap(np.arange(256))
+    if not alpha_cmap:
+        lut = lut[:, :3]
+    return np.round(lut*255).astype(np.uint8)
+
+
 def gamma(X, gamma=0.5, minamp=0, maxamp=None):
     """
     Apply gamma correction to an input array X
@@ -5,6 +5,7 @@ import setuptools
 
 install_requirements = [
     "future",
+    "futures; python_version < '3'",
     "h5py",
     # This package relies on internal interfaces and conventions of Keras.
     # To ensure best compatibility we only support one(, the newest) version.